@@ -0,0 +1,106 @@
+"""
+Analysis Pool - Pool de procesos para análisis y transcodificación fuera del event loop
+"""
+
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+# Tamaño del pool y timeout por llamada (configurables por entorno)
+ANALYSIS_POOL_SIZE = int(os.getenv("ANALYSIS_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2))))
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "300"))
+ANALYSIS_WARMUP = os.getenv("ANALYSIS_WARMUP", "true").lower() == "true"
+
+
+class AnalysisTimeoutError(Exception):
+    """Una llamada al pool superó su timeout"""
+
+
+class AnalysisPool:
+    """Ejecuta funciones CPU-bound (librosa, pydub...) en procesos separados.
+
+    Se usa el contexto ``spawn`` para no heredar hilos de torch/demucs del
+    proceso principal. Si una llamada supera su timeout se reinicia el pool,
+    porque un proceso ocupado no se puede interrumpir de otra forma.
+    """
+
+    def __init__(self, size: int = ANALYSIS_POOL_SIZE, timeout: float = ANALYSIS_TIMEOUT):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active = 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.size,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    @property
+    def has_free_worker(self) -> bool:
+        """Hay al menos un proceso sin llamada en curso"""
+        return self._active < self.size
+
+    def _recycle(self):
+        """Mata los procesos del pool actual y crea uno nuevo en la próxima llamada"""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("[POOL] Analysis pool recycled")
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """Ejecuta ``func(*args)`` en el pool y espera el resultado.
+
+        Cancelar la corrutina cancela la llamada si aún no empezó; si expira el
+        timeout se lanza AnalysisTimeoutError y se reinicia el pool.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        self._active += 1
+        try:
+            for attempt in range(2):
+                future = loop.run_in_executor(self._ensure_executor(), func, *args)
+                try:
+                    return await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    self._recycle()
+                    raise AnalysisTimeoutError(f"{func.__name__} exceeded {timeout:.0f}s")
+                except BrokenProcessPool:
+                    # Un proceso murió (OOM o reciclado por otra llamada): reintentar una vez
+                    self._executor = None
+                    if attempt == 1:
+                        raise
+        finally:
+            self._active -= 1
+
+    async def warmup(self):
+        """Arranca todos los procesos e importa/compila librosa en cada uno"""
+        from audio_analysis import warmup
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(self.run(warmup, timeout=120) for _ in range(self.size)))
+            print(f"[POOL] {self.size} analysis worker(s) warmed up in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"[POOL] Warmup failed: {e}")
+
+    def shutdown(self, kill: bool = False):
+        """Cierra el pool; ``kill`` además mata las llamadas en curso"""
+        if kill:
+            self._recycle()
+        elif self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Global instance
+analysis_pool = AnalysisPool()
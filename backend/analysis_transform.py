@@ -0,0 +1,109 @@
+"""
+Analysis Transform - Análisis de una rendition derivado del análisis del original (sin volver a analizar)
+"""
+
+import re
+from typing import Dict, List, Optional
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Bemoles que pueda mandar el frontend -> índice (la salida siempre usa sostenidos, como ChordAnalyzer)
+FLAT_NAMES = {'Db': 1, 'Eb': 3, 'Fb': 4, 'Gb': 6, 'Ab': 8, 'Bb': 10, 'Cb': 11}
+# Notas "raras" de las escalas de analyze_harmony (E#, B#...)
+SHARP_ALIASES = {'E#': 5, 'B#': 0}
+
+CHORD_PATTERN = re.compile(r"^([A-G](?:#|b)?)(.*?)(?:/([A-G](?:#|b)?))?$")
+
+# Campos del análisis de una tarea (los de result_cache.CACHED_FIELDS sin los stems)
+ANALYSIS_FIELDS = ["bpm", "key", "timeSignature", "duration", "tempoCurve", "chords", "keyInfo"]
+
+
+def note_index(note: str) -> Optional[int]:
+    if note in NOTE_NAMES:
+        return NOTE_NAMES.index(note)
+    return FLAT_NAMES.get(note, SHARP_ALIASES.get(note))
+
+
+def transpose_note(note: str, semitones: int) -> str:
+    """``transpose_note("A", 2) == "B"``; lo que no es una nota se devuelve igual"""
+    index = note_index(note)
+    if index is None:
+        return note
+    return NOTE_NAMES[(index + semitones) % 12]
+
+
+def transpose_chord(chord: str, semitones: int) -> str:
+    """Transpone la raíz (y el bajo de un acorde con barra): ``"F#m7" +2 -> "G#m7"``"""
+    match = CHORD_PATTERN.match(chord or "")
+    if not match or note_index(match.group(1)) is None:
+        # "N", "Unknown"...
+        return chord
+    root, quality, bass = match.groups()
+    transposed = transpose_note(root, semitones) + quality
+    if bass:
+        transposed += "/" + transpose_note(bass, semitones)
+    return transposed
+
+
+def _scale_time(value, rate: float):
+    return round(float(value) / rate, 3) if value is not None else value
+
+
+def _transpose_key_info(key_info: Dict, semitones: int) -> Dict:
+    key_info = dict(key_info)
+    for field in ("key", "tonic"):
+        if key_info.get(field):
+            key_info[field] = transpose_note(key_info[field], semitones)
+    return key_info
+
+
+def transform_chords(chords: List[Dict], semitones: int, rate: float) -> List[Dict]:
+    result = []
+    for chord in chords or []:
+        chord = dict(chord)
+        if semitones:
+            chord["chord"] = transpose_chord(chord.get("chord"), semitones)
+            if chord.get("root_note"):
+                chord["root_note"] = transpose_note(chord["root_note"], semitones)
+        if rate != 1.0:
+            chord["start_time"] = _scale_time(chord.get("start_time"), rate)
+            chord["end_time"] = _scale_time(chord.get("end_time"), rate)
+        result.append(chord)
+    return result
+
+
+def transform_analysis(analysis: Dict, semitones: float = 0.0, rate: float = 1.0) -> Dict:
+    """Análisis de la rendition ``(semitones, rate)`` a partir del del original.
+
+    Acordes y tonalidad se transponen (al semitono más cercano); tiempos de los
+    acordes, curva de tempo, duración y BPM se escalan por la velocidad
+    (``rate=0.8`` -> todo dura 1/0.8 y el BPM baja al 80%). Las confianzas se
+    conservan: son las del análisis original.
+    """
+    steps = int(round(semitones))
+    result = {field: analysis.get(field) for field in ANALYSIS_FIELDS}
+
+    if steps:
+        # key es un string en /separate y un dict (como keyInfo) en /api/analyze-chords
+        if isinstance(result["key"], dict):
+            result["key"] = _transpose_key_info(result["key"], steps)
+        elif result["key"]:
+            result["key"] = transpose_chord(result["key"], steps)
+        if result["keyInfo"]:
+            result["keyInfo"] = _transpose_key_info(result["keyInfo"], steps)
+    result["chords"] = transform_chords(result["chords"], steps, rate) if result["chords"] else result["chords"]
+
+    if rate != 1.0:
+        if result["bpm"]:
+            result["bpm"] = round(float(result["bpm"]) * rate, 2)
+        if result["duration"]:
+            result["duration"] = round(float(result["duration"]) / rate, 2)
+        if result["tempoCurve"]:
+            result["tempoCurve"] = [
+                {"time": _scale_time(point["time"], rate), "bpm": round(float(point["bpm"]) * rate, 2)}
+                for point in result["tempoCurve"]
+            ]
+
+    result["semitones"] = steps
+    result["rate"] = rate
+    result["derived"] = True
+    return result
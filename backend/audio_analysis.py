@@ -0,0 +1,398 @@
+"""
+Audio Analysis - Funciones de análisis CPU-bound que se ejecutan en el pool de procesos
+"""
+
+import numpy as np
+import librosa
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from audio_buffer import AudioBuffer, AudioSource, as_audio_buffer, load_mono
+from chord_analyzer import ChordAnalyzer
+
+
+def detect_offset(audio: AudioSource) -> float:
+    """Detecta el downbeat real (primer beat fuerte del compás) en segundos."""
+    y, sr = load_mono(audio, sr=None)
+    
+    # 1. Detectar tempo y beats
+    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, units="frames")
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+    
+    # 2. Detectar onsets (ataques)
+    onset_strength = librosa.onset.onset_strength(y=y, sr=sr)
+    onset_frames = librosa.onset.onset_detect(
+        onset_envelope=onset_strength, sr=sr, units="frames",
+        pre_max=3, post_max=3, pre_avg=3, post_avg=5, 
+        delta=0.5, wait=20
+    )
+    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+    
+    if len(beat_times) == 0 or len(onset_times) == 0:
+        return 0.1  # Fallback
+    
+    # 3. Buscar el primer onset que coincida con un beat (downbeat real)
+    tolerance = 0.15  # 150ms de tolerancia
+    
+    for beat_time in beat_times:
+        # Buscar onsets cerca de este beat
+        for onset_time in onset_times:
+            if abs(onset_time - beat_time) <= tolerance:
+                # Encontramos un onset que coincide con un beat
+                return round(float(max(0.1, onset_time)), 3)
+    
+    # 4. Si no hay coincidencia exacta, buscar el primer beat fuerte
+    # Analizar energía alrededor de cada beat
+    energy = np.abs(y)
+    beat_energies = []
+    
+    for beat_time in beat_times[:5]:  # Solo los primeros 5 beats
+        start_frame = int((beat_time - 0.1) * sr)
+        end_frame = int((beat_time + 0.1) * sr)
+        start_frame = max(0, start_frame)
+        end_frame = min(len(energy), end_frame)
+        
+        if end_frame > start_frame:
+            beat_energy = np.mean(energy[start_frame:end_frame])
+            beat_energies.append((beat_time, beat_energy))
+    
+    if beat_energies:
+        # Tomar el beat con mayor energía (más probable que sea el downbeat)
+        strongest_beat = max(beat_energies, key=lambda x: x[1])
+        return round(float(max(0.1, strongest_beat[0])), 3)
+    
+    # 5. Fallback: usar el primer beat detectado
+    return round(float(max(0.1, beat_times[0])), 3)
+
+# Samplerate y hop de análisis del motor de tempo (una sola STFT por canción)
+TEMPO_ANALYSIS_SR = 22050
+TEMPO_HOP_LENGTH = 512
+
+
+@dataclass
+class TempoEstimate:
+    bpm: int
+    duration: float
+    beat_times: np.ndarray
+    tempo_curve: List[Dict[str, float]]
+    hypotheses: List[float]
+
+
+def _as_float(tempo) -> float:
+    return float(np.atleast_1d(tempo)[0])
+
+def _tempogram_peak(onset_env: np.ndarray, sr: int, hop_length: int) -> float:
+    """Pico más fuerte del tempograma medio dentro del rango musical"""
+    tempogram = librosa.feature.tempogram(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    strength = np.mean(tempogram, axis=1)
+    bpms = librosa.tempo_frequencies(tempogram.shape[0], sr=sr, hop_length=hop_length)
+    valid = (bpms >= 40) & (bpms <= 250)
+    if not np.any(valid):
+        return 0.0
+    return float(bpms[valid][np.argmax(strength[valid])])
+
+def _tempo_curve(beat_times: np.ndarray, target_bpm: float) -> List[Dict[str, float]]:
+    """Tempo por beat (suavizado con mediana de 5 beats) para canciones con deriva"""
+    if len(beat_times) < 3:
+        return []
+    local_bpm = 60.0 / np.maximum(np.diff(beat_times), 1e-3)
+    if len(local_bpm) >= 5:
+        padded = np.pad(local_bpm, 2, mode="edge")
+        windows = np.lib.stride_tricks.sliding_window_view(padded, 5)
+        local_bpm = np.median(windows, axis=1)
+    # Llevar la curva a la misma octava métrica que el BPM final (x2, /2...)
+    factor = 2.0 ** np.round(np.log2(target_bpm / np.median(local_bpm)))
+    local_bpm = local_bpm * factor
+    return [
+        {"time": round(float(t), 3), "bpm": round(float(b), 2)}
+        for t, b in zip(beat_times[1:], local_bpm)
+    ]
+
+def estimate_tempo(audio: AudioSource) -> TempoEstimate:
+    """Motor de tempo: una envolvente de onsets, varias hipótesis evaluadas sobre ella."""
+    y, sr = load_mono(audio, sr=TEMPO_ANALYSIS_SR)
+    hop = TEMPO_HOP_LENGTH
+    
+    # Una sola STFT/envolvente de onsets para todas las hipótesis
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop)
+    
+    # Hipótesis 1 y 2: distintos start_bpm y tightness
+    tempo1, beats1 = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop,
+                                             start_bpm=60, tightness=100)
+    tempo2, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop,
+                                        start_bpm=120, tightness=50)
+    
+    # Hipótesis 3: parámetros por defecto (antes se calculaba tres veces con el mismo resultado)
+    tempo3, beats3 = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop)
+    
+    # Hipótesis 4: resolución temporal doble (envolvente agregada de a pares de frames)
+    pairs = len(onset_env) // 2
+    coarse_env = onset_env[:pairs * 2].reshape(pairs, 2).max(axis=1)
+    tempo4, _ = librosa.beat.beat_track(onset_envelope=coarse_env, sr=sr, hop_length=hop * 2)
+    
+    # Hipótesis 5: pico del tempograma
+    tempo5 = _tempogram_peak(onset_env, sr, hop)
+    
+    # Mismos seis votos que el cálculo original: la hipótesis por defecto pesa tres
+    # veces (antes tempo3/tempo4/tempo6). El pico del tempograma solo se informa.
+    tempo1, tempo2, tempo3, tempo4 = (_as_float(t) for t in (tempo1, tempo2, tempo3, tempo4))
+    tempos = [tempo1, tempo2, tempo3, tempo3, tempo3, tempo4]
+    
+    # Filtrar valores extremos (menos de 40 o más de 250 BPM)
+    valid_tempos = [t for t in tempos if 40 <= t <= 250]
+    
+    if valid_tempos:
+        # Usar la mediana para evitar outliers
+        tempo = float(np.median(valid_tempos))
+        
+        # Verificar si el tempo es consistente con los beats detectados
+        if len(beats1) > 1:
+            beat_times = librosa.frames_to_time(beats1, sr=sr, hop_length=hop)
+            # Calcular BPM basado en intervalos entre beats
+            intervals = np.diff(beat_times)
+            median_interval = np.median(intervals)
+            calculated_bpm = 60.0 / median_interval
+            
+            # Si el BPM calculado es muy diferente, usar el calculado
+            if abs(calculated_bpm - tempo) > 20:
+                tempo = calculated_bpm
+    else:
+        # Fallback al primer método si todos son inválidos
+        tempo = tempo1
+    
+    # Normalización del BPM para rango musical estándar
+    if tempo < 70:
+        tempo = tempo * 2  # Subir al doble si está muy lento
+    elif tempo > 180:
+        tempo = tempo / 2  # Bajar a la mitad si está muy rápido
+    
+    # Asegurar que el tempo esté en un rango razonable
+    tempo = max(60, min(180, tempo))
+    
+    # Redondear al entero más cercano (120, 121, 122, etc.)
+    print(f"BPM antes del redondeo: {tempo}")
+    bpm = int(round(tempo))
+    print(f"BPM final que se devuelve: {bpm}")
+    
+    # Curva de tempo por beat a partir del seguimiento por defecto
+    beat_times = librosa.frames_to_time(beats3, sr=sr, hop_length=hop)
+    
+    duration = audio.duration if isinstance(audio, AudioBuffer) else len(y) / sr
+    return TempoEstimate(
+        bpm=bpm,
+        duration=round(float(duration), 2),
+        beat_times=beat_times,
+        tempo_curve=_tempo_curve(beat_times, tempo),
+        hypotheses=[round(t, 2) for t in tempos + [tempo5]]
+    )
+
+def detect_bpm_and_duration(audio: AudioSource):
+    """Detecta BPM promedio y duración del audio con algoritmo mejorado."""
+    estimate = estimate_tempo(audio)
+    return estimate.bpm, estimate.duration
+
+def analyze_tempo_metadata(audio: AudioSource):
+    """BPM, duración y curva de tempo con valores por defecto si el análisis falla"""
+    try:
+        estimate = estimate_tempo(audio)
+        bpm, duration, tempo_curve = estimate.bpm, estimate.duration, estimate.tempo_curve
+        print(f"[PROCESS] BPM detectado: {bpm}, Duración: {duration}s")
+    except Exception as e:
+        print(f"[PROCESS] Error detectando BPM: {e}")
+        bpm = 126
+        duration = 0
+        tempo_curve = []
+    return bpm, duration, tempo_curve
+
+def analyze_harmony(audio: AudioSource):
+    """Detecta acordes y tonalidad; devuelve (key, chords_data, keyInfo_data)"""
+    try:
+        analyzer = ChordAnalyzer()
+        
+        # Analizar acordes
+        print("[PROCESS] Analizando acordes...")
+        chords_list = analyzer.analyze_chords(audio)
+        
+        # Convertir acordes a dict
+        chords_data = chords_to_dicts(chords_list)
+        
+        # Detectar key basándose en la escala (más preciso)
+        if len(chords_list) > 0:
+            # Definir escalas diatónicas (7 acordes por tonalidad)
+            # Formato: tonalidad -> [I, ii, iii, IV, V, vi, vii°]
+            major_scales = {
+                'C': ['C', 'Dm', 'Em', 'F', 'G', 'Am', 'Bdim'],
+                'C#': ['C#', 'D#m', 'E#m', 'F#', 'G#', 'A#m', 'B#dim'],
+                'D': ['D', 'Em', 'F#m', 'G', 'A', 'Bm', 'C#dim'],
+                'D#': ['D#', 'Fm', 'Gm', 'G#', 'A#', 'Cm', 'Ddim'],
+                'E': ['E', 'F#m', 'G#m', 'A', 'B', 'C#m', 'D#dim'],
+                'F': ['F', 'Gm', 'Am', 'A#', 'C', 'Dm', 'Edim'],
+                'F#': ['F#', 'G#m', 'A#m', 'B', 'C#', 'D#m', 'E#dim'],
+                'G': ['G', 'Am', 'Bm', 'C', 'D', 'Em', 'F#dim'],
+                'G#': ['G#', 'A#m', 'Cm', 'C#', 'D#', 'Fm', 'Gdim'],
+                'A': ['A', 'Bm', 'C#m', 'D', 'E', 'F#m', 'G#dim'],
+                'A#': ['A#', 'Cm', 'Dm', 'D#', 'F', 'Gm', 'Adim'],
+                'B': ['B', 'C#m', 'D#m', 'E', 'F#', 'G#m', 'A#dim']
+            }
+            
+            # Extraer acordes únicos detectados
+            detected_chords = set(chord.chord for chord in chords_list)
+            
+            # Calcular coincidencias con cada escala
+            best_match_key = None
+            best_match_score = 0
+            
+            for scale_key, scale_chords in major_scales.items():
+                # Contar cuántos acordes detectados están en esta escala
+                matches = sum(1 for chord in detected_chords if chord in scale_chords)
+                score = matches / len(detected_chords) if detected_chords else 0
+                
+                if score > best_match_score:
+                    best_match_score = score
+                    best_match_key = scale_key
+            
+            key = best_match_key if best_match_key else "C"
+            keyInfo_data = {
+                "key": key,
+                "mode": "major",
+                "confidence": best_match_score,
+                "tonic": key
+            }
+            print(f"[PROCESS] Key detectada por escala: {key} major (coincidencia: {best_match_score:.2f})")
+        else:
+            # Fallback: usar análisis espectral
+            key_result = analyzer.analyze_key(audio)
+            key = key_result.key if key_result else "E"
+            keyInfo_data = {
+                "key": key_result.key if key_result else "Unknown",
+                "mode": key_result.mode if key_result else "major",
+                "confidence": float(key_result.confidence) if key_result else 0.0,
+                "tonic": key_result.tonic if key_result else "Unknown"
+            } if key_result else None
+        
+        print(f"[PROCESS] Acordes detectados: {len(chords_data)}, Key: {key}")
+    except Exception as e:
+        print(f"[PROCESS] Error detectando acordes/key: {e}")
+        import traceback
+        traceback.print_exc()
+        key = "E"
+        chords_data = []
+        keyInfo_data = None
+    return key, chords_data, keyInfo_data
+
+
+def chords_to_dicts(chords_list) -> List[Dict]:
+    """Convierte ChordResult a diccionarios serializables"""
+    return [
+        {
+            "chord": chord.chord,
+            "confidence": float(chord.confidence),
+            "start_time": float(chord.start_time),
+            "end_time": float(chord.end_time),
+            "root_note": chord.root_note,
+            "chord_type": chord.chord_type
+        }
+        for chord in chords_list
+    ]
+
+def key_to_dict(key_info) -> Optional[Dict]:
+    return {
+        "key": key_info.key if key_info else "Unknown",
+        "mode": key_info.mode if key_info else "Unknown",
+        "confidence": float(key_info.confidence) if key_info else 0.0,
+        "tonic": key_info.tonic if key_info else "Unknown"
+    } if key_info else None
+
+def analyze_chords_and_key(source: AudioSource) -> Tuple[List[Dict], Optional[Dict]]:
+    """Acordes y tonalidad sobre una única decodificación"""
+    audio = as_audio_buffer(source)
+    analyzer = ChordAnalyzer()
+    
+    print("Analyzing chords...")
+    chords = analyzer.analyze_chords(audio)
+    print(f"Found {len(chords)} chords")
+    
+    print("Analyzing key...")
+    key_info = analyzer.analyze_key(audio)
+    print(f"Key analysis result: {key_info}")
+    
+    return chords_to_dicts(chords), key_to_dict(key_info)
+
+def analyze_key_file(source: AudioSource) -> Optional[Dict]:
+    """Solo tonalidad (endpoint /api/analyze-key)"""
+    return key_to_dict(ChordAnalyzer().analyze_key(source))
+
+def analyze_offset_and_bpm(source: AudioSource) -> Tuple[float, int, float]:
+    """Offset del downbeat, BPM y duración sobre una única decodificación"""
+    audio = source if isinstance(source, AudioBuffer) else AudioBuffer.load(str(source))
+    offset = detect_offset(audio)
+    bpm, duration = detect_bpm_and_duration(audio)
+    return offset, bpm, duration
+
+def analyze_bpm_file(file_path: str) -> Dict:
+    """BPM, offset del primer beat y compás (endpoint /api/analyze-bpm)"""
+    # Cargar audio con librosa
+    y, sr = librosa.load(str(file_path))
+    
+    # Detectar tempo y beats
+    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, units='time')
+    
+    # Calcular offset del primer beat
+    first_beat_time = 0.0
+    if len(beat_frames) > 0:
+        first_beat_time = beat_frames[0]
+    
+    # Detectar onset del primer ataque fuerte
+    onsets = librosa.onset.onset_detect(y=y, sr=sr, units='time')
+    first_onset = onsets[0] if len(onsets) > 0 else 0.0
+    
+    # Usar el menor entre primer beat y primer onset
+    offset = min(first_beat_time, first_onset) if first_onset > 0 else first_beat_time
+    
+    # Duración del audio
+    duration = len(y) / sr
+    
+    # Detectar compás (time signature)
+    # Análisis básico de patrones de acentuación
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+    if len(beat_times) >= 4:
+        # Analizar patrones de acentuación en los primeros beats
+        energy_per_beat = []
+        for i in range(min(8, len(beat_times) - 1)):
+            start_frame = int(beat_times[i] * sr)
+            end_frame = int(beat_times[i + 1] * sr)
+            beat_energy = np.mean(np.abs(y[start_frame:end_frame]))
+            energy_per_beat.append(beat_energy)
+        
+        # Detectar patrón de acentuación (4/4, 3/4, etc.)
+        if len(energy_per_beat) >= 4:
+            # Buscar patrones de acentuación cada 4 beats
+            accent_pattern = 4  # Default
+            if len(energy_per_beat) >= 8:
+                # Analizar si hay acentuación cada 3 beats (3/4)
+                three_beat_energy = np.mean([energy_per_beat[i] for i in range(0, len(energy_per_beat), 3)])
+                four_beat_energy = np.mean([energy_per_beat[i] for i in range(0, len(energy_per_beat), 4)])
+                
+                if three_beat_energy > four_beat_energy * 1.2:
+                    accent_pattern = 3
+    else:
+        accent_pattern = 4
+    
+    return {
+        "bpm": float(tempo),
+        "offset": float(offset),
+        "duration": float(duration),
+        "time_signature": f"{accent_pattern}/4",
+        "beat_times": beat_times.tolist()[:20],  # Primeros 20 beats
+        "onsets": onsets.tolist()[:10]  # Primeros 10 onsets
+    }
+
+def warmup() -> bool:
+    """Importa librosa y compila con numba las rutas calientes en este proceso"""
+    sr = 22050
+    y = np.random.default_rng(0).uniform(-0.1, 0.1, sr * 3).astype(np.float32)
+    librosa.beat.beat_track(y=y, sr=sr)
+    librosa.onset.onset_detect(y=y, sr=sr)
+    librosa.feature.chroma_stft(y=y, sr=sr, hop_length=1024)
+    librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=512)
+    return True
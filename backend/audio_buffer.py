@@ -0,0 +1,123 @@
+"""
+Audio Buffer - Decodifica una vez y comparte el PCM entre todos los análisis de una tarea
+"""
+
+import hashlib
+from typing import Dict, Optional, Tuple, Union
+
+import librosa
+import numpy as np
+
+
+class AudioBuffer:
+    """PCM float32 decodificado una sola vez, con vistas remuestreadas en caché.
+
+    ``samples`` tiene forma (canales, muestras). Las vistas mono/estéreo a otros
+    samplerates se calculan la primera vez que se piden y se reutilizan. Un
+    buffer creado con ``open`` no decodifica hasta que se piden las muestras.
+    """
+
+    def __init__(self, samples: Optional[np.ndarray], sr: Optional[int], source_path: Optional[str] = None,
+                 content_hash: Optional[str] = None):
+        self.source_path = source_path
+        self._content_hash = content_hash
+        self._samples: Optional[np.ndarray] = None
+        self._sr: Optional[int] = None
+        self._mono: Dict[int, np.ndarray] = {}
+        self._multi: Dict[int, np.ndarray] = {}
+        if samples is not None:
+            self._set_samples(samples, sr)
+
+    def _set_samples(self, samples: np.ndarray, sr: int):
+        if samples.ndim == 1:
+            samples = samples[np.newaxis, :]
+        self._samples = samples.astype(np.float32, copy=False)
+        self._sr = int(sr)
+        self._multi[self._sr] = self._samples
+
+    @classmethod
+    def load(cls, path: str, content_hash: Optional[str] = None) -> "AudioBuffer":
+        """Decodifica el archivo completo a su samplerate nativo"""
+        y, sr = librosa.load(path, sr=None, mono=False, dtype=np.float32)
+        print(f"[AUDIO BUFFER] Decoded {path}: {y.shape}, {sr} Hz")
+        return cls(y, sr, source_path=str(path), content_hash=content_hash)
+
+    @classmethod
+    def open(cls, path: str, content_hash: Optional[str] = None) -> "AudioBuffer":
+        """Buffer sin decodificar: el archivo se lee la primera vez que hace falta"""
+        return cls(None, None, source_path=str(path), content_hash=content_hash)
+
+    def _ensure_decoded(self):
+        if self._samples is None:
+            y, sr = librosa.load(self.source_path, sr=None, mono=False, dtype=np.float32)
+            print(f"[AUDIO BUFFER] Decoded {self.source_path}: {y.shape}, {sr} Hz")
+            self._set_samples(y, sr)
+
+    @property
+    def samples(self) -> np.ndarray:
+        self._ensure_decoded()
+        return self._samples
+
+    @property
+    def sr(self) -> int:
+        self._ensure_decoded()
+        return self._sr
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[1] / self.sr
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        """SHA-256 del archivo original (calculado bajo demanda si no se conoce)"""
+        if self._content_hash is None and self.source_path:
+            hasher = hashlib.sha256()
+            with open(self.source_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            self._content_hash = hasher.hexdigest()
+        return self._content_hash
+
+    def multichannel(self, sr: Optional[int] = None) -> np.ndarray:
+        """Audio (canales, muestras) al samplerate pedido"""
+        sr = int(sr or self.sr)
+        if sr not in self._multi:
+            self._multi[sr] = librosa.resample(self.samples, orig_sr=self.sr, target_sr=sr)
+        return self._multi[sr]
+
+    def mono(self, sr: Optional[int] = None) -> np.ndarray:
+        """Audio mono al samplerate pedido (None = nativo)"""
+        sr = int(sr or self.sr)
+        if sr not in self._mono:
+            if self.sr not in self._mono:
+                self._mono[self.sr] = librosa.to_mono(self.samples)
+            if sr != self.sr:
+                self._mono[sr] = librosa.resample(self._mono[self.sr], orig_sr=self.sr, target_sr=sr)
+        return self._mono[sr]
+
+    def view(self, sr: Optional[int] = None) -> "AudioBuffer":
+        """Buffer mono ligero a un solo samplerate (para enviarlo a otro proceso)"""
+        sr = int(sr or self.sr)
+        return AudioBuffer(self.mono(sr), sr, source_path=self.source_path, content_hash=self._content_hash)
+
+
+AudioSource = Union[str, AudioBuffer]
+
+
+def as_audio_buffer(source: AudioSource) -> AudioBuffer:
+    """Acepta una ruta o un buffer ya decodificado (las rutas se decodifican bajo demanda)"""
+    if isinstance(source, AudioBuffer):
+        return source
+    return AudioBuffer.open(str(source))
+
+
+def load_mono(source: AudioSource, sr: Optional[int] = 22050) -> Tuple[np.ndarray, int]:
+    """Equivalente a ``librosa.load(path, sr=sr, mono=True)`` para rutas o buffers"""
+    if isinstance(source, AudioBuffer):
+        target = int(sr or source.sr)
+        return source.mono(target), target
+    return librosa.load(str(source), sr=sr, mono=True)
@@ -0,0 +1,140 @@
+"""
+Audio Index - Resuelve URLs /audio/... a archivos locales sin recorrer todo uploads/
+"""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlsplit
+
+UPLOADS_DIR = Path("uploads")
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+
+# Prefijos de URL que apuntan a este mismo backend
+LOCAL_AUDIO_PREFIXES = [
+    "http://localhost:8000/audio/",
+    "http://127.0.0.1:8000/audio/",
+]
+_backend_url = os.getenv("BACKEND_URL", os.getenv("NEXT_PUBLIC_BACKEND_URL", ""))
+if _backend_url:
+    LOCAL_AUDIO_PREFIXES.append(f"{_backend_url.rstrip('/')}/audio/")
+
+
+def _is_inside(path: Path, root: Path) -> bool:
+    try:
+        path.resolve().relative_to(root.resolve())
+    except ValueError:
+        return False
+    return True
+
+
+def candidate_paths(path: str) -> List[Path]:
+    """Rutas locales posibles para ``/audio/{path}`` (mismo orden que siempre usó /audio).
+
+    Solo se devuelven rutas que, ya resueltas (``..``, symlinks, rutas absolutas),
+    quedan dentro de ``uploads/``: /audio y /peaks no leen ningún otro archivo local.
+    """
+    candidates = [
+        (UPLOADS_DIR / path, UPLOADS_DIR),  # Archivos originales y stems
+        (Path("..") / UPLOADS_DIR / path, Path("..") / UPLOADS_DIR),
+        (Path(path), UPLOADS_DIR)  # Ruta directa "uploads/..."
+    ]
+    return [candidate for candidate, root in candidates if _is_inside(candidate, root)]
+
+
+class AudioPathIndex:
+    """Índice ``{task_id}/{archivo}`` -> ruta dentro de ``uploads/{task_id}``.
+
+    Las URLs que no coinciden con la ruta en disco (p. ej. ``/audio/{task}/vocals.wav``
+    para un stem que vive en ``demucs_output/...``) se resuelven con una búsqueda
+    en el diccionario. Ante un fallo solo se recorre ``uploads/{task_id}`` (archivos
+    creados por otro worker), nunca todo ``uploads/``, así que el costo no crece con
+    el número de canciones procesadas. Las entradas de workspaces borrados se
+    descartan al resolverlas.
+    """
+
+    def __init__(self, root: Path = UPLOADS_DIR):
+        self.root = Path(root)
+        # task_id -> {nombre de archivo -> ruta}
+        self._index: Dict[str, Dict[str, Path]] = {}
+
+    def register(self, path) -> None:
+        """Añadir un archivo recién escrito en ``uploads/{task_id}/...``"""
+        path = Path(path)
+        try:
+            task_id = path.resolve().relative_to(self.root.resolve()).parts[0]
+        except (ValueError, IndexError):
+            return
+        # El primero registrado gana (p. ej. el stem de Demucs frente a copias posteriores)
+        self._index.setdefault(task_id, {}).setdefault(path.name, path)
+
+    def _scan(self, task_id: str) -> Dict[str, Path]:
+        entries: Dict[str, Path] = {}
+        workspace = self.root / task_id
+        if workspace.is_dir():
+            for dirpath, _, files in os.walk(workspace):
+                for name in files:
+                    if name.endswith(AUDIO_EXTENSIONS):
+                        entries.setdefault(name, Path(dirpath) / name)
+        if entries:
+            self._index[task_id] = entries
+        else:
+            self._index.pop(task_id, None)
+        return entries
+
+    def resolve(self, path: str) -> Optional[Path]:
+        """Archivo local para ``/audio/{path}``, o None si no existe aquí"""
+        path = path.lstrip("/")
+        for candidate in candidate_paths(path):
+            if candidate.is_file():
+                return candidate
+
+        parts = Path(path).parts
+        if parts and parts[0] == self.root.name:
+            parts = parts[1:]
+        if len(parts) < 2 or parts[0] in (".", ".."):
+            return None
+        task_id, name = parts[0], parts[-1]
+
+        found = self._index.get(task_id, {}).get(name)
+        if found is None or not found.is_file():
+            # No indexado o borrado (janitor): volver a indexar solo ese workspace
+            found = self._scan(task_id).get(name)
+        return found if found is not None and _is_inside(found, self.root) else None
+
+    def forget(self, task_id: str) -> None:
+        self._index.pop(task_id, None)
+
+    def task_id_for_path(self, path: str) -> Optional[str]:
+        """Tarea a la que pertenece ``/audio/{path}`` (``{task_id}/...`` o ``uploads/{task_id}/...``)"""
+        parts = Path(path.lstrip("/")).parts
+        if parts and parts[0] == self.root.name:
+            parts = parts[1:]
+        return parts[0] if len(parts) >= 2 and parts[0] not in (".", "..") else None
+
+    def task_id_for_url(self, url: str) -> Optional[str]:
+        """Tarea a la que pertenece ``url`` si apunta a /audio/{task_id}/... de este backend"""
+        for prefix in LOCAL_AUDIO_PREFIXES:
+            if url.startswith(prefix):
+                return self.task_id_for_path(unquote(urlsplit(url[len(prefix):]).path))
+        return None
+
+    def local_path_for_url(self, url: str) -> Optional[Path]:
+        """Archivo local si ``url`` apunta a /audio de este backend"""
+        for prefix in LOCAL_AUDIO_PREFIXES:
+            if url.startswith(prefix):
+                return self.resolve(unquote(urlsplit(url[len(prefix):]).path))
+        return None
+
+
+def link_or_copy(source: Path, dest: Path) -> None:
+    """Hard link (sin copiar bytes); copia si el enlace no es posible (otro disco, FS sin soporte)"""
+    dest.unlink(missing_ok=True)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+# Global instance
+audio_index = AudioPathIndex()
@@ -3,21 +3,63 @@ Audio Processor REAL - Demucs + Procesamiento adicional para 10+ tracks
 """
 
 import os
+import time
 import asyncio
-import subprocess
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 import shutil
 import librosa
 import soundfile as sf
 import numpy as np
 
+from demucs_engine import demucs_engine
+from audio_buffer import AudioBuffer
+
 class AudioProcessor:
     def __init__(self):
         self.models_loaded = False
         
-    async def separate_with_demucs(self, file_path: str, task_callback=None, requested_tracks=None) -> Dict[str, str]:
-        """Separate audio using Demucs (IA REAL)"""
+    async def _run_demucs_cli(self, file_path: str, output_dir: Path, timings: Optional[Dict[str, float]] = None):
+        """Fallback: run Demucs as a subprocess when the Python API is not available"""
+        # Run Demucs command - using the htdemucs model for best quality
+        cmd = [
+            "python", "-m", "demucs",
+            "--name", demucs_engine.model_name,  # Best quality model
+            "--out", str(output_dir),
+            file_path
+        ]
+        
+        print(f"Running Demucs command: {' '.join(cmd)}")
+        start = time.perf_counter()
+        
+        # Execute in subprocess
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        stdout, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            print(f"Demucs error: {stderr.decode()}")
+            raise Exception(f"Demucs error: {stderr.decode()}")
+        
+        print(f"Demucs output: {stdout.decode()}")
+        if timings is not None:
+            timings["subprocess"] = time.perf_counter() - start
+    
+    async def separate_with_demucs(self, file_path: str, task_callback=None, requested_tracks=None,
+                                   timings: Optional[Dict[str, float]] = None,
+                                   audio: Optional[AudioBuffer] = None,
+                                   on_stem: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        """Separate audio using Demucs (IA REAL)
+        
+        If ``timings`` is given it is filled with the per-phase durations reported
+        by the separation engine. If ``audio`` is given the engine reuses that
+        decoded buffer instead of decoding the file again. ``on_stem(name, path)``
+        is called as soon as each requested stem is available on disk.
+        """
         try:
             # Create output directory
             output_dir = Path(file_path).parent / "demucs_output"
@@ -27,34 +69,18 @@ class AudioProcessor:
             if task_callback:
                 task_callback(20, "Starting Demucs AI separation...")
             
-            # Run Demucs command - using the htdemucs model for best quality
-            cmd = [
-                "python", "-m", "demucs",
-                "--name", "htdemucs",  # Best quality model
-                "--out", str(output_dir),
-                file_path
-            ]
-            
-            print(f"Running Demucs command: {' '.join(cmd)}")
-            
             # Update progress: Processing with Demucs
             if task_callback:
                 task_callback(40, "Processing with Demucs AI...")
             
-            # Execute in subprocess
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                print(f"Demucs error: {stderr.decode()}")
-                raise Exception(f"Demucs error: {stderr.decode()}")
-            
-            print(f"Demucs output: {stdout.decode()}")
+            if demucs_engine.available:
+                # Modelo persistente: sin arrancar intérprete ni recargar pesos
+                result = await demucs_engine.separate(file_path, output_dir, audio)
+                if timings is not None:
+                    timings.update(result.timings)
+                print("Demucs engine timings: " + ", ".join(f"{k}={v:.2f}s" for k, v in result.timings.items()))
+            else:
+                await self._run_demucs_cli(file_path, output_dir, timings)
             
             # Update progress: Demucs completed
             if task_callback:
@@ -62,10 +88,16 @@ class AudioProcessor:
             
             # Find the separated files
             stems = {}
+            
+            def add_stem(name: str, path: Path):
+                stems[name] = str(path)
+                if on_stem:
+                    on_stem(name, str(path))
+            
             file_name = Path(file_path).stem
             
             # Demucs creates a folder with the model name
-            model_dir = output_dir / "htdemucs" / file_name
+            model_dir = output_dir / demucs_engine.model_name / file_name
             
             if model_dir.exists():
                 # Map Demucs output to our expected format
@@ -86,7 +118,7 @@ class AudioProcessor:
                         # Vocals
                         vocals_path = model_dir / "vocals.wav"
                         if vocals_path.exists():
-                            stems["vocals"] = str(vocals_path)
+                            add_stem("vocals", vocals_path)
                             print(f"Γ£à Found vocals: {vocals_path}")
                         
                         # Instrumental = drums + bass + other
@@ -97,25 +129,10 @@ class AudioProcessor:
                                 instrumental_tracks.append(track_path)
                         
                         if instrumental_tracks:
-                            # Combinar los tracks instrumentales
-                            combined_audio = None
-                            sr = None
-                            
-                            for track_path in instrumental_tracks:
-                                audio, sample_rate = librosa.load(str(track_path), sr=None)
-                                sr = sample_rate
-                                
-                                if combined_audio is None:
-                                    combined_audio = audio
-                                else:
-                                    # Asegurar que tengan la misma longitud
-                                    min_length = min(len(combined_audio), len(audio))
-                                    combined_audio = combined_audio[:min_length] + audio[:min_length]
-                            
-                            # Guardar track instrumental combinado
+                            # Combinar los tracks instrumentales (fuera del event loop)
                             instrumental_path = model_dir.parent / "instrumental.wav"
-                            sf.write(str(instrumental_path), combined_audio, sr)
-                            stems["instrumental"] = str(instrumental_path)
+                            await asyncio.to_thread(self._mix_tracks, instrumental_tracks, instrumental_path)
+                            add_stem("instrumental", instrumental_path)
                             print(f"Γ£à Created instrumental: {instrumental_path}")
                     
                     else:
@@ -125,7 +142,7 @@ class AudioProcessor:
                             if stem_name in requested_tracks:
                                 stem_path = model_dir / stem_file
                                 if stem_path.exists():
-                                    stems[stem_name] = str(stem_path)
+                                    add_stem(stem_name, stem_path)
                                     print(f"Γ£à Found {stem_name}: {stem_path}")
                                 else:
                                     print(f"ΓÜá∩╕Å Track {stem_name} no encontrado en: {stem_path}")
@@ -137,7 +154,7 @@ class AudioProcessor:
                     for stem_file, stem_name in stem_mapping.items():
                         stem_path = model_dir / stem_file
                         if stem_path.exists():
-                            stems[stem_name] = str(stem_path)
+                            add_stem(stem_name, stem_path)
                             print(f"Found {stem_name}: {stem_path}")
             
             # Update progress: Files found
@@ -150,6 +167,25 @@ class AudioProcessor:
             print(f"Error in Demucs separation: {e}")
             raise
     
+    def _mix_tracks(self, track_paths, output_path: Path):
+        """Suma varios stems en un solo WAV (p. ej. drums + bass + other)"""
+        combined_audio = None
+        sr = None
+        
+        for track_path in track_paths:
+            audio, sample_rate = librosa.load(str(track_path), sr=None)
+            sr = sample_rate
+            
+            if combined_audio is None:
+                combined_audio = audio
+            else:
+                # Asegurar que tengan la misma longitud
+                min_length = min(len(combined_audio), len(audio))
+                combined_audio = combined_audio[:min_length] + audio[:min_length]
+        
+        # Guardar track instrumental combinado
+        sf.write(str(output_path), combined_audio, sr)
+    
     async def separate_with_spleeter(self, file_path: str, model_type: str, hi_fi: bool = False) -> Dict[str, str]:
         """Fallback to Demucs if Spleeter is requested"""
         print(f"Spleeter requested but using Demucs instead (IA REAL)")
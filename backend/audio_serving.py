@@ -0,0 +1,150 @@
+"""
+Audio Serving - Respuestas de audio en streaming con soporte de Range (206 Partial Content)
+"""
+
+import os
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from b2_cache import B2DiskCache
+from http_client import http_client
+
+# Tamaño de los bloques que se leen de disco / se reenvían desde B2
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Cabeceras comunes de /audio (el mixer hace peticiones cross-origin con Range)
+AUDIO_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Headers": "Range",
+    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+    "Cache-Control": "public, max-age=3600",
+    "Accept-Ranges": "bytes",
+}
+
+
+def audio_media_type(path: str) -> str:
+    if path.endswith('.mp3'):
+        return "audio/mpeg"
+    elif path.endswith('.wav'):
+        return "audio/wav"
+    elif path.endswith('.m4a'):
+        return "audio/mp4"
+    elif path.endswith('.ogg'):
+        return "audio/ogg"
+    return "audio/wav"  # Default
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Devuelve (inicio, fin) inclusivos para ``bytes=a-b``, ``bytes=a-`` o ``bytes=-n``.
+
+    None si no hay cabecera (o pide varios rangos: se sirve el archivo entero);
+    416 si el rango no es satisfacible.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Sufijo: los últimos n bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+async def iter_file(path: Path, start: int, length: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(path: Path, range_header: Optional[str], media_type: Optional[str] = None,
+                  extra_headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Archivo local en streaming: 200 completo o 206 con el rango pedido"""
+    size = os.path.getsize(path)
+    byte_range = parse_range(range_header, size)
+    headers = {**AUDIO_HEADERS, **(extra_headers or {})}
+    media_type = media_type or audio_media_type(str(path))
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(iter_file(path, start, end - start + 1), status_code=206,
+                             media_type=media_type, headers=headers)
+
+
+async def proxy_response(url: str, range_header: Optional[str], cache: B2DiskCache,
+                         cache_key: str) -> StreamingResponse:
+    """Objeto remoto (B2) con read-through a la caché en disco.
+
+    - Hit: se sirve el archivo local (con Range).
+    - Miss sin Range: se reenvía en streaming y a la vez se guarda en la caché.
+    - Miss con Range: se reenvía solo el rango pedido y el objeto completo se
+      descarga en segundo plano para los siguientes requests.
+    """
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return file_response(cached, range_header, audio_media_type(cache_key))
+
+    upstream = await http_client.session.get(url, headers={"Range": range_header} if range_header else {})
+    if upstream.status not in (200, 206):
+        status = upstream.status
+        upstream.release()
+        if status == 416:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+        raise HTTPException(status_code=404, detail=f"Audio file not found in B2 ({status})")
+
+    headers = dict(AUDIO_HEADERS)
+    for name in ("Content-Length", "Content-Range", "ETag", "Last-Modified"):
+        if name in upstream.headers:
+            headers[name] = upstream.headers[name]
+
+    writer = cache.writer(cache_key) if upstream.status == 200 else None
+    if upstream.status == 206:
+        cache.schedule_fill(cache_key, url)
+
+    async def body() -> AsyncIterator[bytes]:
+        nonlocal writer
+        try:
+            async for chunk in upstream.content.iter_chunked(STREAM_CHUNK_SIZE):
+                if writer is not None:
+                    await writer.write(chunk)
+                yield chunk
+            if writer is not None:
+                await writer.commit(upstream.content_length)
+                writer = None
+        finally:
+            # Cliente desconectado a mitad: no dejar un objeto incompleto en la caché
+            if writer is not None:
+                writer.abort()
+            upstream.release()
+
+    return StreamingResponse(body(), status_code=upstream.status,
+                             media_type=audio_media_type(cache_key), headers=headers)
@@ -0,0 +1,200 @@
+"""
+B2 Cache - Caché LRU en disco de objetos de B2 servidos por /audio
+"""
+
+import os
+import time
+import hashlib
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from http_client import http_client, _request_timeout
+
+# Directorio y tamaño máximo (configurables por entorno)
+B2_CACHE_ENABLED = os.getenv("B2_CACHE_ENABLED", "true").lower() == "true"
+B2_CACHE_DIR = Path(os.getenv("B2_CACHE_DIR", "b2_cache"))
+B2_CACHE_MAX_BYTES = int(os.getenv("B2_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+# Bytes que se juntan en memoria antes de escribirlos a disco (en un hilo) mientras se hace de proxy
+B2_CACHE_WRITE_BATCH_BYTES = 1024 * 1024
+
+
+class CacheWriter:
+    """Archivo temporal que solo aparece en la caché si se escribe completo.
+
+    Los chunks se juntan en memoria y se escriben de a ``B2_CACHE_WRITE_BATCH_BYTES``
+    en un hilo, igual que el rename y la evicción de ``commit``: el proxy que lo
+    usa nunca bloquea el event loop con el disco.
+    """
+
+    def __init__(self, cache: "B2DiskCache", key: str):
+        self.cache = cache
+        self.key = key
+        self.path = cache.path_for(key)
+        self.tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{id(self)}.tmp")
+        self._file = None
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self.size = 0
+
+    def _write_batch(self, batch: List[bytes]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.tmp_path, "wb")
+        self._file.writelines(batch)
+
+    async def _flush(self):
+        batch, self._buffer, self._buffered = self._buffer, [], 0
+        await asyncio.to_thread(self._write_batch, batch)
+
+    async def write(self, chunk: bytes):
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+        self.size += len(chunk)
+        if self._buffered >= B2_CACHE_WRITE_BATCH_BYTES:
+            await self._flush()
+
+    def _publish(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        self.cache._added(self.size)
+
+    async def commit(self, expected_size: Optional[int] = None):
+        if expected_size is not None and self.size != expected_size:
+            self.abort()
+            return
+        await self._flush()
+        await asyncio.to_thread(self._publish)
+        self.cache._active.discard(self.key)
+
+    def abort(self):
+        self._buffer = []
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+        self.cache._active.discard(self.key)
+
+
+class B2DiskCache:
+    """Read-through: el primer request de un objeto lo guarda y los siguientes salen de disco.
+
+    El orden LRU se basa en el mtime, que se actualiza en cada hit. Al superar
+    ``max_bytes`` se borran los archivos más antiguos hasta quedar al 90%.
+    """
+
+    def __init__(self, root: Path = B2_CACHE_DIR, max_bytes: int = B2_CACHE_MAX_BYTES,
+                 enabled: bool = B2_CACHE_ENABLED, label: str = "B2 CACHE"):
+        self.root = Path(root)
+        self.label = label
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._usage: Optional[int] = None
+        self._filling: Dict[str, asyncio.Task] = {}
+        self._active: Set[str] = set()
+
+    def path_for(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.root / digest[:2] / f"{digest}{Path(key).suffix}"
+
+    def get(self, key: str) -> Optional[Path]:
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def writer(self, key: str) -> Optional[CacheWriter]:
+        """Writer para guardar un objeto, o None si ya se está guardando en otro request"""
+        if not self.enabled or key in self._active:
+            return None
+        self._active.add(key)
+        return CacheWriter(self, key)
+
+    def tmp_path_for(self, key: str) -> Path:
+        """Ruta temporal (mismo disco que la caché) para generar un objeto con ``adopt``"""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f"{path.name}.{os.getpid()}.{time.monotonic_ns()}.tmp")
+
+    def adopt(self, key: str, tmp_path: Path) -> Path:
+        """Publica en la caché un archivo ya escrito por completo (p. ej. por otro proceso)"""
+        path = self.path_for(key)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        self._added(size)
+        return path
+
+    def _files(self):
+        if not self.root.is_dir():
+            return []
+        return [p for p in self.root.glob("*/*") if p.is_file() and not p.name.endswith(".tmp")]
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        """(mtime, tamaño, ruta) de cada objeto; otro worker puede borrar o renombrar a la vez"""
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def usage(self) -> int:
+        if self._usage is None:
+            self._usage = sum(size for _, size, _ in self._entries())
+        return self._usage
+
+    def _added(self, size: int):
+        self._usage = self.usage() + size
+        if self._usage > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> int:
+        """Borra los objetos menos usados hasta quedar al 90% del máximo"""
+        entries = self._entries()
+        usage = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        reclaimed = 0
+        for _, size, path in sorted(entries):
+            if usage <= target:
+                break
+            path.unlink(missing_ok=True)
+            usage -= size
+            reclaimed += size
+        self._usage = usage
+        if reclaimed:
+            print(f"[{self.label}] Evicted {reclaimed / 1024 ** 2:.1f} MB")
+        return reclaimed
+
+    async def _fill(self, key: str, url: str):
+        writer = None
+        try:
+            async with http_client.session.get(url, timeout=_request_timeout(60)) as response:
+                if response.status != 200:
+                    return
+                writer = self.writer(key)
+                if writer is None:
+                    return
+                async for chunk in response.content.iter_chunked(256 * 1024):
+                    await writer.write(chunk)
+                await writer.commit(response.content_length)
+                writer = None
+                print(f"[{self.label}] Cached {key}")
+        except Exception as e:
+            print(f"[{self.label}] Error caching {key}: {e}")
+        finally:
+            if writer is not None:
+                writer.abort()
+            self._filling.pop(key, None)
+
+    def schedule_fill(self, key: str, url: str):
+        """Descarga el objeto completo en segundo plano (una sola vez por clave)"""
+        if self.enabled and key not in self._filling and key not in self._active:
+            self._filling[key] = asyncio.create_task(self._fill(key, url))
+
+# Global instance
+b2_cache = B2DiskCache()
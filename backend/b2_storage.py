@@ -2,10 +2,11 @@
 B2 Storage - Simplified version for demo
 """
 
-import aiohttp
 import asyncio
 from typing import AsyncGenerator
 
+from http_client import http_client
+
 class B2Storage:
     def __init__(self):
         self.initialized = False
@@ -22,14 +23,13 @@ class B2Storage:
             b2_url = f"https://s3.us-east-005.backblazeb2.com/moises2/{file_path}"
             print(f"📥 Downloading from B2: {b2_url}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(b2_url) as response:
-                    if response.status == 200:
-                        async for chunk in response.content.iter_chunked(8192):
-                            yield chunk
-                    else:
-                        print(f"❌ Error downloading {file_path}: {response.status}")
-                        raise Exception(f"Failed to download file: {response.status}")
+            async with http_client.session.get(b2_url) as response:
+                if response.status == 200:
+                    async for chunk in response.content.iter_chunked(8192):
+                        yield chunk
+                else:
+                    print(f"❌ Error downloading {file_path}: {response.status}")
+                    raise Exception(f"Failed to download file: {response.status}")
         except Exception as e:
             print(f"❌ Error in download_file: {e}")
             raise
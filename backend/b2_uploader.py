@@ -5,74 +5,79 @@ B2 Uploader - Subir pistas separadas a Backblaze B2
 import os
 import asyncio
 import aiohttp
-import aiofiles
-from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
+
+from http_client import http_client
+
+# Subidas simultáneas al proxy (cada una mantiene abierto su archivo y una conexión)
+B2_UPLOAD_CONCURRENCY = int(os.getenv("B2_UPLOAD_CONCURRENCY", "4"))
 
 class B2Uploader:
-    def __init__(self):
+    def __init__(self, concurrency: int = B2_UPLOAD_CONCURRENCY):
         self.proxy_url = "http://localhost:3001"
         self.b2_bucket = "moises2"
         self.b2_endpoint = "https://s3.us-east-005.backblazeb2.com"
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def post_stem(self, file_path: str, user_id: str, song_id: str, stem_name: str) -> Optional[str]:
+        """Subir una pista leyéndola de disco por bloques (sin cargarla entera en memoria).
+
+        Devuelve la URL de descarga, o None si el proxy responde con error.
+        Los errores de red se propagan para que el llamador decida el fallback.
+        """
+        async with self._semaphore:
+            with open(file_path, 'rb') as f:
+                # aiohttp envía el archivo abierto en streaming como parte del multipart
+                form_data = aiohttp.FormData()
+                form_data.add_field('file', f, filename=f"{stem_name}.wav", content_type='audio/wav')
+                form_data.add_field('userId', user_id)
+                form_data.add_field('songId', song_id)
+                form_data.add_field('trackName', stem_name)
+                form_data.add_field('folder', 'stems')
+                
+                async with http_client.session.post(f"{self.proxy_url}/api/upload", data=form_data) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        return result.get('downloadUrl', '')
+                    error_text = await response.text()
+                    print(f"❌ Error uploading stem {stem_name}: {response.status} - {error_text}")
+                    return None
     
     async def upload_stem_to_b2(self, file_path: str, user_id: str, song_id: str, stem_name: str) -> str:
         """Subir una pista separada a B2"""
         try:
             print(f"📤 Uploading stem to B2: {stem_name}")
-            
-            # Leer el archivo
-            async with aiofiles.open(file_path, 'rb') as f:
-                file_data = await f.read()
-            
-            # Crear FormData
-            form_data = aiohttp.FormData()
-            form_data.add_field('file', file_data, filename=f"{stem_name}.wav", content_type='audio/wav')
-            form_data.add_field('userId', user_id)
-            form_data.add_field('songId', song_id)
-            form_data.add_field('trackName', stem_name)
-            form_data.add_field('folder', 'stems')
-            
-            # Subir a B2 via proxy
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.proxy_url}/api/upload", data=form_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        download_url = result.get('downloadUrl', '')
-                        print(f"✅ Stem uploaded to B2: {stem_name} -> {download_url}")
-                        return download_url
-                    else:
-                        error_text = await response.text()
-                        print(f"❌ Error uploading stem {stem_name}: {response.status} - {error_text}")
-                        return ""
+            download_url = await self.post_stem(file_path, user_id, song_id, stem_name)
+            if download_url:
+                print(f"✅ Stem uploaded to B2: {stem_name} -> {download_url}")
+            return download_url or ""
         
         except Exception as e:
             print(f"❌ Error uploading stem {stem_name}: {e}")
             return ""
     
-    async def upload_all_stems_to_b2(self, stems: Dict[str, str], user_id: str, song_id: str) -> Dict[str, str]:
-        """Subir todas las pistas separadas a B2"""
+    async def upload_all_stems_to_b2(self, stems: Dict[str, str], user_id: str, song_id: str,
+                                     on_uploaded: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        """Subir todas las pistas separadas a B2 (en paralelo, hasta B2_UPLOAD_CONCURRENCY a la vez)"""
         print(f"🚀 Uploading all stems to B2 for song: {song_id}")
         
         b2_stems = {}
         
-        # Subir cada pista en paralelo
-        upload_tasks = []
-        for stem_name, stem_path in stems.items():
-            if os.path.exists(stem_path):
-                task = self.upload_stem_to_b2(stem_path, user_id, song_id, stem_name)
-                upload_tasks.append((stem_name, task))
+        async def upload(stem_name: str, stem_path: str):
+            b2_url = await self.upload_stem_to_b2(stem_path, user_id, song_id, stem_name)
+            if b2_url:
+                b2_stems[stem_name] = b2_url
+                if on_uploaded:
+                    # Publicar cada pista en cuanto está subida, sin esperar a las demás
+                    on_uploaded(stem_name, b2_url)
+            else:
+                print(f"❌ Failed to upload {stem_name}")
         
-        # Esperar a que todas las subidas terminen
-        for stem_name, task in upload_tasks:
-            try:
-                b2_url = await task
-                if b2_url:
-                    b2_stems[stem_name] = b2_url
-                    print(f"✅ {stem_name} uploaded to B2: {b2_url}")
-                else:
-                    print(f"❌ Failed to upload {stem_name}")
-            except Exception as e:
-                print(f"❌ Error uploading {stem_name}: {e}")
+        await asyncio.gather(*(
+            upload(stem_name, stem_path)
+            for stem_name, stem_path in stems.items()
+            if os.path.exists(stem_path)
+        ))
         
         print(f"🎵 Upload complete. {len(b2_stems)} stems uploaded to B2")
         return b2_stems
@@ -4,10 +4,13 @@ Chord Analyzer - Detección simplificada de acordes como Moises.ai
 
 import librosa
 import numpy as np
-from typing import List, Dict, Optional, NamedTuple, Tuple
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import os
 
+from audio_buffer import AudioSource, as_audio_buffer
+from feature_store import beat_features, chroma_stft, chroma_cqt
+
 @dataclass
 class ChordResult:
     chord: str
@@ -24,55 +27,90 @@ class KeyResult:
     confidence: float
     tonic: str
 
+# Plantillas de acordes básicos (12 semitonos)
+CHORD_TEMPLATES = {
+    # Acordes mayores
+    'C': [1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0],      # C-E-G
+    'C#': [0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0],    # C#-F-G#
+    'D': [0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0],     # D-F#-A
+    'D#': [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0],    # D#-G-A#
+    'E': [0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1],     # E-G#-B
+    'F': [1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0],     # F-A-C
+    'F#': [0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0],    # F#-A#-C#
+    'G': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1],     # G-B-D
+    'G#': [1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0],    # G#-C-D#
+    'A': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],     # A-C#-E
+    'A#': [0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0],    # A#-D-F
+    'B': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1],     # B-D#-F#
+    
+    # Acordes menores
+    'Cm': [1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0],    # C-Eb-G
+    'C#m': [0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],   # C#-E-G#
+    'Dm': [0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0],    # D-F-A
+    'D#m': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0],   # D#-F#-A#
+    'Em': [0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1],    # E-G-B
+    'Fm': [1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0],    # F-Ab-C
+    'F#m': [0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0],   # F#-A-C#
+    'Gm': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 0],    # G-Bb-D
+    'G#m': [1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1],   # G#-B-D#
+    'Am': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],    # A-C-E
+    'A#m': [0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0],   # A#-C#-F
+    'Bm': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1],    # B-D-F#
+    
+    # Acordes de séptima (simplificados)
+    'C7': [1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0],    # C-E-G-Bb
+    'Dm7': [0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 1],   # D-F-A-C
+    'Em7': [0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1],   # E-G-B-D
+    'F7': [1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],    # F-A-C-Eb
+    'G7': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1],    # G-B-D-F
+    'Am7': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],   # A-C-E-G
+    
+    # Acordes suspendidos comunes
+    'Csus4': [1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0], # C-F-G
+    'Dsus4': [0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0], # D-G-A
+    'Gsus4': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1], # G-C-D
+    
+    # Acordes con quintas aumentadas/disminuidas
+    'Caug': [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],  # C-E-G#
+    'Cdim': [1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0],  # C-Eb-Gb
+}
+
+# Acordes que se evalúan en la detección (mayores y menores)
+BASIC_CHORDS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B',
+                'Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
+
+# Matriz (acordes x 12) construida una sola vez al importar el módulo
+BASIC_TEMPLATE_MATRIX = np.array([CHORD_TEMPLATES[name] for name in BASIC_CHORDS], dtype=np.float64)
+# Puntuación = producto punto + 0.5 * energía en las notas del acorde, en una sola matriz
+BASIC_SCORE_MATRIX = BASIC_TEMPLATE_MATRIX + 0.5 * (BASIC_TEMPLATE_MATRIX > 0)
+# Notas de cada acorde, para recalcular la puntuación exacta del ganador
+BASIC_CHORD_INDICES = [np.where(template > 0)[0] for template in BASIC_TEMPLATE_MATRIX]
+
+# Margen para considerar empatados dos acordes en la puntuación matricial
+SCORE_TIE_TOLERANCE = 1e-9
+
+# Tríadas mayores/menores construidas por intervalos para la decodificación por beats
+# (CHORD_TEMPLATES tiene algunas menores mal escritas, que se conservan para el modo por ventanas)
+TRIAD_TEMPLATE_MATRIX = np.array([
+    np.isin(np.arange(12), (root + np.array(intervals)) % 12)
+    for intervals in ((0, 4, 7), (0, 3, 7))
+    for root in range(12)
+], dtype=np.float64)
+TRIAD_SCORE_MATRIX = TRIAD_TEMPLATE_MATRIX * 1.5
+
+# Segmentación por defecto: "window" (ventanas fijas de 2s + filtrado armónico, la de siempre)
+# o "beat" (por beats + Viterbi, opt-in: cambia los acordes detectados)
+CHORD_SEGMENTATION = os.getenv("CHORD_SEGMENTATION", "window")
+# Puntuación del estado "sin acorde" (mismo umbral que en la detección por ventanas)
+NO_CHORD_SCORE = 0.3
+# Temperatura del softmax que convierte puntuaciones en probabilidades de emisión
+CHORD_EMISSION_TEMPERATURE = 0.1
+
+
 class ChordAnalyzer:
     def __init__(self):
         # Plantillas de acordes básicos (12 semitonos)
-        self.chord_templates = {
-            # Acordes mayores
-            'C': [1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0],      # C-E-G
-            'C#': [0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0],    # C#-F-G#
-            'D': [0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0],     # D-F#-A
-            'D#': [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0],    # D#-G-A#
-            'E': [0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1],     # E-G#-B
-            'F': [1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0],     # F-A-C
-            'F#': [0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0],    # F#-A#-C#
-            'G': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1],     # G-B-D
-            'G#': [1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0],    # G#-C-D#
-            'A': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],     # A-C#-E
-            'A#': [0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0],    # A#-D-F
-            'B': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1],     # B-D#-F#
-            
-            # Acordes menores
-            'Cm': [1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0],    # C-Eb-G
-            'C#m': [0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],   # C#-E-G#
-            'Dm': [0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0],    # D-F-A
-            'D#m': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0],   # D#-F#-A#
-            'Em': [0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1],    # E-G-B
-            'Fm': [1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0],    # F-Ab-C
-            'F#m': [0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0],   # F#-A-C#
-            'Gm': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 0],    # G-Bb-D
-            'G#m': [1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1],   # G#-B-D#
-            'Am': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],    # A-C-E
-            'A#m': [0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0],   # A#-C#-F
-            'Bm': [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1],    # B-D-F#
-            
-            # Acordes de séptima (simplificados)
-            'C7': [1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0],    # C-E-G-Bb
-            'Dm7': [0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 1],   # D-F-A-C
-            'Em7': [0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1],   # E-G-B-D
-            'F7': [1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],    # F-A-C-Eb
-            'G7': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1],    # G-B-D-F
-            'Am7': [0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0],   # A-C-E-G
-            
-            # Acordes suspendidos comunes
-            'Csus4': [1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0], # C-F-G
-            'Dsus4': [0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0, 0], # D-G-A
-            'Gsus4': [0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 1], # G-C-D
-            
-            # Acordes con quintas aumentadas/disminuidas
-            'Caug': [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],  # C-E-G#
-            'Cdim': [1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0],  # C-Eb-Gb
-        }
+        self.chord_templates = CHORD_TEMPLATES
         
         # Nombres de notas
         self.note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -88,19 +126,28 @@ class ChordAnalyzer:
             'F': {'major': [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1], 'minor': [1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0]},
         }
 
-    def analyze_chords(self, file_path: str, window_size: float = 1.0) -> List[ChordResult]:
-        """Analiza los acordes de un archivo de audio con estructura musical"""
+    def analyze_chords(self, audio: AudioSource, window_size: float = 1.0,
+                       segmentation: Optional[str] = None) -> List[ChordResult]:
+        """Analiza los acordes de un archivo de audio con estructura musical
+        
+        ``audio`` puede ser una ruta o un AudioBuffer ya decodificado.
+        ``segmentation`` elige entre "beat" (acordes por beat suavizados con
+        Viterbi) y "window" (ventanas fijas de 2 segundos); por defecto se usa
+        CHORD_SEGMENTATION. En modo "beat", ``window_size`` es la duración
+        mínima esperada de un acorde, en segundos.
+        """
         try:
-            print(f"Loading audio file: {file_path}")
-            
-            # Cargar audio
-            y, sr = librosa.load(file_path, sr=22050)
+            print(f"Loading audio file: {audio if isinstance(audio, str) else audio.source_path}")
             
-            # Detectar tempo y beats
-            tempo, beats = librosa.beat.beat_track(y=y, sr=sr, hop_length=1024)
-            beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=1024)
+            # Beats y croma desde el feature store (se decodifica solo si hay que calcularlos)
+            audio = as_audio_buffer(audio)
+            sr = 22050
+            hop_length = 1024
+            rhythm = beat_features(audio, hop_length=hop_length)
+            tempo, beats = float(rhythm["tempo"][0]), rhythm["beats"]
+            beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=hop_length)
             
-            print(f"Detected tempo: {float(tempo):.1f} BPM")
+            print(f"Detected tempo: {tempo:.1f} BPM")
             print(f"Detected {len(beats)} beats")
             
             # Estimar compás (asumir 4/4 por defecto, pero podríamos detectar)
@@ -109,55 +156,18 @@ class ChordAnalyzer:
             print(f"Estimated time signature: {time_signature[0]}/{time_signature[1]}")
             
             # Extraer características cromáticas
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=1024)
-            
-            # Configurar ventanas de tiempo
-            hop_length = 1024
-            frame_time = hop_length / sr
-            
-            # Procesar con ventanas fijas de 2 segundos - ALGORITMO SIMPLIFICADO
-            chords = []
-            window_duration = 2.0  # Ventanas fijas de 2 segundos
+            chroma = chroma_stft(audio, hop_length=hop_length)
+            total_duration = float(rhythm["duration"][0])
             
-            # Dividir la canción en ventanas de 2 segundos
-            total_duration = len(y) / sr
-            num_windows = int(total_duration / window_duration) + 1
-            
-            print(f"Processing {num_windows} windows of {window_duration}s each")
-            
-            for window_idx in range(num_windows):
-                start_time = window_idx * window_duration
-                end_time = min((window_idx + 1) * window_duration, total_duration)
-                
-                # Convertir tiempo a frames
-                start_frame = int(start_time / frame_time)
-                end_frame = int(end_time / frame_time)
+            segmentation = (segmentation or CHORD_SEGMENTATION).lower()
+            if segmentation == "beat" and len(beats) >= 2:
+                expected_beats = max(beats_per_measure, window_size * tempo / 60.0)
+                chords = self._segment_by_beats(chroma, beats, sr, hop_length, total_duration, expected_beats)
+            else:
+                chords = self._segment_by_windows(chroma, sr, hop_length, total_duration)
                 
-                if start_frame >= chroma.shape[1]:
-                    break
-                
-                # Promediar características cromáticas en la ventana
-                window_chroma = np.mean(chroma[:, start_frame:end_frame], axis=1)
-                
-                # Normalizar
-                window_chroma = window_chroma / (np.sum(window_chroma) + 1e-8)
-                
-                # Detectar acorde para esta ventana
-                chord_result = self._detect_chord_in_frame(window_chroma)
-                
-                if chord_result:
-                    chords.append(ChordResult(
-                        chord=chord_result['chord'],
-                        confidence=chord_result['confidence'],
-                        start_time=start_time,
-                        end_time=end_time,
-                        root_note=chord_result['root_note'],
-                        chord_type=chord_result['chord_type']
-                    ))
-                    print(f"Chord detected: {chord_result['chord']} at {start_time:.1f}s (conf: {chord_result['confidence']:.2f})")
-            
-            # Aplicar filtrado armónico inteligente
-            chords = self._apply_harmonic_filtering(chords, tempo)
+                # Aplicar filtrado armónico inteligente
+                chords = self._apply_harmonic_filtering(chords, tempo)
             
             print(f"Detected {len(chords)} chords:")
             for i, chord in enumerate(chords):
@@ -169,56 +179,159 @@ class ChordAnalyzer:
             print(f"Error analyzing chords: {e}")
             return []
 
-    def _detect_chord_in_frame(self, chroma_vector: np.ndarray) -> Optional[Dict]:
-        """Detecta el acorde en un frame de características cromáticas - ALGORITMO SIMPLIFICADO"""
+    def _segment_by_windows(self, chroma: np.ndarray, sr: int, hop_length: int,
+                            total_duration: float) -> List[ChordResult]:
+        """Un acorde por ventana fija de 2 segundos - ALGORITMO SIMPLIFICADO"""
+        frame_time = hop_length / sr
+        chords = []
+        window_duration = 2.0  # Ventanas fijas de 2 segundos
         
-        # Normalizar el vector cromático
-        chroma_normalized = chroma_vector / (np.sum(chroma_vector) + 1e-8)
+        # Dividir la canción en ventanas de 2 segundos
+        num_windows = int(total_duration / window_duration) + 1
         
-        # Encontrar las 3 notas más fuertes
-        top_indices = np.argsort(chroma_normalized)[-3:]
-        top_values = chroma_normalized[top_indices]
+        print(f"Processing {num_windows} windows of {window_duration}s each")
         
-        # Solo procesar si hay al menos una nota con energía significativa
-        if np.max(chroma_normalized) < 0.1:
-            return None
+        window_bounds = []
+        window_chromas = []
+        for window_idx in range(num_windows):
+            start_time = window_idx * window_duration
+            end_time = min((window_idx + 1) * window_duration, total_duration)
+            
+            # Convertir tiempo a frames
+            start_frame = int(start_time / frame_time)
+            end_frame = int(end_time / frame_time)
+            
+            if start_frame >= chroma.shape[1]:
+                break
+            
+            # Promediar características cromáticas en la ventana
+            window_chroma = np.mean(chroma[:, start_frame:end_frame], axis=1)
+            
+            # Normalizar
+            window_chroma = window_chroma / (np.sum(window_chroma) + 1e-8)
+            
+            window_bounds.append((start_time, end_time))
+            window_chromas.append(window_chroma)
         
-        best_chord = None
-        best_score = 0
+        # Detectar el acorde de todas las ventanas con una sola multiplicación de matrices
+        detections = self._detect_chords_in_windows(np.array(window_chromas).reshape(-1, 12))
         
-        # Probar solo acordes básicos (mayores y menores)
-        basic_chords = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B',
-                       'Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
+        for (start_time, end_time), chord_result in zip(window_bounds, detections):
+            if chord_result:
+                chords.append(ChordResult(
+                    chord=chord_result['chord'],
+                    confidence=chord_result['confidence'],
+                    start_time=start_time,
+                    end_time=end_time,
+                    root_note=chord_result['root_note'],
+                    chord_type=chord_result['chord_type']
+                ))
+        print(f"Chords detected in {len(chords)} of {len(window_bounds)} windows")
+        return chords
+
+    def _segment_by_beats(self, chroma: np.ndarray, beats: np.ndarray, sr: int, hop_length: int,
+                          total_duration: float, expected_beats: float) -> List[ChordResult]:
+        """Acordes alineados a los beats, decodificados con Viterbi
+        
+        El croma se promedia entre beats consecutivos, cada beat se puntúa
+        contra los 24 acordes básicos más un estado "sin acorde" y la secuencia
+        más probable se obtiene con una matriz de transición que favorece
+        mantener el acorde ``expected_beats`` beats. Coste lineal en la duración.
+        """
+        # Croma por beat (incluyendo el tramo antes del primer beat y tras el último)
+        boundaries = librosa.util.fix_frames(beats, x_min=0, x_max=chroma.shape[1])
+        beat_chroma = librosa.util.sync(chroma, boundaries, aggregate=np.mean).T
+        boundary_times = np.minimum(librosa.frames_to_time(boundaries, sr=sr, hop_length=hop_length), total_duration)
+        
+        # Puntuaciones (beats x acordes) con la misma fórmula que las ventanas
+        normalized = beat_chroma / (np.sum(beat_chroma, axis=1, keepdims=True) + 1e-8)
+        chord_scores = normalized @ TRIAD_SCORE_MATRIX.T
+        # Beats sin una nota dominante (silencio o ruido) no puntúan ningún acorde
+        chord_scores[np.max(normalized, axis=1) < 0.1] = 0.0
+        no_chord = np.full((len(chord_scores), 1), NO_CHORD_SCORE)
+        scores = np.hstack([chord_scores, no_chord])
+        
+        # Probabilidades de emisión (softmax) y transición con permanencia esperada
+        logits = (scores - scores.max(axis=1, keepdims=True)) / CHORD_EMISSION_TEMPERATURE
+        emission = np.exp(logits)
+        emission /= emission.sum(axis=1, keepdims=True)
+        p_self = 1.0 - 1.0 / max(expected_beats, 1.0)
+        transition = librosa.sequence.transition_loop(scores.shape[1], p_self)
+        states = librosa.sequence.viterbi(emission.T, transition)
         
-        for chord_name in basic_chords:
-            if chord_name not in self.chord_templates:
+        # Agrupar beats consecutivos con el mismo estado en un solo acorde
+        change_points = np.flatnonzero(np.diff(states)) + 1
+        starts = np.concatenate([[0], change_points])
+        ends = np.concatenate([change_points, [len(states)]])
+        
+        chords = []
+        for start, end in zip(starts, ends):
+            state = states[start]
+            if state >= len(BASIC_CHORDS):
                 continue
-                
-            template = np.array(self.chord_templates[chord_name])
+            chord_name = BASIC_CHORDS[state]
+            chords.append(ChordResult(
+                chord=chord_name,
+                confidence=min(1.0, float(np.mean(chord_scores[start:end, state]))),
+                start_time=float(boundary_times[start]),
+                end_time=float(boundary_times[end]),
+                root_note=chord_name.rstrip('m'),
+                chord_type=self._get_chord_type(chord_name)
+            ))
+        print(f"Decoded {len(chords)} chord segments over {len(states)} beats")
+        return chords
+
+    def _detect_chord_in_frame(self, chroma_vector: np.ndarray) -> Optional[Dict]:
+        """Detecta el acorde en un frame de características cromáticas - ALGORITMO SIMPLIFICADO"""
+        return self._detect_chords_in_windows(np.asarray(chroma_vector)[np.newaxis, :])[0]
+
+    def _detect_chords_in_windows(self, chroma_windows: np.ndarray) -> List[Optional[Dict]]:
+        """Detecta el acorde de cada fila de una matriz (ventanas x 12) de cromas
+        
+        Los 24 acordes básicos se puntúan para todas las ventanas con una sola
+        multiplicación de matrices. Solo los candidatos empatados con el máximo
+        se vuelven a puntuar con la fórmula original (producto punto + 0.5 *
+        energía en las notas del acorde), así el acorde elegido y su confianza
+        son exactamente los mismos que con el bucle por acorde.
+        """
+        if len(chroma_windows) == 0:
+            return []
+        
+        # Puntuaciones (ventanas x acordes)
+        chroma_normalized = chroma_windows / (np.sum(chroma_windows, axis=1, keepdims=True) + 1e-8)
+        scores = chroma_normalized @ BASIC_SCORE_MATRIX.T
+        
+        results: List[Optional[Dict]] = []
+        for chroma_vector, window_scores in zip(chroma_windows, scores):
+            # Normalizar el vector cromático
+            normalized = chroma_vector / (np.sum(chroma_vector) + 1e-8)
             
-            # Método SIMPLE: producto punto normalizado
-            score = np.dot(chroma_normalized, template)
+            # Solo procesar si hay al menos una nota con energía significativa
+            # (las ventanas vacías dan NaN y ninguna comparación las acepta)
+            if np.max(normalized) < 0.1:
+                results.append(None)
+                continue
             
-            # Bonus si las notas principales del acorde están presentes
-            chord_indices = np.where(template > 0)[0]
-            if len(chord_indices) > 0:
-                chord_strength = np.sum(chroma_normalized[chord_indices])
-                score += chord_strength * 0.5
+            best_chord, best_score = None, 0
+            candidates = np.flatnonzero(window_scores >= np.max(window_scores) - SCORE_TIE_TOLERANCE)
+            for index in candidates:
+                score = np.dot(normalized, BASIC_TEMPLATE_MATRIX[index])
+                score += np.sum(normalized[BASIC_CHORD_INDICES[index]]) * 0.5
+                if score > best_score:
+                    best_chord, best_score = BASIC_CHORDS[index], score
             
-            if score > best_score:
-                best_score = score
-                best_chord = {
-                    'chord': chord_name,
-                    'confidence': min(1.0, score),
-                    'root_note': chord_name.rstrip('m'),
-                    'chord_type': self._get_chord_type(chord_name)
-                }
-        
-        # Umbral más alto pero más realista
-        if best_score > 0.3:
-            return best_chord
-        
-        return None
+            # Umbral más alto pero más realista
+            if best_chord is None or best_score <= 0.3:
+                results.append(None)
+                continue
+            
+            results.append({
+                'chord': best_chord,
+                'confidence': min(1.0, best_score),
+                'root_note': best_chord.rstrip('m'),
+                'chord_type': self._get_chord_type(best_chord)
+            })
+        return results
 
     def _get_chord_type(self, chord_name: str) -> str:
         """Determina el tipo de acorde"""
@@ -248,14 +361,11 @@ class ChordAnalyzer:
         
         return unique_chords
 
-    def analyze_key(self, file_path: str) -> Optional[KeyResult]:
+    def analyze_key(self, audio: AudioSource) -> Optional[KeyResult]:
         """Analiza la tonalidad de la canción con algoritmo mejorado"""
         try:
-            # Cargar audio
-            y, sr = librosa.load(file_path, sr=22050)
-            
-            # Extraer características cromáticas con mejor resolución
-            chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=512)
+            # Extraer características cromáticas con mejor resolución (compartidas por hash)
+            chroma = chroma_cqt(audio, hop_length=512)
             
             # Promediar características cromáticas
             avg_chroma = np.mean(chroma, axis=1)
@@ -362,9 +472,6 @@ class ChordAnalyzer:
         if len(beat_times) < 8:
             return (4, 4)  # Default a 4/4
         
-        # Calcular intervalos entre beats
-        beat_intervals = np.diff(beat_times)
-        
         # Agrupar beats en compases (buscar patrones de 3 o 4 beats)
         # Para simplificar, asumir 4/4 por ahora
         return (4, 4)
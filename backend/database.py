@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Integer, BigInteger, DateTime, Text, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -7,7 +7,21 @@ from datetime import datetime
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./moises_clone.db")
 
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+)
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL: lecturas concurrentes (varios workers de uvicorn) mientras otro escribe
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -24,10 +38,43 @@ class TaskDB(Base):
     error = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
+    data = Column(Text)  # JSON: ProcessingTask completo (incluye campos extra)
+    owner = Column(String)  # id del worker (por arranque) que la procesa
+    last_accessed = Column(DateTime)  # último poll de un cliente (para la expiración)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # también es el lease (heartbeat del dueño)
+
+class ResultCacheDB(Base):
+    __tablename__ = "result_cache"
+    
+    cache_key = Column(String, primary_key=True, index=True)  # "{sha256}:{variant}"
+    content_hash = Column(String, index=True)
+    variant = Column(String)
+    task_id = Column(String)
+    workspace = Column(String)  # uploads/{task_id}
+    size_bytes = Column(BigInteger, default=0)
+    result = Column(Text)  # JSON: stems, bpm, key, chords, keyInfo...
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed = Column(DateTime, default=datetime.utcnow)
+    hits = Column(Integer, default=0)
 
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    """create_all no altera tablas existentes: añadir las columnas nuevas a mano"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"[DB] Added column {table.name}.{column.name}")
 
 def get_db():
     """Get database session"""
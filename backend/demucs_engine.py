@@ -0,0 +1,162 @@
+"""
+Demucs Engine - Modelo htdemucs cargado una sola vez por worker
+"""
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from waveform_peaks import waveform_peaks
+
+# Nombre del modelo y dispositivo configurables por entorno
+DEMUCS_PRELOAD = os.getenv("DEMUCS_PRELOAD", "true").lower() == "true"
+DEMUCS_MODEL = os.getenv("DEMUCS_MODEL", "htdemucs")
+DEMUCS_DEVICE = os.getenv("DEMUCS_DEVICE", "cpu")
+DEMUCS_SHIFTS = int(os.getenv("DEMUCS_SHIFTS", "1"))
+DEMUCS_OVERLAP = float(os.getenv("DEMUCS_OVERLAP", "0.25"))
+
+
+@dataclass
+class SeparationResult:
+    stems: Dict[str, str]
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class DemucsEngine:
+    """Motor de separación persistente.
+
+    El modelo se carga la primera vez que se necesita (o en ``warmup``) y se
+    reutiliza para todos los trabajos siguientes. Los trabajos se ejecutan en
+    un único hilo dedicado, así que nunca hay dos inferencias compitiendo por
+    la CPU dentro del mismo worker.
+    """
+
+    def __init__(self, model_name: str = DEMUCS_MODEL, device: str = DEMUCS_DEVICE):
+        self.model_name = model_name
+        self.device = device
+        self.model = None
+        self.load_time = 0.0
+        self._available = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="demucs")
+
+    @property
+    def available(self) -> bool:
+        """True si la API de Python de demucs se puede importar"""
+        if self._available is None:
+            try:
+                from demucs.pretrained import get_model  # noqa: F401
+                from demucs.apply import apply_model  # noqa: F401
+                self._available = True
+            except Exception:
+                self._available = False
+        return self._available
+
+    def _load_model(self):
+        if self.model is not None:
+            return self.model
+
+        from demucs.pretrained import get_model
+
+        start = time.perf_counter()
+        print(f"[DEMUCS] Loading model {self.model_name} on {self.device}...")
+        model = get_model(self.model_name)
+        model.to(self.device)
+        model.eval()
+        self.model = model
+        self.load_time = time.perf_counter() - start
+        print(f"[DEMUCS] Model loaded in {self.load_time:.2f}s")
+        return model
+
+    def _separate_sync(self, file_path: str, output_dir: Path, audio=None) -> SeparationResult:
+        import torch
+        from demucs.apply import apply_model
+        from demucs.audio import AudioFile, save_audio
+
+        timings = {}
+        start = time.perf_counter()
+        model = self._load_model()
+        timings["model_load"] = time.perf_counter() - start
+
+        # Decodificar al samplerate y canales del modelo (o reutilizar el buffer de la tarea)
+        start = time.perf_counter()
+        if audio is not None:
+            samples = audio.multichannel(model.samplerate)
+            if samples.shape[0] < model.audio_channels:
+                samples = np.repeat(samples[:1], model.audio_channels, axis=0)
+            wav = torch.from_numpy(np.ascontiguousarray(samples[:model.audio_channels]))
+        else:
+            wav = AudioFile(file_path).read(
+                streams=0,
+                samplerate=model.samplerate,
+                channels=model.audio_channels
+            )
+        timings["decode"] = time.perf_counter() - start
+
+        # Normalización igual a la del CLI de demucs
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            sources = apply_model(
+                model,
+                wav[None],
+                device=self.device,
+                shifts=DEMUCS_SHIFTS,
+                split=True,
+                overlap=DEMUCS_OVERLAP,
+                progress=False
+            )[0]
+        sources = sources * ref.std() + ref.mean()
+        timings["inference"] = time.perf_counter() - start
+
+        # Misma estructura de salida que el CLI: {out}/{model}/{track}/{stem}.wav
+        start = time.perf_counter()
+        track_dir = output_dir / self.model_name / Path(file_path).stem
+        track_dir.mkdir(parents=True, exist_ok=True)
+
+        stems = {}
+        for source, name in zip(sources, model.sources):
+            stem_path = track_dir / f"{name}.wav"
+            save_audio(source, str(stem_path), samplerate=model.samplerate)
+            stems[name] = str(stem_path)
+        timings["write"] = time.perf_counter() - start
+
+        # Picos de la forma de onda mientras los stems siguen en memoria
+        start = time.perf_counter()
+        for source, name in zip(sources, model.sources):
+            try:
+                waveform_peaks.write(source.cpu().numpy(), model.samplerate, stems[name])
+            except Exception as e:
+                print(f"[DEMUCS] Error writing peaks for {name}: {e}")
+        timings["peaks"] = time.perf_counter() - start
+
+        return SeparationResult(stems=stems, timings=timings)
+
+    async def separate(self, file_path: str, output_dir: Path, audio=None) -> SeparationResult:
+        """Separa un archivo y devuelve las rutas de los stems y los tiempos
+        
+        ``audio`` es un AudioBuffer opcional con el archivo ya decodificado.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._separate_sync, file_path, output_dir, audio)
+
+    async def warmup(self):
+        """Carga el modelo en memoria antes de la primera petición"""
+        if not self.available:
+            print("[DEMUCS] Python API not available, engine will use the CLI fallback")
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._load_model)
+        except Exception as e:
+            print(f"[DEMUCS] Warmup failed: {e}")
+
+# Global instance
+demucs_engine = DemucsEngine()
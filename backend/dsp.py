@@ -0,0 +1,88 @@
+"""
+DSP - Pitch shift y time stretch con rubberband (si está instalado) o con un phase vocoder de numpy/librosa
+"""
+
+import os
+from typing import List
+
+import numpy as np
+import librosa
+
+# "auto" usa rubberband si está disponible y si no el phase vocoder (configurable por entorno)
+PITCH_SHIFT_BACKEND = os.getenv("PITCH_SHIFT_BACKEND", "auto")
+
+
+def _has_rubberband() -> bool:
+    try:
+        import pyrubberband  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_backends() -> List[str]:
+    return (["rubberband"] if _has_rubberband() else []) + ["vocoder"]
+
+
+def resolve_backend(backend: str = PITCH_SHIFT_BACKEND) -> str:
+    """Nombre concreto del backend (forma parte de la clave de caché de las renditions)"""
+    if backend == "auto":
+        return available_backends()[0]
+    if backend not in ("rubberband", "vocoder"):
+        raise ValueError(f"Unknown pitch shift backend: {backend}")
+    if backend == "rubberband" and not _has_rubberband():
+        raise ValueError("pyrubberband is not installed")
+    return backend
+
+
+def vocoder_transform(y: np.ndarray, sr: int, n_steps: float = 0.0, rate: float = 1.0) -> np.ndarray:
+    """Phase vocoder (estirar en el tiempo y remuestrear): sin dependencias nativas.
+
+    Tono y tempo salen de una sola pasada: se estira por ``rate / ratio`` y se
+    remuestrea por ``ratio`` (con ``rate=1`` es exactamente
+    ``librosa.effects.pitch_shift``). Acepta mono ``(n,)`` o multicanal
+    ``(canales, n)``; la duración final es ``n / rate``.
+    """
+    ratio = 2.0 ** (n_steps / 12.0)
+    stretch = rate / ratio
+    out = librosa.effects.time_stretch(y, rate=stretch) if stretch != 1.0 else y
+    if n_steps:
+        out = librosa.resample(out, orig_sr=float(sr) * ratio, target_sr=sr, res_type="soxr_hq")
+    out = librosa.util.fix_length(out, size=int(round(y.shape[-1] / rate)))
+    # El remuestreo puede dejar picos por encima de 1.0 que el WAV de 16 bits recortaría mal
+    peak = float(np.max(np.abs(out))) if out.size else 0.0
+    if peak > 1.0:
+        out = out / peak
+    return out
+
+
+def transform(y: np.ndarray, sr: int, n_steps: float = 0.0, rate: float = 1.0,
+              backend: str = PITCH_SHIFT_BACKEND) -> np.ndarray:
+    """Cambia el tono ``n_steps`` semitonos y el tempo por ``rate`` (0.8 = 80%) en una pasada"""
+    backend = resolve_backend(backend)
+    if backend == "rubberband":
+        import pyrubberband as pyrb
+        # pyrubberband espera (n, canales)
+        samples = y.T if y.ndim > 1 else y
+        if rate == 1.0:
+            out = pyrb.pitch_shift(samples, sr, n_steps=n_steps)
+        else:
+            out = pyrb.time_stretch(samples, sr, rate, rbargs={"--pitch": n_steps} if n_steps else None)
+        return out.T if y.ndim > 1 else out
+    return vocoder_transform(y, sr, n_steps, rate)
+
+
+def pitch_shift(y: np.ndarray, sr: int, n_steps: float, backend: str = PITCH_SHIFT_BACKEND) -> np.ndarray:
+    """Cambia el tono ``n_steps`` semitonos sin cambiar el tempo"""
+    return transform(y, sr, n_steps, 1.0, backend)
+
+
+def render_transform_file(source_path: str, output_path: str, n_steps: float = 0.0, rate: float = 1.0,
+                          backend: str = PITCH_SHIFT_BACKEND) -> str:
+    """Lee ``source_path``, aplica ``transform`` y escribe un WAV en ``output_path`` (corre en el pool)"""
+    import soundfile as sf
+
+    y, sr = librosa.load(source_path, sr=None, mono=False)
+    out = transform(y, sr, n_steps, rate, backend)
+    sf.write(output_path, out.T if out.ndim > 1 else out, sr, format="WAV")
+    return output_path
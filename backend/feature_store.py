@@ -0,0 +1,181 @@
+"""
+Feature Store - Características de audio (croma, onsets, beats) compartidas entre analizadores
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import librosa
+import numpy as np
+
+from audio_buffer import AudioBuffer, AudioSource, as_audio_buffer
+
+# Directorio y activación (configurables por entorno)
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", "feature_cache"))
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE_ENABLED", "true").lower() == "true"
+FEATURE_STORE_MAX_BYTES = int(os.getenv("FEATURE_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Samplerate común de los analizadores
+FEATURE_SR = 22050
+
+Features = Dict[str, np.ndarray]
+
+
+def _params_digest(params: Dict) -> str:
+    # La versión de librosa forma parte de la clave: otra versión puede dar otros valores
+    payload = json.dumps({**params, "librosa": librosa.__version__}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class FeatureStore:
+    """Arrays float32 en disco (.npz) por hash de contenido, tipo de característica y parámetros.
+
+    Al estar en disco, los procesos del pool de análisis comparten lo que
+    calcula cualquiera de ellos. LRU por mtime (se actualiza en cada hit): al
+    superar ``max_bytes`` se borran las entradas más antiguas hasta quedar al 90%.
+    """
+
+    def __init__(self, root: Path = FEATURE_STORE_DIR, enabled: bool = FEATURE_STORE_ENABLED,
+                 max_bytes: int = FEATURE_STORE_MAX_BYTES):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        # Uso estimado por este proceso; evict() lo corrige con lo que hay en disco
+        self._usage: Optional[int] = None
+
+    def _path(self, content_hash: str, name: str, params: Dict) -> Path:
+        return self.root / content_hash[:2] / content_hash / f"{name}-{_params_digest(params)}.npz"
+
+    def get(self, content_hash: str, name: str, params: Dict) -> Optional[Features]:
+        path = self._path(content_hash, name, params)
+        if not self.enabled or not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                features = {key: data[key] for key in data.files}
+            os.utime(path)
+            return features
+        except FileNotFoundError:
+            # Borrado por otro proceso entre exists() y load()
+            return None
+        except Exception as e:
+            print(f"[FEATURES] Discarding unreadable {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, content_hash: str, name: str, params: Dict, features: Features):
+        if not self.enabled:
+            return
+        path = self._path(content_hash, name, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: otro proceso puede estar leyendo la misma entrada
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **features)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        self._added(size)
+
+    def _files(self):
+        if not self.root.is_dir():
+            return []
+        return [p for p in self.root.glob("*/*/*.npz") if p.is_file()]
+
+    def usage(self) -> int:
+        if self._usage is None:
+            self._usage = sum(p.stat().st_size for p in self._files())
+        return self._usage
+
+    def _added(self, size: int):
+        self._usage = self.usage() + size
+        if self._usage > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> int:
+        """Borra las características menos usadas hasta quedar al 90% del máximo"""
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        usage = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        reclaimed = 0
+        for _, size, path in sorted(entries):
+            if usage <= target:
+                break
+            path.unlink(missing_ok=True)
+            usage -= size
+            reclaimed += size
+        self._usage = usage
+        if reclaimed:
+            print(f"[FEATURES] Evicted {reclaimed / 1024 ** 2:.1f} MB")
+        return reclaimed
+
+    def get_or_compute(self, audio: AudioBuffer, name: str, params: Dict,
+                       compute: Callable[[], Features]) -> Features:
+        """Devuelve la característica guardada o la calcula, la guarda y la devuelve"""
+        content_hash = audio.content_hash if self.enabled else None
+        if content_hash:
+            cached = self.get(content_hash, name, params)
+            if cached is not None:
+                return cached
+
+        features = {
+            key: value.astype(np.float32) if np.issubdtype(value.dtype, np.floating) else value
+            for key, value in ((k, np.asarray(v)) for k, v in compute().items())
+        }
+        if content_hash:
+            self.put(content_hash, name, params, features)
+        return features
+
+# Global instance
+feature_store = FeatureStore()
+
+
+def beat_features(audio: AudioSource, hop_length: int = 1024) -> Features:
+    """Tempo, frames de beat, envolvente de onsets y duración (como ``beat_track``)"""
+    audio = as_audio_buffer(audio)
+    params = {"sr": FEATURE_SR, "hop_length": hop_length}
+
+    def compute() -> Features:
+        y = audio.mono(FEATURE_SR)
+        onset_env = librosa.onset.onset_strength(y=y, sr=FEATURE_SR, hop_length=hop_length, aggregate=np.median)
+        tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=FEATURE_SR, hop_length=hop_length)
+        return {
+            "tempo": np.atleast_1d(tempo)[:1],
+            "beats": np.asarray(beats, dtype=np.int32),
+            "onset_env": onset_env,
+            "duration": np.array([len(y) / FEATURE_SR])
+        }
+
+    return feature_store.get_or_compute(audio, "beats", params, compute)
+
+
+def chroma_stft(audio: AudioSource, hop_length: int = 1024) -> np.ndarray:
+    """Croma STFT (12 x frames)"""
+    audio = as_audio_buffer(audio)
+    params = {"sr": FEATURE_SR, "hop_length": hop_length}
+
+    def compute() -> Features:
+        y = audio.mono(FEATURE_SR)
+        return {"chroma": librosa.feature.chroma_stft(y=y, sr=FEATURE_SR, hop_length=hop_length)}
+
+    return feature_store.get_or_compute(audio, "chroma_stft", params, compute)["chroma"]
+
+
+def chroma_cqt(audio: AudioSource, hop_length: int = 512) -> np.ndarray:
+    """Croma CQT (12 x frames), el más caro de calcular"""
+    audio = as_audio_buffer(audio)
+    params = {"sr": FEATURE_SR, "hop_length": hop_length}
+
+    def compute() -> Features:
+        y = audio.mono(FEATURE_SR)
+        return {"chroma": librosa.feature.chroma_cqt(y=y, sr=FEATURE_SR, hop_length=hop_length)}
+
+    return feature_store.get_or_compute(audio, "chroma_cqt", params, compute)["chroma"]
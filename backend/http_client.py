@@ -0,0 +1,90 @@
+"""
+HTTP Client - Pool de conexiones compartido para todas las llamadas salientes (B2, proxy de uploads, descargas)
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import aiofiles
+import aiohttp
+
+# Límites del pool y timeouts (configurables por entorno)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "16"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_DNS_CACHE_SECONDS = int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+
+
+def _request_timeout(timeout: Optional[float]) -> Optional[aiohttp.ClientTimeout]:
+    if not timeout:
+        return None
+    return aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+
+
+class HTTPClient:
+    """Una sola ``aiohttp.ClientSession`` para toda la vida de la aplicación.
+
+    Se crea en el evento de startup y se cierra en el de shutdown; así las
+    conexiones TCP/TLS (y las resoluciones DNS) se reutilizan entre requests.
+    Cada llamada puede pasar su propio ``timeout`` si necesita uno distinto.
+    Como en ``requests``/``httpx``, es un timeout de conexión y de lectura
+    (tiempo sin recibir datos), no del total: una descarga grande por un
+    enlace lento no se corta mientras sigan llegando bytes.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _create(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+        )
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = self._create()
+            print(f"[HTTP] Shared client started ({HTTP_POOL_LIMIT} connections, {HTTP_POOL_LIMIT_PER_HOST} per host)")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # Fuera del ciclo de vida de la app (scripts, pruebas): crearla bajo demanda
+            self._session = self._create()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def download_to_file(self, url: str, path: Union[str, Path], timeout: Optional[float] = None,
+                               headers: Optional[Dict[str, str]] = None, chunk_size: int = 256 * 1024) -> int:
+        """Descarga ``url`` a disco en bloques (sin cargarla entera en memoria); devuelve los bytes escritos"""
+        request_timeout = _request_timeout(timeout)
+        written = 0
+        async with self.session.get(url, headers=headers, timeout=request_timeout) as response:
+            response.raise_for_status()
+            async with aiofiles.open(path, "wb") as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    await f.write(chunk)
+                    written += len(chunk)
+        return written
+
+    async def fetch_bytes(self, url: str, timeout: Optional[float] = None,
+                          headers: Optional[Dict[str, str]] = None) -> bytes:
+        """GET completo en memoria (para respuestas pequeñas o que se procesan enteras)"""
+        request_timeout = _request_timeout(timeout)
+        async with self.session.get(url, headers=headers, timeout=request_timeout) as response:
+            response.raise_for_status()
+            return await response.read()
+
+# Global instance
+http_client = HTTPClient()
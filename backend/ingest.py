@@ -0,0 +1,102 @@
+"""
+Ingest - Guarda uploads en disco por bloques, calculando el hash y detectando el formato al vuelo
+"""
+
+import os
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+
+# Tamaño de bloque y límite de tamaño de los uploads (configurables por entorno)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 ** 2)))
+
+# Bytes necesarios para reconocer el contenedor
+SNIFF_BYTES = 64
+
+
+class IngestedFile(NamedTuple):
+    path: Path
+    size: int
+    content_hash: str
+    format: Optional[str]
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Formato del contenedor según los primeros bytes, o None si no es audio reconocible"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:4] == b"caff":
+        return "caf"
+    if head[:16] == bytes.fromhex("3026b2758e66cf11a6d900aa0062ce6c"):
+        return "wma"
+    if head[:3] == b"ID3":
+        return "mp3"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync de MPEG: MP3 (capa III) o AAC en ADTS (capa 00)
+        return "aac" if head[1] & 0x06 == 0 else "mp3"
+    return None
+
+
+def _copy(source: BinaryIO, dest: Path, max_bytes: int) -> IngestedFile:
+    """Copia por bloques (corre en un hilo); se corta en cuanto se supera ``max_bytes``"""
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+    with open(dest, "wb") as out:
+        while chunk := source.read(INGEST_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            hasher.update(chunk)
+            out.write(chunk)
+    if size > max_bytes:
+        dest.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // 1024 ** 2} MB)")
+    return IngestedFile(dest, size, hasher.hexdigest(), sniff_format(head))
+
+
+async def ingest_upload(file: UploadFile, dest: Union[str, Path], max_bytes: int = MAX_UPLOAD_BYTES,
+                        require_audio: bool = False) -> IngestedFile:
+    """Guarda ``file`` en ``dest`` sin cargarlo entero en memoria ni bloquear el event loop.
+
+    - 413 en cuanto se supera ``max_bytes`` (sin leer el resto).
+    - Con ``require_audio``, 415 si los primeros bytes no son de un formato de audio conocido.
+    """
+    dest = Path(dest)
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // 1024 ** 2} MB)")
+
+    await file.seek(0)
+    ingested = await asyncio.to_thread(_copy, file.file, dest, max_bytes)
+    if require_audio and ingested.format is None:
+        dest.unlink(missing_ok=True)
+        raise HTTPException(status_code=415, detail="Unsupported or unrecognized audio format")
+    return ingested
+
+
+def content_length_exceeded(content_length: Optional[str], max_bytes: int = MAX_UPLOAD_BYTES) -> bool:
+    """True si la cabecera Content-Length ya indica un cuerpo mayor que el límite.
+
+    Permite rechazar el request antes de que Starlette reciba y guarde el multipart.
+    """
+    try:
+        # Margen para las cabeceras del multipart y los demás campos del formulario
+        return content_length is not None and int(content_length) > max_bytes + 1024 * 1024
+    except ValueError:
+        return False
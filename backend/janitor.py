@@ -0,0 +1,210 @@
+"""
+Janitor - Expira tareas antiguas y sus workspaces y mantiene el disco bajo un presupuesto
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import fcntl
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from audio_index import audio_index
+from result_cache import result_cache
+from task_store import TERMINAL_STATUSES, TaskSummary
+
+# Límites (configurables por entorno)
+TASK_TTL_HOURS = float(os.getenv("TASK_TTL_HOURS", "24"))
+TASK_POLL_GRACE_SECONDS = float(os.getenv("TASK_POLL_GRACE_SECONDS", "300"))
+WORKSPACE_DISK_BUDGET_BYTES = int(os.getenv("WORKSPACE_DISK_BUDGET_BYTES", str(50 * 1024 ** 3)))
+TEMP_FILE_TTL_HOURS = float(os.getenv("TEMP_FILE_TTL_HOURS", "1"))
+JANITOR_INTERVAL_SECONDS = float(os.getenv("JANITOR_INTERVAL_SECONDS", "600"))
+
+UPLOADS_DIR = Path("uploads")
+# Cada worker de uvicorn corre su propio janitor sobre el mismo uploads/: solo barre el que tome este lock
+JANITOR_LOCK_PATH = UPLOADS_DIR / ".janitor.lock"
+# Directorios de archivos temporales de los endpoints de análisis, YouTube y pitch
+TEMP_DIRS = [Path("temp_analysis"), Path("temp_youtube"), Path("temp_pitch")]
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _key(path: Path) -> str:
+    return str(path.resolve())
+
+
+class Janitor:
+    """Limpieza periódica de ``tasks_storage`` y de ``uploads/``.
+
+    - Las tareas terminadas expiran ``ttl`` después de su último uso (último
+      poll o, si nunca se consultaron, su finalización). Se borran la tarea y
+      su workspace ``uploads/{task_id}``, salvo que la caché de resultados lo
+      siga usando.
+    - Una tarea consultada hace menos de ``poll_grace`` segundos nunca se toca.
+    - Si ``uploads/`` supera ``disk_budget`` se borran workspaces de tareas
+      terminadas empezando por el de acceso más antiguo, aunque estén en caché.
+
+    Con varios workers de uvicorn solo barre el que toma ``JANITOR_LOCK_PATH``
+    (flock no bloqueante); los demás se saltan la pasada.
+    """
+
+    def __init__(self, store, ttl_hours: float = TASK_TTL_HOURS, poll_grace: float = TASK_POLL_GRACE_SECONDS,
+                 disk_budget: int = WORKSPACE_DISK_BUDGET_BYTES, interval: float = JANITOR_INTERVAL_SECONDS):
+        self.store = store
+        self.ttl = timedelta(hours=ttl_hours)
+        self.poll_grace = timedelta(seconds=poll_grace)
+        self.disk_budget = disk_budget
+        self.interval = interval
+        self.last_report: Optional[Dict] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def _last_used(self, task: TaskSummary) -> datetime:
+        return task.last_accessed or task.completed_at or task.created_at or datetime.now()
+
+    def _is_polled(self, task: TaskSummary, now: datetime) -> bool:
+        return task.last_accessed is not None and now - task.last_accessed < self.poll_grace
+
+    def _acquire_lock(self):
+        """Lock exclusivo entre procesos sobre uploads/; None si otro worker está barriendo"""
+        UPLOADS_DIR.mkdir(exist_ok=True)
+        lock_file = open(JANITOR_LOCK_PATH, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _expire(self, expired_ids: Set[str]):
+        for task_id in expired_ids:
+            self.store.pop(task_id, None)
+            audio_index.forget(task_id)
+
+    def _remove_workspace(self, workspace: Path) -> int:
+        size = _dir_size(workspace)
+        shutil.rmtree(workspace, ignore_errors=True)
+        return size
+
+    def _sweep_disk(self, summaries: List[TaskSummary], expired_ids: Set[str], now: datetime) -> Dict:
+        """Parte de sistema de archivos (corre en un hilo)"""
+        report = {"removed_workspaces": 0, "reclaimed_bytes": 0, "cache_entries_dropped": 0}
+        cached = {_key(Path(w)) for w in result_cache.workspaces()}
+        by_id = {task.id: task for task in summaries}
+
+        # Workspaces de tareas expiradas (los que usa la caché los gestiona ella)
+        for task_id in expired_ids:
+            workspace = UPLOADS_DIR / task_id
+            if workspace.is_dir() and _key(workspace) not in cached:
+                report["reclaimed_bytes"] += self._remove_workspace(workspace)
+                report["removed_workspaces"] += 1
+
+        # Directorios huérfanos (sin tarea ni entrada de caché) y temporales viejos
+        if UPLOADS_DIR.is_dir():
+            orphan_cutoff = time.time() - self.ttl.total_seconds()
+            for workspace in UPLOADS_DIR.iterdir():
+                if (workspace.is_dir() and workspace.name not in by_id and _key(workspace) not in cached
+                        and workspace.stat().st_mtime < orphan_cutoff):
+                    report["reclaimed_bytes"] += self._remove_workspace(workspace)
+                    report["removed_workspaces"] += 1
+        temp_cutoff = time.time() - TEMP_FILE_TTL_HOURS * 3600
+        for temp_dir in TEMP_DIRS:
+            if not temp_dir.is_dir():
+                continue
+            for entry in temp_dir.iterdir():
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < temp_cutoff:
+                        report["reclaimed_bytes"] += entry.stat().st_size
+                        entry.unlink()
+                except OSError:
+                    pass
+
+        # Presupuesto de disco: borrar por último acceso, nunca tareas en curso o consultadas
+        sizes = {}
+        if UPLOADS_DIR.is_dir():
+            sizes = {w.name: _dir_size(w) for w in UPLOADS_DIR.iterdir() if w.is_dir()}
+        usage = sum(sizes.values())
+        if usage > self.disk_budget:
+            candidates = sorted(
+                (task for task in summaries
+                 if task.id in sizes and task.id not in expired_ids
+                 and task.status in TERMINAL_STATUSES and not self._is_polled(task, now)),
+                key=self._last_used
+            )
+            for task in candidates:
+                if usage <= self.disk_budget:
+                    break
+                workspace = UPLOADS_DIR / task.id
+                report["cache_entries_dropped"] += result_cache.forget_workspace(str(workspace))
+                shutil.rmtree(workspace, ignore_errors=True)
+                usage -= sizes[task.id]
+                report["reclaimed_bytes"] += sizes[task.id]
+                report["removed_workspaces"] += 1
+                # Sin workspace la tarea ya no se puede servir
+                expired_ids.add(task.id)
+
+        report["disk_usage_bytes"] = usage
+        return report
+
+    async def run_once(self) -> Dict:
+        """Una pasada completa; devuelve (y guarda) el informe de lo recuperado"""
+        start = time.perf_counter()
+        now = datetime.now()
+        lock_file = await asyncio.to_thread(self._acquire_lock)
+        if lock_file is None:
+            return {"skipped": True, "ran_at": now.isoformat()}
+        try:
+            # summaries/pop van contra la base de datos: fuera del event loop
+            summaries = await asyncio.to_thread(self.store.summaries)
+            expired_ids = {
+                task.id for task in summaries
+                if task.status in TERMINAL_STATUSES
+                and not self._is_polled(task, now)
+                and now - self._last_used(task) > self.ttl
+            }
+
+            report = await asyncio.to_thread(self._sweep_disk, summaries, expired_ids, now)
+            await asyncio.to_thread(self._expire, expired_ids)
+            report["expired_tasks"] = len(expired_ids)
+            report["cache"] = await asyncio.to_thread(result_cache.evict)
+        finally:
+            lock_file.close()
+        report["disk_budget_bytes"] = self.disk_budget
+        report["duration_seconds"] = round(time.perf_counter() - start, 3)
+        report["ran_at"] = now.isoformat()
+
+        self.last_report = report
+        if report["expired_tasks"] or report["reclaimed_bytes"]:
+            print(f"[JANITOR] Expired {report['expired_tasks']} task(s), removed "
+                  f"{report['removed_workspaces']} workspace(s), reclaimed "
+                  f"{report['reclaimed_bytes'] / 1024 ** 2:.1f} MB "
+                  f"(uploads now {report['disk_usage_bytes'] / 1024 ** 3:.2f} GB)")
+        return report
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[JANITOR] Sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._loop())
+            print(f"[JANITOR] Started (TTL {self.ttl}, budget {self.disk_budget / 1024 ** 3:.0f} GB)")
+
+    def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
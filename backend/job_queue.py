@@ -0,0 +1,185 @@
+"""
+Job Queue - Cola acotada de separaciones con un número fijo de workers
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Número de separaciones simultáneas por worker de uvicorn
+SEPARATION_WORKERS = int(os.getenv("SEPARATION_WORKERS", "1"))
+# Máximo de trabajos en espera antes de rechazar nuevos uploads
+SEPARATION_QUEUE_LIMIT = int(os.getenv("SEPARATION_QUEUE_LIMIT", "50"))
+# Duración estimada de un trabajo hasta tener mediciones reales
+DEFAULT_JOB_SECONDS = float(os.getenv("SEPARATION_DEFAULT_JOB_SECONDS", "180"))
+
+
+class QueueFullError(Exception):
+    """La cola de separación alcanzó su límite"""
+
+
+@dataclass(order=True)
+class Job:
+    priority: int
+    sequence: int
+    job_id: str = field(compare=False)
+    func: Callable[..., Awaitable[Any]] = field(compare=False)
+    args: tuple = field(compare=False, default=())
+    enqueued_at: float = field(compare=False, default_factory=time.time)
+
+
+class JobScheduler:
+    """Planificador de trabajos con prioridad y orden FIFO dentro de cada prioridad.
+
+    Los trabajos con menor ``priority`` se ejecutan antes. Cada worker toma
+    un trabajo a la vez, así que nunca hay más de ``workers`` separaciones
+    corriendo en el proceso.
+
+    La cola vive en este proceso: cada vez que cambia, ``on_update(job_id, info)``
+    recibe la posición/ETA de los trabajos cuya posición cambió para guardarla en
+    la tarea, y así /status la puede responder desde cualquier worker de uvicorn.
+    """
+
+    def __init__(self, workers: int = SEPARATION_WORKERS, max_pending: int = SEPARATION_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._pending: Dict[str, Job] = {}
+        self._running: Dict[str, float] = {}
+        self._durations: List[float] = []
+        self._sequence = itertools.count()
+        self._worker_tasks: List[asyncio.Task] = []
+        self.on_update: Optional[Callable[[str, Dict[str, Any]], None]] = None
+        # Última posición publicada de cada trabajo (solo se republica si cambia)
+        self._published: Dict[str, int] = {}
+
+    async def start(self):
+        """Arranca los workers (llamar desde el evento de startup)"""
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        for i in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(i)))
+        print(f"[QUEUE] Job scheduler started with {self.workers} worker(s)")
+
+    async def stop(self):
+        for worker in self._worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def submit(self, job_id: str, func: Callable[..., Awaitable[Any]], *args, priority: int = 10):
+        """Encola un trabajo; lanza QueueFullError si la cola está llena"""
+        if self._queue is None:
+            await self.start()
+        if len(self._pending) >= self.max_pending:
+            raise QueueFullError(f"Separation queue is full ({self.max_pending} pending jobs)")
+
+        job = Job(priority=priority, sequence=next(self._sequence), job_id=job_id, func=func, args=args)
+        self._pending[job_id] = job
+        await self._queue.put(job)
+        print(f"[QUEUE] Job {job_id} enqueued (position {self.position(job_id)}, running {len(self._running)})")
+        self._publish()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Posición 1-based en la cola, 0 si ya se está ejecutando, None si no existe"""
+        if job_id in self._running:
+            return 0
+        job = self._pending.get(job_id)
+        if job is None:
+            return None
+        return 1 + sum(1 for other in self._pending.values() if other < job)
+
+    @property
+    def average_duration(self) -> float:
+        if not self._durations:
+            return DEFAULT_JOB_SECONDS
+        return sum(self._durations) / len(self._durations)
+
+    def estimated_start(self, job_id: str) -> Optional[float]:
+        """Segundos estimados hasta que el trabajo empiece (0 si ya corre)"""
+        position = self.position(job_id)
+        if position is None:
+            return None
+        if position == 0:
+            return 0.0
+
+        avg = self.average_duration
+        now = time.time()
+        # Tiempo restante de los trabajos en curso, ordenado de menor a mayor
+        remaining = sorted(max(0.0, avg - (now - started)) for started in self._running.values())
+        remaining += [0.0] * (self.workers - len(remaining))
+
+        # Cada worker libera un hueco cada 'avg' segundos tras terminar su trabajo actual
+        jobs_ahead = position - 1
+        slot = remaining[jobs_ahead % self.workers]
+        return round(slot + (jobs_ahead // self.workers) * avg, 1)
+
+    @property
+    def idle(self) -> bool:
+        """Sin trabajos en cola ni en ejecución en este proceso"""
+        return not self._pending and not self._running
+
+    def knows(self, job_id: str) -> bool:
+        return job_id in self._pending or job_id in self._running
+
+    def queue_info(self, job_id: str, stored: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Posición/ETA del trabajo; si está en la cola de otro proceso, la guardada en la tarea"""
+        if stored and not self.knows(job_id):
+            info = dict(stored)
+            if info.get("estimated_start_at"):
+                eta = datetime.fromisoformat(info["estimated_start_at"]).timestamp() - time.time()
+                info["estimated_start_seconds"] = round(max(0.0, eta), 1)
+            return info
+        position = self.position(job_id)
+        eta = self.estimated_start(job_id)
+        return {
+            "queue_position": position,
+            "estimated_start_seconds": eta,
+            "estimated_start_at": datetime.fromtimestamp(time.time() + eta).isoformat() if eta is not None else None,
+            "queue_length": len(self._pending),
+            "running_jobs": len(self._running),
+        }
+
+    def _publish(self):
+        if self.on_update is None:
+            return
+        positions = {job_id: 0 for job_id in self._running}
+        positions.update((job.job_id, index) for index, job in enumerate(sorted(self._pending.values()), 1))
+        for job_id, position in positions.items():
+            if self._published.get(job_id) == position:
+                continue
+            self._published[job_id] = position
+            try:
+                self.on_update(job_id, self.queue_info(job_id))
+            except Exception as e:
+                print(f"[QUEUE] Error publishing queue info for {job_id}: {e}")
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            self._pending.pop(job.job_id, None)
+            self._running[job.job_id] = time.time()
+            self._publish()
+            start = time.perf_counter()
+            print(f"[QUEUE] Worker {index} starting job {job.job_id} "
+                  f"(waited {time.time() - job.enqueued_at:.1f}s)")
+            try:
+                await job.func(*job.args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[QUEUE] Job {job.job_id} failed: {e}")
+            finally:
+                self._running.pop(job.job_id, None)
+                self._published.pop(job.job_id, None)
+                self._durations = (self._durations + [time.perf_counter() - start])[-20:]
+                self._queue.task_done()
+                self._publish()
+
+# Global instance
+job_scheduler = JobScheduler()
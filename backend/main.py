@@ -1,25 +1,50 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 import os
 import uuid
 import asyncio
+import shutil
 import tempfile
 from pathlib import Path
 from typing import List, Optional, Dict
+from datetime import datetime
 import json
 
 from audio_processor_real import audio_processor
-from chord_analyzer import ChordAnalyzer
+from demucs_engine import demucs_engine, DEMUCS_PRELOAD
+from job_queue import job_scheduler, QueueFullError
+from result_cache import result_cache, cache_variant
+from task_graph import TaskGraph
+from analysis_pool import analysis_pool, AnalysisTimeoutError, ANALYSIS_WARMUP
+from audio_analysis import (
+    analyze_tempo_metadata, analyze_harmony, analyze_chords_and_key, analyze_key_file,
+    analyze_offset_and_bpm, analyze_bpm_file, TEMPO_ANALYSIS_SR
+)
 from models import ProcessingTask, TaskStatus
-# from database import get_db, init_db  # Commented out - not using database
+from database import init_db
+from task_store import create_task_store
+from janitor import Janitor
+from audio_serving import file_response, proxy_response, audio_media_type
+from b2_cache import b2_cache
 from b2_storage import b2_storage
-import librosa
-import numpy as np
+from b2_uploader import b2_uploader
+from ingest import ingest_upload, content_length_exceeded, MAX_UPLOAD_BYTES
+from audio_index import audio_index, candidate_paths, link_or_copy, UPLOADS_DIR
+from transcode import transcoder
+from youtube_store import youtube_store, YouTubeAudio
+from ytdlp import ytdlp, YtDlpError
+from renditions import rendition_service, PITCH_MAX_SEMITONES, TIME_STRETCH_MIN_RATE, TIME_STRETCH_MAX_RATE
+from analysis_transform import transform_analysis, ANALYSIS_FIELDS
+from waveform_peaks import waveform_peaks
+from http_client import http_client, _request_timeout
+from audio_buffer import AudioBuffer
 
-# In-memory task storage
-tasks_storage = {}
+# Task storage (persistente y compartido entre workers; TASK_STORE=memory para el dict de antes)
+tasks_storage = create_task_store()
+# Expira tareas y workspaces viejos y mantiene uploads/ bajo el presupuesto de disco
+janitor = Janitor(tasks_storage)
 
 app = FastAPI(
     title="Moises Clone API",
@@ -27,6 +52,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Rechazar uploads demasiado grandes antes de recibir el cuerpo (registrado antes de CORS
+# para que la respuesta 413 también lleve las cabeceras CORS)
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and content_length_exceeded(request.headers.get("content-length")):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"File too large (max {MAX_UPLOAD_BYTES // 1024 ** 2} MB)"}
+        )
+    return await call_next(request)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -43,16 +79,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Metadatos de las renditions que lee el frontend
+    expose_headers=["X-Rendition-Cache", "X-Analysis-Url", "X-Analysis-Key", "X-Analysis-Bpm"],
 )
 
 # Static files (commented for demo)
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize B2 only (database not used)
+# Initialize B2 and the result cache index
 @app.on_event("startup")
 async def startup_event():
-    # init_db()  # Commented out - not using database
+    init_db()  # Tareas e índice persistente de la caché de resultados
+    await tasks_storage.start()
+    janitor.start()
+    await http_client.start()  # Pool de conexiones compartido (B2, proxy de uploads, descargas)
     await b2_storage.initialize()
+    job_scheduler.on_update = store_queue_info
+    await job_scheduler.start()
+    rendition_service.start()
+    if ANALYSIS_WARMUP:
+        # Importar librosa y compilar numba en los workers antes del primer request
+        asyncio.create_task(analysis_pool.warmup())
+    if DEMUCS_PRELOAD:
+        # Cargar htdemucs una sola vez por worker en lugar de en cada job
+        asyncio.create_task(demucs_engine.warmup())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    janitor.stop()
+    await job_scheduler.stop()
+    rendition_service.stop()
+    analysis_pool.shutdown()
+    await tasks_storage.close()
+    await http_client.close()
 
 # Audio processor instance (already imported)
 
@@ -71,28 +130,25 @@ async def health_check_api():
 # Endpoints de separación (múltiples rutas para compatibilidad)
 @app.post("/api/separate-demucs")
 async def separate_with_demucs(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     separation_type: str = Form("vocals-instrumental"),
     hi_fi: str = Form("false"),
     separation_options: Optional[str] = Form(None),
     user_id: Optional[str] = Form(None)
 ):
-    return await separate_audio_handler(background_tasks, file, separation_type, hi_fi, separation_options, user_id)
+    return await separate_audio_handler(file, separation_type, hi_fi, separation_options, user_id)
 
 @app.post("/separate")
 async def separate_alias(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     separation_type: str = Form("vocals-instrumental"),
     hi_fi: str = Form("false"),
     separation_options: Optional[str] = Form(None),
     user_id: Optional[str] = Form(None)
 ):
-    return await separate_audio_handler(background_tasks, file, separation_type, hi_fi, separation_options, user_id)
+    return await separate_audio_handler(file, separation_type, hi_fi, separation_options, user_id)
 
 async def separate_audio_handler(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     separation_type: str = Form("vocals-instrumental"),
     hi_fi: str = Form("false"),
@@ -119,11 +175,61 @@ async def separate_audio_handler(
         file_path = upload_dir / f"original.{file_ext}"
         
         print(f"[SEPARATE] Leyendo archivo...")
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        print(f"[SEPARATE] Archivo guardado: {file_path} ({len(content)} bytes)")
+        # Guardar por bloques calculando el hash y validando el formato al vuelo
+        try:
+            ingested = await ingest_upload(file, file_path, require_audio=True)
+        except HTTPException:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise
+        content_hash = ingested.content_hash
+        audio_index.register(file_path)
+        print(f"[SEPARATE] Archivo guardado: {file_path} ({ingested.size} bytes, {ingested.format}, sha256 {content_hash[:12]})")
+        
+        return await start_separation(task_id, upload_dir, file_path, file.filename, content_hash,
+                                      separation_type, hi_fi, separation_options)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/separate-youtube")
+async def separate_youtube(
+    handle: str = Form(...),
+    separation_type: str = Form("vocals-instrumental"),
+    hi_fi: str = Form("false"),
+    separation_options: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None)
+):
+    """Separar el audio de un handle de /youtube-extract sin que el cliente lo vuelva a subir"""
+    try:
+        entry = youtube_store.get(handle)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="YouTube audio not found (extract it again)")
+        
+        task_id = str(uuid.uuid4())
+        print(f"[SEPARATE] YouTube handle {handle} -> task {task_id}, Type: {separation_type}")
         
+        upload_dir = Path(f"uploads/{task_id}")
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        file_path = upload_dir / "original.mp3"
+        await asyncio.to_thread(link_or_copy, entry.path, file_path)
+        audio_index.register(file_path)
+        
+        return await start_separation(task_id, upload_dir, file_path, f"{entry.title}.mp3", entry.content_hash,
+                                      separation_type, hi_fi, separation_options)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def start_separation(task_id: str, upload_dir: Path, file_path: Path, filename: str, content_hash: str,
+                           separation_type: str, hi_fi: str, separation_options: Optional[str]):
+    """Crea la tarea (o reutiliza la caché de resultados) para un original ya guardado en uploads/"""
+    try:
         # Parse separation options
         custom_tracks = None
         if separation_options:
@@ -133,35 +239,87 @@ async def separate_audio_handler(
             except Exception as e:
                 print(f"[SEPARATE] Error parsing separation_options: {e}")
         
+        requested_tracks = [t for t, enabled in custom_tracks.items() if enabled] if custom_tracks else None
+        variant = cache_variant(separation_type, requested_tracks)
+        
+        # ¿Ya se procesó esta misma canción? Reutilizar stems y análisis (consulta SQL, fuera del loop)
+        cached = await asyncio.to_thread(result_cache.lookup, content_hash, variant)
+        if cached:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            task = ProcessingTask(
+                id=task_id,
+                original_filename=filename,
+                file_path=cached.get("file_path") or str(file_path),
+                separation_type=separation_type,
+                status=TaskStatus.COMPLETED,
+                progress=100,
+                stems=cached.get("stems"),
+                bpm=cached.get("bpm"),
+                duration=cached.get("duration"),
+                timeSignature=cached.get("timeSignature"),
+                chords=cached.get("chords"),
+                keyInfo=cached.get("keyInfo"),
+                completed_at=datetime.now()
+            )
+            task.tempoCurve = cached.get("tempoCurve")
+            task.key = cached.get("key")
+            task.peaks = cached.get("peaks")
+            task.previews = cached.get("previews")
+            task.content_hash = content_hash
+            task.cached_from = cached.get("source_task_id")
+            await tasks_storage.put(task_id, task)
+            print(f"[SEPARATE] Cache hit for {content_hash[:12]} ({variant}) -> task {task.cached_from}")
+            
+            return {
+                "success": True,
+                "data": {
+                    "task_id": task_id,
+                    "status": task.status,
+                    "message": "Resultados reutilizados de la caché",
+                    "filename": filename,
+                    "cached": True
+                }
+            }
+        
         # Crear tarea
         task = ProcessingTask(
             id=task_id,
-            original_filename=file.filename,
+            original_filename=filename,
             file_path=str(file_path),
             separation_type=separation_type,
-            status=TaskStatus.PROCESSING,
+            status=TaskStatus.PENDING,
             progress=0
         )
-        tasks_storage[task_id] = task
+        task.content_hash = content_hash
+        task.cache_variant = variant
+        await tasks_storage.put(task_id, task)
         
-        # Procesar en background
-        background_tasks.add_task(
-            process_audio, 
-            task, 
-            custom_tracks,
-            hi_fi == "true"
-        )
+        # Encolar en el planificador (número acotado de separaciones simultáneas)
+        try:
+            await job_scheduler.submit(
+                task_id,
+                process_audio, 
+                task, 
+                custom_tracks,
+                hi_fi == "true"
+            )
+        except QueueFullError as e:
+            tasks_storage.pop(task_id, None)
+            raise HTTPException(status_code=503, detail=str(e))
         
         return {
             "success": True,
             "data": {
                 "task_id": task_id,
-                "status": "processing",
-                "message": "Separación iniciada con Demucs",
-                "filename": file.filename
+                "status": task.status,
+                "message": "Separación encolada con Demucs",
+                "filename": filename,
+                **job_scheduler.queue_info(task_id)
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -182,17 +340,20 @@ async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = No
         tasks_storage[task.id] = task
         print(f"[PROCESS] Task stored in memory: {task.id}")
         
-        # Callback para actualizar progreso
+        # Callback para actualizar progreso (los pasos corren en paralelo: nunca retrocede)
         def update_progress(progress: int, message: str = ""):
             current_task = tasks_storage.get(task.id)
             if current_task:
-                current_task.progress = progress
+                current_task.progress = max(current_task.progress, progress)
                 tasks_storage[task.id] = current_task
             else:
-                task.progress = progress
+                task.progress = max(task.progress, progress)
                 tasks_storage[task.id] = task
             print(f"[PROGRESS] {progress}% - {message} [Task ID: {task.id}]")
         
+        # Tiempos por fase reportados por el motor de separación
+        timings = {}
+        
         # Determinar qué tracks solicitar
         requested_tracks = None
         
@@ -204,134 +365,126 @@ async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = No
             
             if len(requested_tracks) == 0:
                 requested_tracks = ["vocals", "drums", "bass", "other"]
-            
-            stems = await audio_processor.separate_with_demucs(task.file_path, update_progress, requested_tracks)
         
         elif task.separation_type == "vocals-instrumental":
             print(f"[PROCESS] Procesando modo: vocals-instrumental")
             requested_tracks = ["vocals", "instrumental"]
-            stems = await audio_processor.separate_with_demucs(task.file_path, update_progress, requested_tracks)
         
         elif task.separation_type == "vocals-drums-bass-other":
             print(f"[PROCESS] Procesando modo: vocals-drums-bass-other (4 stems)")
             requested_tracks = ["vocals", "drums", "bass", "other"]
-            stems = await audio_processor.separate_with_demucs(task.file_path, update_progress, requested_tracks)
         
         else:
             print(f"[PROCESS] Procesando modo por defecto: 4 stems")
             requested_tracks = ["vocals", "drums", "bass", "other"]
-            stems = await audio_processor.separate_with_demucs(task.file_path, update_progress, requested_tracks)
         
-        print(f"\n[PROCESS] Demucs separation completed! Got {len(stems)} stems")
-        print(f"   Stems: {list(stems.keys())}")
+        # Los stems se encolan para subirlos en cuanto existen en disco
+        ready_stems: asyncio.Queue = asyncio.Queue()
         
-        # Upload stems to B2 for online playback
-        print(f"\n[PROCESS] Uploading {len(stems)} stems to B2...")
-        task.progress = 85
-        tasks_storage[task.id] = task
+        async def decode_step():
+            # Decodificar el original una sola vez para Demucs y todos los análisis
+            return await asyncio.to_thread(AudioBuffer.load, task.file_path, getattr(task, "content_hash", None))
         
-        stem_urls = await upload_stems_to_b2(stems, task.id)
-        
-        print(f"[PROCESS] B2 upload completed! {len(stem_urls)} stems uploaded")
-        
-        task.progress = 95
-        tasks_storage[task.id] = task
+        async def separate_step(audio):
+            try:
+                stems = await audio_processor.separate_with_demucs(
+                    task.file_path, update_progress, requested_tracks, timings, audio,
+                    on_stem=lambda name, path: ready_stems.put_nowait((name, path))
+                )
+            finally:
+                ready_stems.put_nowait(None)
+            print(f"\n[PROCESS] Demucs separation completed! Got {len(stems)} stems")
+            print(f"   Stems: {list(stems.keys())}")
+            return stems
+        
+        def publish_stem(stem_name: str, stem_url: str, field: str = "availableStems"):
+            # El frontend puede empezar a cargar cada stem sin esperar a los demás
+            current_task = tasks_storage.get(task.id) or task
+            available = dict(getattr(current_task, field, None) or {})
+            available[stem_name] = stem_url
+            setattr(current_task, field, available)
+            if current_task is not task:
+                setattr(task, field, available)
+            tasks_storage[task.id] = current_task
+        
+        async def upload_stem(stem_name: str, stem_path: str, preview: asyncio.Task):
+            urls = await upload_stems_to_b2({stem_name: stem_path}, task.id)
+            # El WAV se publica después de su preview (o de que la preview falle)
+            await preview
+            for name, url in urls.items():
+                publish_stem(name, url)
+            return urls
+        
+        async def peaks_stem(stem_name: str, stem_path: str):
+            # Demucs ya los escribió con el stem en memoria; los stems mezclados se leen de disco
+            try:
+                if await asyncio.to_thread(waveform_peaks.ensure, stem_path):
+                    publish_stem(stem_name, f"/peaks/{task.id}/{stem_name}", field="peaks")
+            except Exception as e:
+                print(f"[PROCESS] Error generating peaks for {stem_name}: {e}")
         
-        # Analizar metadata del audio original
-        print(f"[PROCESS] Analizando metadata del audio...")
-        try:
-            bpm, duration = detect_bpm_and_duration(task.file_path)
-            print(f"[PROCESS] BPM detectado: {bpm}, Duración: {duration}s")
-        except Exception as e:
-            print(f"[PROCESS] Error detectando BPM: {e}")
-            bpm = 126
-            duration = 0
-        
-        # Detectar key (tonalidad) y acordes
-        try:
-            from chord_analyzer import ChordAnalyzer
-            from collections import Counter
-            analyzer = ChordAnalyzer()
-            
-            # Analizar acordes
-            print(f"[PROCESS] Analizando acordes...")
-            chords_list = analyzer.analyze_chords(task.file_path)
-            
-            # Convertir acordes a dict
-            chords_data = [
-                {
-                    "chord": chord.chord,
-                    "confidence": float(chord.confidence),
-                    "start_time": float(chord.start_time),
-                    "end_time": float(chord.end_time),
-                    "root_note": chord.root_note,
-                    "chord_type": chord.chord_type
-                }
-                for chord in chords_list
-            ]
-            
-            # Detectar key basándose en la escala (más preciso)
-            if len(chords_list) > 0:
-                # Definir escalas diatónicas (7 acordes por tonalidad)
-                # Formato: tonalidad -> [I, ii, iii, IV, V, vi, vii°]
-                major_scales = {
-                    'C': ['C', 'Dm', 'Em', 'F', 'G', 'Am', 'Bdim'],
-                    'C#': ['C#', 'D#m', 'E#m', 'F#', 'G#', 'A#m', 'B#dim'],
-                    'D': ['D', 'Em', 'F#m', 'G', 'A', 'Bm', 'C#dim'],
-                    'D#': ['D#', 'Fm', 'Gm', 'G#', 'A#', 'Cm', 'Ddim'],
-                    'E': ['E', 'F#m', 'G#m', 'A', 'B', 'C#m', 'D#dim'],
-                    'F': ['F', 'Gm', 'Am', 'A#', 'C', 'Dm', 'Edim'],
-                    'F#': ['F#', 'G#m', 'A#m', 'B', 'C#', 'D#m', 'E#dim'],
-                    'G': ['G', 'Am', 'Bm', 'C', 'D', 'Em', 'F#dim'],
-                    'G#': ['G#', 'A#m', 'Cm', 'C#', 'D#', 'Fm', 'Gdim'],
-                    'A': ['A', 'Bm', 'C#m', 'D', 'E', 'F#m', 'G#dim'],
-                    'A#': ['A#', 'Cm', 'Dm', 'D#', 'F', 'Gm', 'Adim'],
-                    'B': ['B', 'C#m', 'D#m', 'E', 'F#', 'G#m', 'A#dim']
-                }
-                
-                # Extraer acordes únicos detectados
-                detected_chords = set(chord.chord for chord in chords_list)
-                
-                # Calcular coincidencias con cada escala
-                best_match_key = None
-                best_match_score = 0
-                
-                for scale_key, scale_chords in major_scales.items():
-                    # Contar cuántos acordes detectados están en esta escala
-                    matches = sum(1 for chord in detected_chords if chord in scale_chords)
-                    score = matches / len(detected_chords) if detected_chords else 0
-                    
-                    if score > best_match_score:
-                        best_match_score = score
-                        best_match_key = scale_key
-                
-                key = best_match_key if best_match_key else "C"
-                keyInfo_data = {
-                    "key": key,
-                    "mode": "major",
-                    "confidence": best_match_score,
-                    "tonic": key
-                }
-                print(f"[PROCESS] Key detectada por escala: {key} major (coincidencia: {best_match_score:.2f})")
-            else:
-                # Fallback: usar análisis espectral
-                key_result = analyzer.analyze_key(task.file_path)
-                key = key_result.key if key_result else "E"
-                keyInfo_data = {
-                    "key": key_result.key if key_result else "Unknown",
-                    "mode": key_result.mode if key_result else "major",
-                    "confidence": float(key_result.confidence) if key_result else 0.0,
-                    "tonic": key_result.tonic if key_result else "Unknown"
-                } if key_result else None
-            
-            print(f"[PROCESS] Acordes detectados: {len(chords_data)}, Key: {key}")
-        except Exception as e:
-            print(f"[PROCESS] Error detectando acordes/key: {e}")
-            import traceback
-            traceback.print_exc()
-            key = "E"
-            chords_data = []
-            keyInfo_data = None
+        async def preview_stem(stem_name: str, stem_path: str):
+            # Preview liviana servida por /audio: el mixer arranca con ella y
+            # cambia al WAV cuando aparece en availableStems (siempre después)
+            try:
+                preview_path = await transcoder.encode_preview(stem_path)
+            except Exception as e:
+                print(f"[PROCESS] Error encoding preview for {stem_name}: {e}")
+                return
+            if preview_path is not None:
+                # Relativa al backend, como /peaks y /renditions
+                rel_path = preview_path.resolve().relative_to(UPLOADS_DIR.resolve()).as_posix()
+                publish_stem(stem_name, f"/audio/{rel_path}", field="previews")
+        
+        async def upload_step():
+            uploads, extras = [], []
+            while (item := await ready_stems.get()) is not None:
+                stem_name, stem_path = item
+                audio_index.register(stem_path)
+                extras.append(asyncio.create_task(peaks_stem(stem_name, stem_path)))
+                preview = asyncio.create_task(preview_stem(stem_name, stem_path))
+                extras.append(preview)
+                print(f"[PROCESS] Stem ready, uploading {stem_name} to B2...")
+                uploads.append(asyncio.create_task(upload_stem(stem_name, stem_path, preview)))
+            stem_urls = {}
+            for result in await asyncio.gather(*uploads):
+                stem_urls.update(result)
+            await asyncio.gather(*extras)
+            print(f"[PROCESS] B2 upload completed! {len(stem_urls)} stems uploaded")
+            update_progress(95, "Stems uploaded")
+            return stem_urls
+        
+        async def tempo_step(audio):
+            # Analizar metadata del audio original (en paralelo con Demucs, en el pool)
+            print("[PROCESS] Analizando metadata del audio...")
+            view = await asyncio.to_thread(audio.view, TEMPO_ANALYSIS_SR)
+            try:
+                return await analysis_pool.run(analyze_tempo_metadata, view)
+            except AnalysisTimeoutError as e:
+                print(f"[PROCESS] Error detectando BPM: {e}")
+                return 126, round(audio.duration, 2), []
+        
+        async def harmony_step(audio):
+            # Detectar key (tonalidad) y acordes (en paralelo con Demucs, en el pool)
+            view = await asyncio.to_thread(audio.view, 22050)
+            try:
+                return await analysis_pool.run(analyze_harmony, view)
+            except AnalysisTimeoutError as e:
+                print(f"[PROCESS] Error detectando acordes/key: {e}")
+                return "E", [], None
+        
+        graph = TaskGraph(task.id)
+        graph.add("decode", decode_step)
+        graph.add("separate", separate_step, deps=["decode"])
+        graph.add("upload", upload_step)
+        graph.add("tempo", tempo_step, deps=["decode"])
+        graph.add("harmony", harmony_step, deps=["decode"])
+        results = await graph.run()
+        
+        stem_urls = results["upload"]
+        bpm, duration, tempo_curve = results["tempo"]
+        key, chords_data, keyInfo_data = results["harmony"]
+        task.timings = {**timings, **{f"step_{name}": t for name, t in graph.timings.items()}}
         
         # Update task with results
         task.stems = stem_urls
@@ -341,11 +494,24 @@ async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = No
         task.key = key
         task.timeSignature = '4/4'
         task.duration = duration
+        task.tempoCurve = tempo_curve
         task.chords = chords_data
         task.keyInfo = keyInfo_data
         
+        task.completed_at = datetime.now()
+        
         tasks_storage[task.id] = task
         
+        # Guardar en la caché de resultados para futuras subidas del mismo archivo
+        content_hash = getattr(task, "content_hash", None)
+        if content_hash and stem_urls:
+            try:
+                # Mide el workspace y desaloja entradas viejas (rmtree): en un hilo
+                await asyncio.to_thread(result_cache.store, content_hash,
+                                        getattr(task, "cache_variant", task.separation_type), task)
+            except Exception as e:
+                print(f"[PROCESS] Error storing result cache entry: {e}")
+        
         print(f"\n{'='*60}")
         print(f"[PROCESS] Audio processing COMPLETED for task: {task.id}")
         print(f"   - Status: {task.status}")
@@ -363,39 +529,25 @@ async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = No
         traceback.print_exc()
 
 async def upload_stems_to_b2(stems: Dict[str, str], task_id: str) -> Dict[str, str]:
-    """Upload separated stems to B2 and return URLs"""
+    """Upload separated stems to B2 and return URLs (streamed from disk, in parallel)"""
     try:
-        import aiohttp
-        import aiofiles
-        
         b2_stems = {}
         
-        for stem_name, stem_path in stems.items():
-            if os.path.exists(stem_path):
-                print(f"Uploading {stem_name} to B2...")
-                
-                # Read file
-                async with aiofiles.open(stem_path, 'rb') as f:
-                    file_data = await f.read()
-                
-                # Create FormData
-                form_data = aiohttp.FormData()
-                form_data.add_field('file', file_data, filename=f"{stem_name}.wav", content_type='audio/wav')
-                form_data.add_field('userId', 'system')
-                form_data.add_field('songId', task_id)
-                form_data.add_field('trackName', stem_name)
-                form_data.add_field('folder', 'stems')
-                
-                # Upload to B2 via proxy
-                async with aiohttp.ClientSession() as session:
-                    async with session.post('http://localhost:3001/api/upload', data=form_data) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            b2_url = result.get('downloadUrl', '')
-                            b2_stems[stem_name] = b2_url
-                            print(f"SUCCESS: {stem_name} uploaded to B2: {b2_url}")
-                        else:
-                            print(f"ERROR: Failed to upload {stem_name}: {response.status}")
+        async def upload(stem_name: str, stem_path: str):
+            print(f"Uploading {stem_name} to B2...")
+            # Concurrencia limitada por B2_UPLOAD_CONCURRENCY
+            b2_url = await b2_uploader.post_stem(stem_path, 'system', task_id, stem_name)
+            if b2_url is not None:
+                b2_stems[stem_name] = b2_url
+                print(f"SUCCESS: {stem_name} uploaded to B2: {b2_url}")
+            else:
+                print(f"ERROR: Failed to upload {stem_name}")
+        
+        await asyncio.gather(*(
+            upload(stem_name, stem_path)
+            for stem_name, stem_path in stems.items()
+            if os.path.exists(stem_path)
+        ))
         
         return b2_stems
         
@@ -432,14 +584,20 @@ async def debug_tasks():
         "tasks": tasks_info
     }
 
+@app.get("/debug/janitor")
+async def debug_janitor(run: bool = False):
+    """Último informe de limpieza (run=true fuerza una pasada ahora)"""
+    report = await janitor.run_once() if run else janitor.last_report
+    return {"report": report}
+
 @app.get("/status/{task_id}")
 async def get_status(task_id: str):
     """Get processing status"""
     task = await get_task_status(task_id)
     if not task:
         print(f"[STATUS] Task not found: {task_id}")
-        print(f"   Available tasks in storage: {list(tasks_storage.keys())}")
         raise HTTPException(status_code=404, detail="Task not found")
+    touch_task(task)
     
     # Log current status
     print(f"[STATUS] Task {task_id}: status={task.status}, progress={task.progress}%")
@@ -457,6 +615,13 @@ async def get_status(task_id: str):
     duration = getattr(task, 'duration', 0)
     chords = getattr(task, 'chords', None)
     keyInfo = getattr(task, 'keyInfo', None)
+    tempoCurve = getattr(task, 'tempoCurve', None)
+    # Stems ya subidos mientras la tarea sigue en curso
+    availableStems = getattr(task, 'availableStems', None)
+    # URLs de los picos de la forma de onda de cada stem
+    peaks = getattr(task, 'peaks', None)
+    # Versiones livianas (AAC/Opus) de cada stem, normalmente listas antes que los WAV
+    previews = getattr(task, 'previews', None)
     
     response = {
         "task_id": task_id,
@@ -469,96 +634,48 @@ async def get_status(task_id: str):
         "timeSignature": timeSignature,
         "duration": duration,
         "chords": chords,
-        "keyInfo": keyInfo
+        "keyInfo": keyInfo,
+        "tempoCurve": tempoCurve,
+        "previews": previews,
+        "availableStems": availableStems,
+        "peaks": peaks
     }
     
+    # Posición en la cola y hora estimada de inicio mientras espera
+    if task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+        response.update(job_scheduler.queue_info(task_id, getattr(task, 'queueInfo', None)))
+    
     return response
 
+def store_queue_info(task_id: str, info: Dict):
+    """Guarda la posición/ETA en la tarea: la cola es de este proceso, /status puede ser de otro"""
+    task = tasks_storage.get(task_id)
+    if task is not None and task.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+        task.queueInfo = info
+        tasks_storage[task_id] = task
+
 @app.get("/audio/{path:path}")
-async def serve_audio(path: str):
-    """Serve audio files from local filesystem or B2"""
+async def serve_audio(path: str, request: Request):
+    """Serve audio files from local filesystem or B2 (streaming, with Range support)"""
+    range_header = request.headers.get("range")
     try:
         # Try multiple local paths
-        possible_paths = [
-            f"uploads/{path}",  # Archivos originales y stems
-            f"../uploads/{path}",
-            path  # Ruta absoluta o relativa directa
-        ]
-        
-        local_path = None
-        for p in possible_paths:
-            if os.path.exists(p):
-                local_path = p
-                break
+        local_path = next((p for p in candidate_paths(path) if p.is_file()), None)
         
         # Try local file first
         if local_path:
-            # Determine media type based on file extension
-            if path.endswith('.mp3'):
-                media_type = "audio/mpeg"
-            elif path.endswith('.wav'):
-                media_type = "audio/wav"
-            else:
-                media_type = "audio/wav"  # Default
-            
-            print(f"[SERVE_AUDIO] Serving from: {local_path}")
-            
-            # Return file response
-            return FileResponse(
-                local_path,
-                media_type=media_type,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET",
-                    "Access-Control-Allow-Headers": "Range",
-                    "Cache-Control": "public, max-age=3600"
-                }
-            )
-        
-        # If not found locally, try to stream from B2
-        print(f"Audio file not found locally: {local_path}, trying B2...")
-        try:
-            # Construct B2 URL directly
-            # Format: https://s3.us-east-005.backblazeb2.com/moises2/audio/{path}
-            b2_url = f"https://s3.us-east-005.backblazeb2.com/moises2/audio/{path}"
-            print(f"Streaming from B2 URL: {b2_url}")
-            
-            # Stream the file from B2 through backend
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(b2_url) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        
-                        # Determine media type
-                        if path.endswith('.mp3'):
-                            media_type = "audio/mpeg"
-                        elif path.endswith('.wav'):
-                            media_type = "audio/wav"
-                        else:
-                            media_type = "audio/wav"
-                        
-                        from fastapi.responses import Response
-                        return Response(
-                            content=content,
-                            media_type=media_type,
-                            headers={
-                                "Access-Control-Allow-Origin": "*",
-                                "Access-Control-Allow-Methods": "GET",
-                                "Access-Control-Allow-Headers": "Range",
-                                "Cache-Control": "public, max-age=3600",
-                                "Accept-Ranges": "bytes"
-                            }
-                        )
-                    else:
-                        print(f"B2 returned status: {response.status}")
-                        raise HTTPException(status_code=404, detail="Audio file not found in B2")
-        except Exception as b2_error:
-            print(f"Error streaming from B2: {b2_error}")
-        
-        # If still not found, raise 404
-        print(f"Audio file not found anywhere: {path}")
-        raise HTTPException(status_code=404, detail="Audio file not found")
+            # Uso del workspace para el LRU del janitor (también cuando lo sirve una tarea de la caché)
+            owner_id = audio_index.task_id_for_path(path)
+            if owner_id:
+                tasks_storage.touch(owner_id)
+            print(f"[SERVE_AUDIO] Serving from: {local_path} (range: {range_header or 'full'})")
+            return file_response(local_path, range_header, audio_media_type(path))
+        
+        # If not found locally, stream from B2 (through the local disk cache)
+        # Format: https://s3.us-east-005.backblazeb2.com/moises2/audio/{path}
+        b2_url = f"https://s3.us-east-005.backblazeb2.com/moises2/audio/{path}"
+        print(f"[SERVE_AUDIO] Not found locally, streaming from B2: {b2_url} (range: {range_header or 'full'})")
+        return await proxy_response(b2_url, range_header, b2_cache, f"audio/{path}")
         
     except HTTPException:
         raise
@@ -591,8 +708,15 @@ async def download_stem(task_id: str, stem_name: str):
     )
 
 async def get_task_status(task_id: str) -> Optional[ProcessingTask]:
-    """Get task status from memory storage"""
-    return tasks_storage.get(task_id)
+    """Get task status from the task store"""
+    return await tasks_storage.aget(task_id)
+
+def touch_task(task: ProcessingTask):
+    """Registra el uso de la tarea y, si salió de la caché, el de la tarea dueña de su workspace"""
+    tasks_storage.touch(task.id)
+    source_task_id = getattr(task, "cached_from", None)
+    if source_task_id:
+        tasks_storage.touch(source_task_id)
 
 # Chord Analysis Endpoints
 @app.post("/api/analyze-chords")
@@ -612,9 +736,11 @@ async def analyze_chords(
         
         if file and file.filename:
             # Upload file provided
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+            try:
+                await ingest_upload(file, file_path)
+            except HTTPException:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                raise
             print(f"Saved uploaded file for chord analysis: {file_path}")
         else:
             # No file provided, this endpoint now expects URL in request body
@@ -629,7 +755,7 @@ async def analyze_chords(
             status=TaskStatus.PROCESSING,
             progress=0
         )
-        tasks_storage[task_id] = task
+        await tasks_storage.put(task_id, task)
         
         # Start chord analysis in background
         background_tasks.add_task(process_chord_analysis, task)
@@ -640,6 +766,8 @@ async def analyze_chords(
             "message": "Chord analysis started"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in analyze_chords endpoint: {e}")
         import traceback
@@ -653,11 +781,6 @@ async def analyze_chords_from_url(
 ):
     """Analyze chords from audio URL"""
     try:
-        import requests
-        import os
-        import shutil
-        from pathlib import Path
-        
         audio_url = request.get("url")
         if not audio_url:
             raise HTTPException(status_code=400, detail="URL is required")
@@ -672,50 +795,17 @@ async def analyze_chords_from_url(
         
         print(f"Processing audio from URL: {audio_url}")
         
-        # Check if it's a local backend URL
-        if audio_url.startswith("http://localhost:8000/audio/") or audio_url.startswith("http://127.0.0.1:8000/audio/"):
-            # Extract the file path from the URL
-            url_path = audio_url.replace("http://localhost:8000/audio/", "").replace("http://127.0.0.1:8000/audio/", "")
-            # Try to find the file in the uploads directory
-            
-            # Search for the file in uploads directory (current directory is backend/)
-            uploads_dir = Path("uploads")
-            found_file = None
-            
-            for root, dirs, files in os.walk(uploads_dir):
-                for file in files:
-                    if file.endswith(('.mp3', '.wav', '.m4a', '.flac')):
-                        file_path_found = Path(root) / file
-                        # Check if this might be the file we're looking for
-                        if url_path in str(file_path_found) or file in url_path:
-                            found_file = file_path_found
-                            break
-                if found_file:
-                    break
-            
-            if found_file and found_file.exists():
-                # Copy the existing file
-                shutil.copy2(found_file, file_path)
-                print(f"Using existing file: {found_file} -> {file_path}")
-            else:
-                # Fallback: try to download anyway
-                print(f"Local file not found, trying to download: {audio_url}")
-                response = requests.get(audio_url, timeout=30)
-                response.raise_for_status()
-                
-                with open(file_path, "wb") as buffer:
-                    buffer.write(response.content)
-                
-                print(f"Downloaded and saved audio file: {file_path}")
+        # Local backend URL: resolve it through the path index and hard-link the file
+        found_file = await asyncio.to_thread(audio_index.local_path_for_url, audio_url)
+        if found_file is not None:
+            await asyncio.to_thread(link_or_copy, found_file, file_path)
+            print(f"Using existing file: {found_file} -> {file_path}")
         else:
-            # External URL - download normally
-            response = requests.get(audio_url, timeout=30)
-            response.raise_for_status()
-            
-            with open(file_path, "wb") as buffer:
-                buffer.write(response.content)
+            # External URL (or not found locally) - stream it to disk without blocking the loop
+            await http_client.download_to_file(audio_url, file_path, timeout=30)
             
             print(f"Downloaded and saved audio file: {file_path}")
+        audio_index.register(file_path)
         
         # Create task
         task = ProcessingTask(
@@ -726,7 +816,7 @@ async def analyze_chords_from_url(
             status=TaskStatus.PROCESSING,
             progress=0
         )
-        tasks_storage[task_id] = task
+        await tasks_storage.put(task_id, task)
         
         # Start chord analysis in background
         background_tasks.add_task(process_chord_analysis, task)
@@ -744,11 +834,22 @@ async def analyze_chords_from_url(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/chord-analysis/{task_id}")
-async def get_chord_analysis(task_id: str):
-    """Get chord analysis results"""
-    task = tasks_storage.get(task_id)
+async def get_chord_analysis(task_id: str, semitones: float = 0, rate: float = 1):
+    """Get chord analysis results (``semitones``/``rate``: análisis de una rendition transpuesta o con otro tempo)"""
+    task = await tasks_storage.aget(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    touch_task(task)
+    
+    if semitones or rate != 1:
+        analysis = derived_analysis(task, parse_semitones(semitones, allow_zero=True), parse_rate(rate))
+        return {
+            "task_id": task_id,
+            "status": task.status,
+            "progress": task.progress,
+            **analysis,
+            "error": task.error if hasattr(task, 'error') else None
+        }
     
     # Chords are already stored as dictionaries, so we can return them directly
     chords_data = None
@@ -780,46 +881,14 @@ async def process_chord_analysis(task: ProcessingTask):
         if not os.path.exists(task.file_path):
             raise Exception(f"Audio file not found: {task.file_path}")
         
-        # Initialize chord analyzer
-        print("Initializing chord analyzer...")
-        from chord_analyzer import ChordAnalyzer
-        analyzer = ChordAnalyzer()
-        
         # Update progress
         task.progress = 20
         task.status = TaskStatus.PROCESSING
+        tasks_storage[task.id] = task
         
-        # Analyze chords
-        print("Analyzing chords...")
-        chords = analyzer.analyze_chords(task.file_path)
-        print(f"Found {len(chords)} chords")
-        task.progress = 60
-        
-        # Analyze key
-        print("Analyzing key...")
-        key_info = analyzer.analyze_key(task.file_path)
-        print(f"Key analysis result: {key_info}")
-        task.progress = 80
-        
-        # Save results
-        task.chords = [
-            {
-                "chord": chord.chord,
-                "confidence": float(chord.confidence),
-                "start_time": float(chord.start_time),
-                "end_time": float(chord.end_time),
-                "root_note": chord.root_note,
-                "chord_type": chord.chord_type
-            }
-            for chord in chords
-        ]
-        
-        task.key = {
-            "key": key_info.key if key_info else "Unknown",
-            "mode": key_info.mode if key_info else "Unknown",
-            "confidence": float(key_info.confidence) if key_info else 0.0,
-            "tonic": key_info.tonic if key_info else "Unknown"
-        } if key_info else None
+        # Acordes y tonalidad en el pool de análisis (una sola decodificación)
+        print("Analyzing chords and key in the analysis pool...")
+        task.chords, task.key = await analysis_pool.run(analyze_chords_and_key, task.file_path)
         
         task.progress = 100
         task.status = TaskStatus.COMPLETED
@@ -847,218 +916,44 @@ async def analyze_bpm(file: UploadFile = File(...)):
         
         # Guardar archivo temporal
         temp_file = temp_dir / f"temp_{uuid.uuid4()}_{file.filename}"
-        with open(temp_file, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        await ingest_upload(file, temp_file)
         
         try:
-            # Cargar audio con librosa
-            y, sr = librosa.load(str(temp_file))
-            
-            # Detectar tempo y beats
-            tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, units='time')
-            
-            # Calcular offset del primer beat
-            first_beat_time = 0.0
-            if len(beat_frames) > 0:
-                first_beat_time = beat_frames[0]
-            
-            # Detectar onset del primer ataque fuerte
-            onsets = librosa.onset.onset_detect(y=y, sr=sr, units='time')
-            first_onset = onsets[0] if len(onsets) > 0 else 0.0
-            
-            # Usar el menor entre primer beat y primer onset
-            offset = min(first_beat_time, first_onset) if first_onset > 0 else first_beat_time
-            
-            # Duración del audio
-            duration = len(y) / sr
-            
-            # Detectar compás (time signature)
-            # Análisis básico de patrones de acentuación
-            beat_times = librosa.frames_to_time(beat_frames, sr=sr)
-            if len(beat_times) >= 4:
-                # Analizar patrones de acentuación en los primeros beats
-                energy_per_beat = []
-                for i in range(min(8, len(beat_times) - 1)):
-                    start_frame = int(beat_times[i] * sr)
-                    end_frame = int(beat_times[i + 1] * sr)
-                    beat_energy = np.mean(np.abs(y[start_frame:end_frame]))
-                    energy_per_beat.append(beat_energy)
-                
-                # Detectar patrón de acentuación (4/4, 3/4, etc.)
-                if len(energy_per_beat) >= 4:
-                    # Buscar patrones de acentuación cada 4 beats
-                    accent_pattern = 4  # Default
-                    if len(energy_per_beat) >= 8:
-                        # Analizar si hay acentuación cada 3 beats (3/4)
-                        three_beat_energy = np.mean([energy_per_beat[i] for i in range(0, len(energy_per_beat), 3)])
-                        four_beat_energy = np.mean([energy_per_beat[i] for i in range(0, len(energy_per_beat), 4)])
-                        
-                        if three_beat_energy > four_beat_energy * 1.2:
-                            accent_pattern = 3
-            else:
-                accent_pattern = 4
-            
-            result = {
-                "bpm": float(tempo),
-                "offset": float(offset),
-                "duration": float(duration),
-                "time_signature": f"{accent_pattern}/4",
-                "beat_times": beat_times.tolist()[:20],  # Primeros 20 beats
-                "onsets": onsets.tolist()[:10]  # Primeros 10 onsets
-            }
-            
-            return result
+            # Análisis en el pool de procesos (no bloquea el event loop)
+            return await analysis_pool.run(analyze_bpm_file, str(temp_file))
             
         finally:
             # Limpiar archivo temporal
             if temp_file.exists():
                 temp_file.unlink()
                 
+    except AnalysisTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error analyzing BPM: {e}")
         raise HTTPException(status_code=500, detail=f"Error analyzing audio: {str(e)}")
 
-def detect_offset(audio_path: str) -> float:
-    """Detecta el downbeat real (primer beat fuerte del compás) en segundos."""
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
-    
-    # 1. Detectar tempo y beats
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, units="frames")
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
-    
-    # 2. Detectar onsets (ataques)
-    onset_strength = librosa.onset.onset_strength(y=y, sr=sr)
-    onset_frames = librosa.onset.onset_detect(
-        onset_envelope=onset_strength, sr=sr, units="frames",
-        pre_max=3, post_max=3, pre_avg=3, post_avg=5, 
-        delta=0.5, wait=20
-    )
-    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-    
-    if len(beat_times) == 0 or len(onset_times) == 0:
-        return 0.1  # Fallback
-    
-    # 3. Buscar el primer onset que coincida con un beat (downbeat real)
-    tolerance = 0.15  # 150ms de tolerancia
-    
-    for beat_time in beat_times:
-        # Buscar onsets cerca de este beat
-        for onset_time in onset_times:
-            if abs(onset_time - beat_time) <= tolerance:
-                # Encontramos un onset que coincide con un beat
-                return round(float(max(0.1, onset_time)), 3)
-    
-    # 4. Si no hay coincidencia exacta, buscar el primer beat fuerte
-    # Analizar energía alrededor de cada beat
-    energy = np.abs(y)
-    beat_energies = []
-    
-    for beat_time in beat_times[:5]:  # Solo los primeros 5 beats
-        start_frame = int((beat_time - 0.1) * sr)
-        end_frame = int((beat_time + 0.1) * sr)
-        start_frame = max(0, start_frame)
-        end_frame = min(len(energy), end_frame)
-        
-        if end_frame > start_frame:
-            beat_energy = np.mean(energy[start_frame:end_frame])
-            beat_energies.append((beat_time, beat_energy))
-    
-    if beat_energies:
-        # Tomar el beat con mayor energía (más probable que sea el downbeat)
-        strongest_beat = max(beat_energies, key=lambda x: x[1])
-        return round(float(max(0.1, strongest_beat[0])), 3)
-    
-    # 5. Fallback: usar el primer beat detectado
-    return round(float(max(0.1, beat_times[0])), 3)
-
-def detect_bpm_and_duration(audio_path: str):
-    """Detecta BPM promedio y duración del audio con algoritmo mejorado."""
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
-    
-    # Usar múltiples métodos para detectar BPM más preciso
-    # Método 1: beat_track con diferentes parámetros
-    tempo1, beats1 = librosa.beat.beat_track(y=y, sr=sr, start_bpm=60, tightness=100)
-    
-    # Método 2: beat_track con parámetros más conservadores
-    tempo2, beats2 = librosa.beat.beat_track(y=y, sr=sr, start_bpm=120, tightness=50)
-    
-    # Método 3: Usar onset_strength para detectar tempo
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    tempo3, beats3 = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
-    
-    # Método 4: Análisis de espectro para detectar tempo
-    tempo4, beats4 = librosa.beat.beat_track(y=y, sr=sr, units='time', hop_length=512)
-    
-    # Método 5: Usar tempo con diferentes hop_length
-    tempo5, beats5 = librosa.beat.beat_track(y=y, sr=sr, hop_length=1024)
-    
-    # Método 6: Análisis de tempo con diferentes unidades
-    tempo6, beats6 = librosa.beat.beat_track(y=y, sr=sr, units='frames')
-    
-    # Calcular promedio de los métodos
-    tempos = [tempo1, tempo2, tempo3, tempo4, tempo5, tempo6]
-    
-    # Filtrar valores extremos (menos de 40 o más de 250 BPM)
-    valid_tempos = [t for t in tempos if 40 <= t <= 250]
-    
-    if valid_tempos:
-        # Usar la mediana para evitar outliers
-        tempo = np.median(valid_tempos)
-        
-        # Verificar si el tempo es consistente con los beats detectados
-        if len(beats1) > 0:
-            beat_times = librosa.frames_to_time(beats1, sr=sr)
-            if len(beat_times) > 1:
-                # Calcular BPM basado en intervalos entre beats
-                intervals = np.diff(beat_times)
-                median_interval = np.median(intervals)
-                calculated_bpm = 60.0 / median_interval
-                
-                # Si el BPM calculado es muy diferente, usar el calculado
-                if abs(calculated_bpm - tempo) > 20:
-                    tempo = calculated_bpm
-    else:
-        # Fallback al primer método si todos son inválidos
-        tempo = tempo1
-    
-    # Normalización del BPM para rango musical estándar
-    if tempo < 70:
-        tempo = tempo * 2  # Subir al doble si está muy lento
-    elif tempo > 180:
-        tempo = tempo / 2  # Bajar a la mitad si está muy rápido
-    
-    # Asegurar que el tempo esté en un rango razonable
-    tempo = max(60, min(180, tempo))
-    
-    # Redondear a números enteros (120, 121, 122, etc.)
-    original_tempo = tempo
-    print(f"BPM antes del redondeo: {tempo}")
-    
-    # Redondear al entero más cercano
-    tempo = round(tempo)
-    
-    print(f"BPM después del redondeo: {original_tempo} -> {tempo}")
-    print(f"BPM final que se devuelve: {tempo}")
-    
-    duration = librosa.get_duration(y=y, sr=sr)
-    return int(tempo), round(float(duration), 2)
 
 @app.post("/api/analyze-audio")
 async def analyze_audio(file: UploadFile = File(...)):
     try:
         # Guardar el archivo temporalmente
         with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            content = await file.read()
-            tmp.write(content)
             tmp_path = tmp.name
+        try:
+            await ingest_upload(file, tmp_path)
+        except HTTPException:
+            os.remove(tmp_path)
+            raise
 
-        # Detectar offset, bpm y duración
-        offset = detect_offset(tmp_path)
-        bpm, duration = detect_bpm_and_duration(tmp_path)
-
-        # Eliminar archivo temporal
-        os.remove(tmp_path)
+        # Detectar offset, bpm y duración en el pool de análisis
+        try:
+            offset, bpm, duration = await analysis_pool.run(analyze_offset_and_bpm, tmp_path)
+        finally:
+            # Eliminar archivo temporal
+            os.remove(tmp_path)
 
         print(f"RESULTADO FINAL: offset={offset}, bpm={bpm}, duration={duration}")
         
@@ -1069,6 +964,10 @@ async def analyze_audio(file: UploadFile = File(...)):
             "duration": duration
         }
 
+    except AnalysisTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error analyzing audio: {e}")
         raise HTTPException(status_code=500, detail=f"Error analyzing audio: {str(e)}")
@@ -1080,24 +979,15 @@ async def analyze_key_endpoint(file: UploadFile = File(...)):
         temp_path = f"temp_analysis/{file.filename}"
         os.makedirs("temp_analysis", exist_ok=True)
         
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        await ingest_upload(file, temp_path)
         
-        from chord_analyzer import ChordAnalyzer
-        analyzer = ChordAnalyzer()
-        key_result = analyzer.analyze_key(temp_path)
-        
-        os.remove(temp_path)
+        try:
+            key_data = await analysis_pool.run(analyze_key_file, temp_path)
+        finally:
+            os.remove(temp_path)
         
-        if key_result:
-            return {
-                "success": True,
-                "key": key_result.key,
-                "mode": key_result.mode,
-                "confidence": float(key_result.confidence),
-                "tonic": key_result.tonic
-            }
+        if key_data:
+            return {"success": True, **key_data}
         else:
             return {"success": False, "error": "No se pudo detectar la tonalidad"}
             
@@ -1108,137 +998,175 @@ async def analyze_key_endpoint(file: UploadFile = File(...)):
 async def convert_to_mp3(audio_file: UploadFile = File(...)):
     """Convierte un archivo de audio a MP3"""
     try:
-        import tempfile
-        from pydub import AudioSegment
-        
-        # Guardar archivo temporal
+        # Guardar archivo temporal (el hash se calcula mientras se escribe)
         with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_input:
-            content = await audio_file.read()
-            tmp_input.write(content)
-            tmp_input_path = tmp_input.name
-        
-        # Convertir a MP3
-        audio = AudioSegment.from_file(tmp_input_path)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_output:
-            tmp_output_path = tmp_output.name
-        
-        audio.export(tmp_output_path, format="mp3", bitrate="320k")
-        
-        # Leer el archivo MP3
-        with open(tmp_output_path, "rb") as f:
-            mp3_data = f.read()
-        
-        # Limpiar archivos temporales
-        os.remove(tmp_input_path)
-        os.remove(tmp_output_path)
+            tmp_input_path = Path(tmp_input.name)
+        try:
+            ingested = await ingest_upload(audio_file, tmp_input_path)
+        except Exception:
+            tmp_input_path.unlink(missing_ok=True)
+            raise
         
-        # Retornar el MP3
-        from fastapi.responses import Response
-        return Response(
-            content=mp3_data,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": f'attachment; filename="{audio_file.filename.replace(".wav", ".mp3")}"'
-            }
+        # Convertir a MP3 en streaming (o servirlo de la caché de renditions)
+        return await transcoder.response(
+            tmp_input_path,
+            audio_file.filename.replace(".wav", ".mp3"),
+            "mp3", "320k",
+            content_hash=ingested.content_hash,
+            cleanup=tmp_input_path
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error converting to MP3: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def extract_with_ytdlp(youtube_url: str, video_id: str):
-    """Extraer audio usando yt-dlp"""
+async def extract_with_ytdlp(youtube_url: str, video_id: str) -> YouTubeAudio:
+    """Extraer audio usando yt-dlp (una sola invocación asíncrona; se guarda en youtube_store)"""
+    import re
+    
+    staged = youtube_store.staging_path(video_id)
+    output_file = None
+    
+    def on_progress(percent: float):
+        youtube_store.progress[video_id] = percent
+    
     try:
-        import subprocess
-        import base64
-        import re
-        
         print(f"[yt-dlp] Descargando audio de: {youtube_url}")
+        youtube_store.progress[video_id] = 0.0
+        result = await ytdlp.extract_audio(youtube_url, f"{staged.with_suffix('')}.%(ext)s", "mp3", on_progress)
+        output_file = result.path
         
-        # Crear directorio temporal
-        temp_dir = Path("temp_youtube")
-        temp_dir.mkdir(exist_ok=True)
-        
-        # Primero obtener el título real del video
-        print(f"[yt-dlp] Obteniendo título del video...")
-        title_cmd = [
-            "yt-dlp",
-            "--get-title",
-            youtube_url
-        ]
-        
-        title_result = subprocess.run(title_cmd, capture_output=True, text=True, timeout=30)
-        
-        if title_result.returncode == 0 and title_result.stdout.strip():
-            video_title = title_result.stdout.strip()
-            # Limpiar caracteres no válidos para nombre de archivo
-            video_title = re.sub(r'[<>:"/\\|?*]', '_', video_title)
-            print(f"[yt-dlp] Título del video: {video_title}")
-        else:
-            video_title = video_id
-            print(f"[yt-dlp] No se pudo obtener título, usando video_id: {video_id}")
-        
-        output_file = temp_dir / f"{video_id}.mp3"
-        
-        # Comando yt-dlp para descargar solo audio
-        cmd = [
-            "yt-dlp",
-            "-x",  # Extract audio
-            "--audio-format", "mp3",
-            "--audio-quality", "0",  # Best quality
-            "-o", str(output_file),
-            youtube_url
-        ]
-        
-        print(f"[yt-dlp] Ejecutando: {' '.join(cmd)}")
-        
-        # Ejecutar yt-dlp
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        
-        if result.returncode != 0:
-            print(f"[yt-dlp] Error: {result.stderr}")
-            raise HTTPException(status_code=500, detail=f"yt-dlp error: {result.stderr}")
+        # Limpiar caracteres no válidos para nombre de archivo
+        video_title = re.sub(r'[<>:"/\\|?*]', '_', result.title) if result.title else video_id
+        print(f"[yt-dlp] Descarga completada: {output_file} ({video_title})")
         
-        print(f"[yt-dlp] Descarga completada: {output_file}")
+        return await youtube_store.commit(video_id, output_file, video_title)
         
-        # Leer el archivo
-        with open(output_file, 'rb') as f:
-            audio_data = f.read()
-        
-        # Limpiar archivo temporal
-        output_file.unlink(missing_ok=True)
+    except YtDlpError as e:
+        print(f"[yt-dlp] Error: {e}")
+        raise HTTPException(status_code=500, detail=f"yt-dlp error: {e}")
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="yt-dlp no está instalado. Instálalo con: pip install yt-dlp")
+    finally:
+        youtube_store.progress.pop(video_id, None)
+        if output_file is not None:
+            output_file.unlink(missing_ok=True)
+
+async def extract_with_rapidapi(video_id: str, rapidapi_key: str) -> YouTubeAudio:
+    """Extraer audio usando RapidAPI (el MP3 se descarga directo a youtube_store)"""
+    # Llamar a RapidAPI
+    async with http_client.session.get(
+        'https://youtube-mp36.p.rapidapi.com/dl',
+        params={'id': video_id},
+        headers={
+            'x-rapidapi-key': rapidapi_key,
+            'x-rapidapi-host': 'youtube-mp36.p.rapidapi.com'
+        },
+        timeout=_request_timeout(60)
+    ) as response:
+        if response.status != 200:
+            print(f"[YouTube API] Error: {response.status} - {await response.text()}")
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Error al obtener audio: {response.status}"
+            )
         
-        # Convertir a base64
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        result = await response.json(content_type=None)
+    print(f"[YouTube API] Respuesta: {result}")
+    
+    if result.get('status') != 'ok':
+        raise HTTPException(status_code=400, detail="No se pudo procesar el video")
+    
+    # Descargar el MP3
+    mp3_url = result.get('link')
+    video_title = result.get('title', 'video')
+    
+    if not mp3_url:
+        raise HTTPException(status_code=500, detail="No se obtuvo el link de descarga")
+    
+    print(f"[YouTube API] Descargando MP3: {mp3_url}")
+    
+    # Descargar el archivo con timeout largo y reintentos (en streaming a disco)
+    max_retries = 3
+    staged = youtube_store.staging_path(video_id)
+    
+    try:
+        for attempt in range(max_retries):
+            try:
+                print(f"[YouTube API] Intento {attempt + 1}/{max_retries}")
+                
+                # Timeout de 120 segundos para archivos grandes
+                size = await http_client.download_to_file(
+                    mp3_url,
+                    staged,
+                    timeout=120,
+                    headers={
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                        'Accept': '*/*',
+                        'Referer': 'https://youtube-mp36.p.rapidapi.com/'
+                    }
+                )
+                if size:
+                    print(f"[YouTube API] Descarga exitosa: {size} bytes")
+                    break
+                print("[YouTube API] Error en descarga: respuesta vacía")
+                
+            except Exception as e:
+                print(f"[YouTube API] Error en intento {attempt + 1}: {e}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(2)  # Esperar 2 segundos antes de reintentar
+        else:
+            raise HTTPException(status_code=500, detail="No se pudo descargar el audio después de varios intentos")
         
+        entry = await youtube_store.commit(video_id, staged, video_title)
+        print(f"[YouTube API] Audio descargado: {video_title} ({entry.size} bytes)")
+        return entry
+    finally:
+        staged.unlink(missing_ok=True)
+
+async def youtube_payload(entry: YouTubeAudio, mode: str, cached: bool) -> Dict:
+    """Respuesta de /youtube-extract: handle + URL del audio, o el audio en base64 (modo por defecto)"""
+    if mode == "handle":
         return {
             "success": True,
-            "title": video_title,
-            "duration": 0,
-            "audioData": audio_base64,
-            "format": "mp3"
+            "title": entry.title,
+            "duration": 0,  # RapidAPI no retorna duración
+            "handle": entry.video_id,
+            "audioUrl": f"/youtube-audio/{entry.video_id}",
+            "size": entry.size,
+            "format": "mp3",
+            "cached": cached
         }
-        
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="Timeout descargando de YouTube")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="yt-dlp no está instalado. Instálalo con: pip install yt-dlp")
-    except Exception as e:
-        print(f"[yt-dlp] Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Retornar el audio como base64 (clientes que aún no usan el handle)
+    import base64
+    audio_data = await asyncio.to_thread(entry.path.read_bytes)
+    return {
+        "success": True,
+        "title": entry.title,
+        "duration": 0,  # RapidAPI no retorna duración
+        "audioData": base64.b64encode(audio_data).decode('utf-8'),
+        "format": "mp3",
+        "handle": entry.video_id
+    }
 
 @app.post("/youtube-extract")
 async def extract_youtube_audio(request: Request):
     """
-    Extrae audio de un video de YouTube usando RapidAPI o yt-dlp
+    Extrae audio de un video de YouTube usando RapidAPI o yt-dlp.
+    
+    Con ``"mode": "handle"`` el audio queda en el servidor y se devuelve un handle
+    (ver /youtube-audio/{handle} y /api/separate-youtube) en lugar del base64.
     """
     try:
-        import httpx
         import re
         
         data = await request.json()
         youtube_url = data.get("url")
+        mode = data.get("mode", "base64")
         
         if not youtube_url:
             raise HTTPException(status_code=400, detail="URL de YouTube requerida")
@@ -1253,97 +1181,23 @@ async def extract_youtube_audio(request: Request):
         video_id = video_id_match.group(1)
         print(f"[YouTube API] Video ID: {video_id}")
         
-        # Obtener API key de variable de entorno o usar la key por defecto
-        rapidapi_key = os.getenv('RAPIDAPI_KEY', 'e705150786msh8476429dbbcccc4p158049jsn4c2e3e6a6d4f')
-        if not rapidapi_key:
-            # Fallback: usar yt-dlp directamente
-            print("[YouTube API] No RAPIDAPI_KEY found, usando yt-dlp")
-            return await extract_with_ytdlp(youtube_url, video_id)
-        
-        # Llamar a RapidAPI
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(
-                'https://youtube-mp36.p.rapidapi.com/dl',
-                params={'id': video_id},
-                headers={
-                    'x-rapidapi-key': rapidapi_key,
-                    'x-rapidapi-host': 'youtube-mp36.p.rapidapi.com'
-                }
-            )
-            
-            if response.status_code != 200:
-                print(f"[YouTube API] Error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Error al obtener audio: {response.status_code}"
-                )
-            
-            result = response.json()
-            print(f"[YouTube API] Respuesta: {result}")
-            
-            if result.get('status') != 'ok':
-                raise HTTPException(status_code=400, detail="No se pudo procesar el video")
-            
-            # Descargar el MP3
-            mp3_url = result.get('link')
-            video_title = result.get('title', 'video')
-            
-            if not mp3_url:
-                raise HTTPException(status_code=500, detail="No se obtuvo el link de descarga")
-            
-            print(f"[YouTube API] Descargando MP3: {mp3_url}")
-            
-            # Descargar el archivo con timeout largo y reintentos
-            max_retries = 3
-            audio_data = None
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"[YouTube API] Intento {attempt + 1}/{max_retries}")
-                    
-                    # Timeout de 120 segundos para archivos grandes
-                    download_client = httpx.AsyncClient(timeout=120.0, follow_redirects=True)
-                    mp3_response = await download_client.get(
-                        mp3_url,
-                        headers={
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                            'Accept': '*/*',
-                            'Referer': 'https://youtube-mp36.p.rapidapi.com/'
-                        }
-                    )
-                    await download_client.aclose()
-                    
-                    print(f"[YouTube API] Status code: {mp3_response.status_code}")
-                    
-                    if mp3_response.status_code == 200:
-                        audio_data = mp3_response.content
-                        print(f"[YouTube API] Descarga exitosa: {len(audio_data)} bytes")
-                        break
-                    else:
-                        print(f"[YouTube API] Error en descarga: {mp3_response.status_code} - {mp3_response.text[:200]}")
-                        
-                except Exception as e:
-                    print(f"[YouTube API] Error en intento {attempt + 1}: {e}")
-                    if attempt == max_retries - 1:
-                        raise
-                    await asyncio.sleep(2)  # Esperar 2 segundos antes de reintentar
-            
-            if not audio_data:
-                raise HTTPException(status_code=500, detail="No se pudo descargar el audio después de varios intentos")
-            
-            print(f"[YouTube API] Audio descargado: {video_title} ({len(audio_data)} bytes)")
-            
-            # Retornar el audio como base64
-            import base64
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            return {
-                "success": True,
-                "title": video_title,
-                "duration": 0,  # RapidAPI no retorna duración
-                "audioData": audio_base64,
-                "format": "mp3"
-            }
+        # Un mismo video se descarga una sola vez (requests concurrentes esperan al primero)
+        async with youtube_store.lock(video_id):
+            entry = youtube_store.get(video_id)
+            cached = entry is not None
+            if cached:
+                print(f"[YouTube API] Cache hit: {entry.title} ({entry.size} bytes)")
+            else:
+                # Obtener API key de variable de entorno o usar la key por defecto
+                rapidapi_key = os.getenv('RAPIDAPI_KEY', 'e705150786msh8476429dbbcccc4p158049jsn4c2e3e6a6d4f')
+                if not rapidapi_key:
+                    # Fallback: usar yt-dlp directamente
+                    print("[YouTube API] No RAPIDAPI_KEY found, usando yt-dlp")
+                    entry = await extract_with_ytdlp(youtube_url, video_id)
+                else:
+                    entry = await extract_with_rapidapi(video_id, rapidapi_key)
+        
+        return await youtube_payload(entry, mode, cached)
     
     except HTTPException:
         raise
@@ -1353,91 +1207,271 @@ async def extract_youtube_audio(request: Request):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.get("/youtube-extract/{video_id}/progress")
+async def youtube_extract_progress(video_id: str):
+    """Progreso (0-100) de una extracción con yt-dlp en curso"""
+    if youtube_store.get(video_id) is not None:
+        return {"video_id": video_id, "status": "completed", "progress": 100}
+    if video_id in youtube_store.progress:
+        return {"video_id": video_id, "status": "processing", "progress": youtube_store.progress[video_id]}
+    raise HTTPException(status_code=404, detail="No extraction in progress for this video")
+
+@app.get("/youtube-audio/{handle}")
+async def serve_youtube_audio(handle: str, request: Request):
+    """Audio de un handle de /youtube-extract (bytes crudos, con Range)"""
+    entry = youtube_store.get(handle)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="YouTube audio not found")
+    return file_response(entry.path, request.headers.get("range"), "audio/mpeg",
+                         {"Content-Disposition": f'inline; filename="{handle}.mp3"'})
+
+def parse_semitones(value, allow_zero: bool = False) -> float:
+    try:
+        semitones = float(value or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="semitones debe ser un número")
+    if semitones == 0 and not allow_zero:
+        raise HTTPException(status_code=400, detail="semitones debe ser != 0")
+    if abs(semitones) > PITCH_MAX_SEMITONES:
+        raise HTTPException(status_code=400, detail=f"semitones debe estar entre -{PITCH_MAX_SEMITONES:g} y {PITCH_MAX_SEMITONES:g}")
+    return semitones
+
+def parse_rate(value) -> float:
+    try:
+        rate = float(value or 1)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="rate debe ser un número")
+    if not TIME_STRETCH_MIN_RATE <= rate <= TIME_STRETCH_MAX_RATE:
+        raise HTTPException(status_code=400, detail=f"rate debe estar entre {TIME_STRETCH_MIN_RATE:g} y {TIME_STRETCH_MAX_RATE:g}")
+    return rate
+
+async def pitch_shift_rendition(audio_url: str, semitones: float, rate: float = 1.0, source: Optional[Path] = None):
+    """Rendition de ``audio_url`` transpuesta y/o con otro tempo (de la caché o renderizada en el pool)"""
+    try:
+        if source is not None:
+            content_hash = await transcoder.source_hash(source)
+        else:
+            source, content_hash = await rendition_service.source_for_url(audio_url)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Error descargando audio")
+    if rate == 1.0:
+        # Solo las transposiciones alimentan el precálculo
+        rendition_service.record(content_hash, source, semitones)
+    rendition, hit = await rendition_service.render(source, content_hash, semitones, rate)
+    return rendition_service.key(content_hash, semitones, rate), rendition, hit
+
+def derived_analysis(task: ProcessingTask, semitones: float, rate: float = 1.0) -> Dict:
+    """Análisis de la rendition calculado desde el de la tarea original (microsegundos, sin decodificar)"""
+    return transform_analysis({field: getattr(task, field, None) for field in ANALYSIS_FIELDS}, semitones, rate)
+
+async def analysis_task_for(task_id: Optional[str], audio_urls: List[str]) -> Optional[ProcessingTask]:
+    """Tarea cuyo análisis vale para las pistas: ``taskId`` del request o la de sus URLs /audio/{task_id}/..."""
+    if not task_id:
+        task_ids = {audio_index.task_id_for_url(url) for url in audio_urls}
+        task_id = task_ids.pop() if len(task_ids) == 1 else None
+    if not task_id:
+        return None
+    task = await get_task_status(task_id)
+    if task is None or not (getattr(task, "chords", None) or getattr(task, "key", None)):
+        return None
+    return task
+
+def analysis_url(task: ProcessingTask, semitones: float, rate: float = 1.0) -> str:
+    return f"/api/chord-analysis/{task.id}?semitones={semitones:g}&rate={rate:g}"
+
 @app.post("/pitch-shift")
 async def pitch_shift_audio(request: Request):
     """
     Endpoint para cambiar el pitch (tono) de un audio sin cambiar el tempo.
-    Usa pyrubberband para procesamiento de alta calidad.
+    Usa pyrubberband si está instalado y si no un phase vocoder (numpy/librosa);
+    las versiones transpuestas se guardan en caché.
     """
     try:
         data = await request.json()
         audio_url = data.get('audioUrl')
-        semitones = data.get('semitones', 0)
         
         if not audio_url:
             raise HTTPException(status_code=400, detail="audioUrl requerido")
         
-        if semitones == 0:
-            raise HTTPException(status_code=400, detail="semitones debe ser != 0")
+        semitones = parse_semitones(data.get('semitones', 0))
         
-        print(f"[PITCH SHIFT] URL: {audio_url}, Semitonos: {semitones}")
+        print(f"[PITCH SHIFT] URL: {audio_url}, Semitonos: {semitones:+g}")
         
-        # Importar pyrubberband
-        try:
-            import pyrubberband as pyrb
-            import soundfile as sf
-        except ImportError:
-            raise HTTPException(
-                status_code=501, 
-                detail="Pitch shift no disponible en este servidor. pyrubberband no está instalado debido a incompatibilidad con Python 3.12."
-            )
+        _, rendition, hit = await pitch_shift_rendition(audio_url, semitones)
+        print(f"[PITCH SHIFT] {'Cache hit' if hit else 'Procesamiento completado'}: {rendition}")
         
-        # Descargar audio
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get(audio_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Error descargando audio")
-            
-            audio_data = response.content
+        headers = {
+            "Content-Disposition": f"attachment; filename=pitch_shifted_{semitones:g}st.wav",
+            "X-Rendition-Cache": "hit" if hit else "miss"
+        }
+        # Key y acordes transpuestos sin volver a analizar el audio
+        task = await analysis_task_for(data.get('taskId'), [audio_url])
+        if task is not None:
+            analysis = derived_analysis(task, semitones)
+            headers["X-Analysis-Url"] = analysis_url(task, semitones)
+            if isinstance(analysis["key"], str):
+                headers["X-Analysis-Key"] = analysis["key"]
         
-        # Guardar temporalmente
-        temp_dir = Path("temp_pitch")
-        temp_dir.mkdir(exist_ok=True)
+        # Devolver audio procesado
+        return file_response(rendition, request.headers.get("range"), "audio/wav", headers)
         
-        temp_input = temp_dir / f"input_{uuid.uuid4()}.wav"
-        temp_output = temp_dir / f"output_{uuid.uuid4()}.wav"
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[PITCH SHIFT] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/pitch-shift/batch")
+async def pitch_shift_batch(request: Request):
+    """
+    Transpone varias pistas (p. ej. todos los stems de una canción) en paralelo.
+    Devuelve la URL de cada rendition en /renditions/{key}.
+    """
+    try:
+        data = await request.json()
+        audio_urls = data.get('audioUrls') or []
         
-        with open(temp_input, 'wb') as f:
-            f.write(audio_data)
+        if not audio_urls:
+            raise HTTPException(status_code=400, detail="audioUrls requerido")
         
-        # Cargar audio
-        y, sr = librosa.load(str(temp_input), sr=None, mono=False)
-        print(f"[PITCH SHIFT] Audio cargado: {y.shape}, SR: {sr}")
+        semitones = parse_semitones(data.get('semitones', 0))
         
-        # Aplicar pitch shift SIN cambiar tempo
-        print(f"[PITCH SHIFT] Procesando con pyrubberband...")
-        y_shifted = pyrb.pitch_shift(y, sr, n_steps=semitones)
-        print(f"[PITCH SHIFT] Procesamiento completado")
+        print(f"[PITCH SHIFT] Batch de {len(audio_urls)} pistas, Semitonos: {semitones:+g}")
+        results = await asyncio.gather(*(pitch_shift_rendition(url, semitones) for url in audio_urls))
+        task = await analysis_task_for(data.get('taskId'), audio_urls)
         
-        # Guardar resultado
-        sf.write(str(temp_output), y_shifted.T if len(y_shifted.shape) > 1 else y_shifted, sr)
+        return {
+            "success": True,
+            "semitones": semitones,
+            "renditions": {
+                url: f"/renditions/{key}" for url, (key, _, _) in zip(audio_urls, results)
+            },
+            "cached": sum(1 for _, _, hit in results if hit),
+            "analysis": derived_analysis(task, semitones) if task is not None else None
+        }
         
-        # Leer archivo procesado
-        with open(temp_output, 'rb') as f:
-            processed_data = f.read()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[PITCH SHIFT] Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/time-stretch")
+async def time_stretch_audio(request: Request):
+    """
+    Cambia el tempo (p. ej. ``rate: 0.8`` para ensayar al 80%) sin cambiar el tono,
+    opcionalmente transponiendo a la vez (``semitones``) en una sola pasada.
+    
+    - ``audioUrl``: devuelve el WAV de esa pista; como en /pitch-shift, ``taskId``
+      (opcional) solo indica de qué tarea tomar el análisis.
+    - ``taskId`` sin ``audioUrl``: renderiza todos los stems de la tarea en paralelo
+      y responde en streaming (NDJSON) una línea por stem en cuanto está listo, con
+      su URL en /renditions/{key}.
+    """
+    try:
+        data = await request.json()
+        audio_url = data.get('audioUrl')
+        task_id = data.get('taskId') or data.get('task_id')
+        rate = parse_rate(data.get('rate', 1))
+        semitones = parse_semitones(data.get('semitones', 0), allow_zero=True)
+        
+        if rate == 1.0 and semitones == 0:
+            raise HTTPException(status_code=400, detail="rate o semitones deben cambiar el audio")
+        if not audio_url and not task_id:
+            raise HTTPException(status_code=400, detail="audioUrl o taskId requerido")
+        
+        print(f"[TIME STRETCH] {audio_url or 'Task ' + task_id}: x{rate:g}, {semitones:+g} st")
+        
+        if audio_url:
+            _, rendition, hit = await pitch_shift_rendition(audio_url, semitones, rate)
+            headers = {
+                "Content-Disposition": f"attachment; filename=time_stretched_{rate:g}x.wav",
+                "X-Rendition-Cache": "hit" if hit else "miss"
+            }
+            task = await analysis_task_for(task_id, [audio_url])
+            if task is not None:
+                analysis = derived_analysis(task, semitones, rate)
+                headers["X-Analysis-Url"] = analysis_url(task, semitones, rate)
+                if isinstance(analysis["key"], str):
+                    headers["X-Analysis-Key"] = analysis["key"]
+                if analysis["bpm"]:
+                    headers["X-Analysis-Bpm"] = f"{analysis['bpm']:g}"
+            return file_response(rendition, request.headers.get("range"), "audio/wav", headers)
+        
+        task = await get_task_status(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        stems = task.stems or getattr(task, "availableStems", None) or {}
+        if not stems:
+            raise HTTPException(status_code=409, detail="La tarea todavía no tiene stems")
+        
+        async def render_stem(stem_name: str, stem_url: str):
+            # Mismo camino que /pitch-shift; el stem local de la tarea evita descargarlo de B2
+            try:
+                local = await asyncio.to_thread(audio_index.resolve, f"{task_id}/{stem_name}.wav")
+                key, _, hit = await pitch_shift_rendition(stem_url, semitones, rate, source=local)
+                return {"stem": stem_name, "url": f"/renditions/{key}", "cached": hit}
+            except Exception as e:
+                print(f"[TIME STRETCH] Error en stem {stem_name}: {e}")
+                return {"stem": stem_name, "error": getattr(e, "detail", str(e))}
         
-        # Limpiar archivos temporales
-        temp_input.unlink(missing_ok=True)
-        temp_output.unlink(missing_ok=True)
+        async def results():
+            pending = [asyncio.create_task(render_stem(name, url)) for name, url in stems.items()]
+            try:
+                for done in asyncio.as_completed(pending):
+                    yield json.dumps(await done) + "\n"
+                # BPM, tiempos de acordes y key de la versión nueva, derivados del análisis original
+                yield json.dumps({"done": True, "rate": rate, "semitones": semitones,
+                                  "analysis": derived_analysis(task, semitones, rate)}) + "\n"
+            finally:
+                for pending_task in pending:
+                    pending_task.cancel()
         
-        # Devolver audio procesado
-        return StreamingResponse(
-            iter([processed_data]),
-            media_type="audio/wav",
-            headers={
-                "Content-Disposition": f"attachment; filename=pitch_shifted_{semitones}st.wav"
-            }
-        )
+        return StreamingResponse(results(), media_type="application/x-ndjson")
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[PITCH SHIFT] Error: {e}")
+        print(f"[TIME STRETCH] Error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/peaks/{task_id}/{stem_name}")
+async def get_waveform_peaks(task_id: str, stem_name: str, samples_per_pixel: int = 0, format: str = "json"):
+    """
+    Picos de la forma de onda de un stem (formato de audiowaveform) para dibujarla
+    antes de descargar el audio. ``samples_per_pixel`` elige el nivel de zoom (por
+    defecto el más compacto); ``format=dat`` devuelve el binario.
+    """
+    stem_path = await asyncio.to_thread(audio_index.resolve, f"{task_id}/{stem_name}.wav")
+    if stem_path is None:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    
+    path = waveform_peaks.level_for(stem_path, samples_per_pixel)
+    if path is None:
+        # Tareas anteriores a los picos: se generan ahora una sola vez
+        if not await asyncio.to_thread(waveform_peaks.ensure, stem_path):
+            raise HTTPException(status_code=404, detail="Peaks not available")
+        path = waveform_peaks.level_for(stem_path, samples_per_pixel)
+    
+    data = await asyncio.to_thread(path.read_bytes)
+    # Los stems de una tarea no cambian: caché larga en el navegador/CDN
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if format == "dat":
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+    return JSONResponse(content=waveform_peaks.to_json(data), headers=headers)
+
+@app.get("/renditions/{key}")
+async def serve_rendition(key: str, request: Request):
+    """Archivo de la caché de renditions (con Range)"""
+    path = rendition_service.get(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Rendition not found")
+    return file_response(path, request.headers.get("range"), "audio/wav")
+
 @app.post("/api/download-track")
 @app.post("/download-track")
 async def download_track(request: Request):
@@ -1466,56 +1500,26 @@ async def download_track(request: Request):
         
         print(f"[DOWNLOAD TRACK] Downloading: {track_name} from {track_url}")
         
-        # Si es una URL de B2, descargarla directamente
+        temp_input = None
         if track_url.startswith('http'):
-            import requests
-            response = requests.get(track_url, timeout=30)
-            response.raise_for_status()
-            audio_data = response.content
+            # URL de este backend: usar el archivo local; si no, descargarla (B2) a un temporal
+            source = await asyncio.to_thread(audio_index.local_path_for_url, track_url)
+            if source is None:
+                temp_input = Path(tempfile.gettempdir()) / f"download_input_{uuid.uuid4()}"
+                try:
+                    await http_client.download_to_file(track_url, temp_input, timeout=30)
+                except Exception:
+                    temp_input.unlink(missing_ok=True)
+                    raise
+                source = temp_input
         else:
             # Si es una ruta local
-            file_path = Path(track_url)
-            if not file_path.exists():
+            source = Path(track_url)
+            if not source.exists():
                 raise HTTPException(status_code=404, detail="File not found")
-            with open(file_path, 'rb') as f:
-                audio_data = f.read()
         
-        # Convertir a MP3 si es necesario
-        temp_input = Path(tempfile.gettempdir()) / f"download_input_{uuid.uuid4()}.wav"
-        temp_output = Path(tempfile.gettempdir()) / f"download_output_{uuid.uuid4()}.mp3"
-        
-        try:
-            # Guardar audio temporal
-            with open(temp_input, 'wb') as f:
-                f.write(audio_data)
-            
-            # Convertir a MP3 usando pydub
-            from pydub import AudioSegment
-            audio = AudioSegment.from_file(str(temp_input))
-            audio.export(str(temp_output), format='mp3', bitrate='320k')
-            
-            # Leer MP3 convertido
-            with open(temp_output, 'rb') as f:
-                mp3_data = f.read()
-            
-            # Limpiar archivos temporales
-            temp_input.unlink(missing_ok=True)
-            temp_output.unlink(missing_ok=True)
-            
-            # Devolver MP3
-            return StreamingResponse(
-                iter([mp3_data]),
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": f"attachment; filename={track_name}.mp3"
-                }
-            )
-            
-        except Exception as e:
-            # Limpiar en caso de error
-            temp_input.unlink(missing_ok=True)
-            temp_output.unlink(missing_ok=True)
-            raise
+        # MP3 en streaming mientras ffmpeg codifica (o directo de la caché si ya se convirtió)
+        return await transcoder.response(source, f"{track_name}.mp3", "mp3", "320k", cleanup=temp_input)
         
     except HTTPException:
         raise
@@ -0,0 +1,203 @@
+"""
+Renditions - Caché de versiones transpuestas / con otro tempo, con precálculo en segundo plano
+"""
+
+import os
+import heapq
+import asyncio
+import itertools
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from analysis_pool import analysis_pool, AnalysisPool
+from audio_index import audio_index
+from b2_cache import B2DiskCache
+from dsp import render_transform_file, resolve_backend, PITCH_SHIFT_BACKEND
+from http_client import http_client
+from job_queue import job_scheduler, JobScheduler
+from transcode import file_sha256, transcoder
+
+# Caché de renditions y precálculo (configurables por entorno)
+PITCH_CACHE_ENABLED = os.getenv("PITCH_CACHE_ENABLED", "true").lower() == "true"
+PITCH_CACHE_DIR = Path(os.getenv("PITCH_CACHE_DIR", "pitch_cache"))
+PITCH_CACHE_MAX_BYTES = int(os.getenv("PITCH_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+PITCH_MAX_SEMITONES = float(os.getenv("PITCH_MAX_SEMITONES", "12"))
+PITCH_PRECOMPUTE_ENABLED = os.getenv("PITCH_PRECOMPUTE_ENABLED", "true").lower() == "true"
+# Transposiciones habituales que se precalculan para cada pista pedida
+PITCH_PRECOMPUTE_SEMITONES = [float(s) for s in os.getenv("PITCH_PRECOMPUTE_SEMITONES", "-3,-2,-1,1,2,3").split(",") if s.strip()]
+PITCH_PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("PITCH_PRECOMPUTE_INTERVAL_SECONDS", "5"))
+PITCH_PRECOMPUTE_QUEUE_LIMIT = 10000
+# Timeout de un render en segundo plano (corre en su propio proceso: vencerlo no toca analysis_pool)
+PITCH_PRECOMPUTE_TIMEOUT = float(os.getenv("PITCH_PRECOMPUTE_TIMEOUT", "120"))
+# Pistas recordadas para el precálculo (orígenes y hashes de URLs externas, LRU)
+PITCH_PRECOMPUTE_SOURCES_LIMIT = int(os.getenv("PITCH_PRECOMPUTE_SOURCES_LIMIT", "1000"))
+# Rango de velocidades de /time-stretch (0.5 = mitad de tempo)
+TIME_STRETCH_MIN_RATE = float(os.getenv("TIME_STRETCH_MIN_RATE", "0.5"))
+TIME_STRETCH_MAX_RATE = float(os.getenv("TIME_STRETCH_MAX_RATE", "2.0"))
+
+
+def _remember(entries: OrderedDict, key, value):
+    entries[key] = value
+    entries.move_to_end(key)
+    while len(entries) > PITCH_PRECOMPUTE_SOURCES_LIMIT:
+        entries.popitem(last=False)
+
+
+class RenditionService:
+    """Renditions ``(hash del origen, semitonos, velocidad, backend)`` guardadas en una caché LRU en disco.
+
+    - Un miss se renderiza en ``analysis_pool``; varios stems pedidos a la vez se
+      renderizan en paralelo y el mismo rendition pedido dos veces se calcula una.
+    - Cada request suma demanda a su pista y a su transposición. Con el servidor
+      ocioso (sin renders en primer plano, sin separaciones en ``job_scheduler`` y
+      con procesos libres en ``analysis_pool``) se precalculan, de a uno, los
+      candidatos con más demanda: la transposición pedida y las habituales
+      (±1–3 semitonos) de cada pista que se ha transpuesto alguna vez.
+    - El precálculo usa su propio proceso (``background_pool``) con un timeout
+      corto: un render lento se mata sin reciclar el pool de los análisis de
+      usuarios. ``stop()`` lo cancela.
+    """
+
+    def __init__(self, cache: Optional[B2DiskCache] = None, pool: AnalysisPool = analysis_pool,
+                 backend: str = PITCH_SHIFT_BACKEND, scheduler: JobScheduler = job_scheduler):
+        self.cache = cache or B2DiskCache(PITCH_CACHE_DIR, PITCH_CACHE_MAX_BYTES,
+                                          PITCH_CACHE_ENABLED, label="PITCH CACHE")
+        self.pool = pool
+        self.background_pool = AnalysisPool(size=1, timeout=PITCH_PRECOMPUTE_TIMEOUT)
+        self.scheduler = scheduler
+        self.backend = resolve_backend(backend)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._foreground = 0
+        # Demanda y cola de precálculo (heap con prioridad negativa; entradas viejas se saltan)
+        self._sources: "OrderedDict[str, Path]" = OrderedDict()
+        self._url_hashes: "OrderedDict[str, str]" = OrderedDict()
+        self._demand: Counter = Counter()
+        self._source_demand: Counter = Counter()
+        self._offset_demand: Counter = Counter()
+        self._queue: List[Tuple[float, int, str, float]] = []
+        self._sequence = itertools.count()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def key(self, content_hash: str, semitones: float, rate: float = 1.0) -> str:
+        tempo = f"-rate{rate:g}" if rate != 1.0 else ""
+        return f"{content_hash}-pitch{semitones:+g}{tempo}-{self.backend}.wav"
+
+    def get(self, key: str) -> Optional[Path]:
+        return self.cache.get(key)
+
+    async def source_for_url(self, url: str) -> Tuple[Path, str]:
+        """Archivo local y hash de ``url`` (las URLs externas se descargan una sola vez)"""
+        local = await asyncio.to_thread(audio_index.local_path_for_url, url)
+        if local is not None:
+            return local, await transcoder.source_hash(local)
+
+        content_hash = self._url_hashes.get(url)
+        if content_hash:
+            self._url_hashes.move_to_end(url)
+            source = self.cache.get(f"{content_hash}-source")
+            if source is not None:
+                return source, content_hash
+
+        tmp_path = self.cache.tmp_path_for("download")
+        try:
+            await http_client.download_to_file(url, tmp_path)
+            content_hash = await asyncio.to_thread(file_sha256, tmp_path)
+            # El original descargado también se guarda (evictable) para poder precalcular
+            source = self.cache.adopt(f"{content_hash}-source", tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        _remember(self._url_hashes, url, content_hash)
+        return source, content_hash
+
+    async def _render(self, key: str, source: Path, semitones: float, rate: float, pool: AnalysisPool) -> Path:
+        tmp_path = self.cache.tmp_path_for(key)
+        try:
+            # Tono y tempo juntos en una sola pasada
+            await pool.run(render_transform_file, str(source), str(tmp_path), semitones, rate, self.backend)
+            return self.cache.adopt(key, tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+            self._inflight.pop(key, None)
+
+    async def render(self, source: Path, content_hash: str, semitones: float, rate: float = 1.0,
+                     background: bool = False) -> Tuple[Path, bool]:
+        """Rendition de ``source`` transpuesta ``semitones`` y a velocidad ``rate``; devuelve (ruta, hit de caché)"""
+        key = self.key(content_hash, semitones, rate)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        task = self._inflight.get(key)
+        if task is None:
+            print(f"[PITCH SHIFT] Rendering {content_hash[:12]} {semitones:+g} st x{rate:g} ({self.backend})"
+                  f"{' in background' if background else ''}")
+            pool = self.background_pool if background else self.pool
+            task = self._inflight[key] = asyncio.create_task(self._render(key, source, semitones, rate, pool))
+        if background:
+            return await task, False
+
+        self._foreground += 1
+        try:
+            # shield: si el cliente se va, el render termina igual y queda en caché
+            return await asyncio.shield(task), False
+        finally:
+            self._foreground -= 1
+
+    def record(self, content_hash: str, source: Path, semitones: float):
+        """Registra un request y encola sus candidatos de precálculo"""
+        _remember(self._sources, content_hash, source)
+        self._demand[(content_hash, semitones)] += 1
+        self._source_demand[content_hash] += 1
+        self._offset_demand[semitones] += 1
+        for offset in {semitones, *PITCH_PRECOMPUTE_SEMITONES}:
+            priority = (2 * self._demand[(content_hash, offset)] + self._offset_demand[offset]
+                        + self._source_demand[content_hash])
+            heapq.heappush(self._queue, (-priority, next(self._sequence), content_hash, offset))
+        if len(self._queue) > PITCH_PRECOMPUTE_QUEUE_LIMIT:
+            # Quedarse con la mitad más prioritaria
+            self._queue = heapq.nsmallest(PITCH_PRECOMPUTE_QUEUE_LIMIT // 2, self._queue)
+
+    async def precompute_once(self) -> Optional[str]:
+        """Renderiza el candidato pendiente con más demanda; devuelve su clave (o None)"""
+        while self._queue:
+            _, _, content_hash, semitones = heapq.heappop(self._queue)
+            key = self.key(content_hash, semitones)
+            source = self._sources.get(content_hash)
+            if key in self._inflight or self.cache.get(key) is not None:
+                continue
+            if source is None or not source.is_file():
+                continue
+            await self.render(source, content_hash, semitones, background=True)
+            return key
+        return None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(PITCH_PRECOMPUTE_INTERVAL_SECONDS)
+            if not self.idle:
+                continue
+            try:
+                await self.precompute_once()
+            except Exception as e:
+                print(f"[PITCH SHIFT] Precompute failed: {e}")
+
+    @property
+    def idle(self) -> bool:
+        """Nada de trabajo de usuarios con el que compita el precálculo"""
+        return (not self._foreground and not self._inflight and self.scheduler.idle
+                and self.pool.has_free_worker)
+
+    def start(self):
+        if PITCH_PRECOMPUTE_ENABLED and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        # El render en segundo plano en curso no tiene a quién devolverle nada
+        self.background_pool.shutdown(kill=True)
+
+# Global instance
+rendition_service = RenditionService()
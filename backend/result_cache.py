@@ -0,0 +1,163 @@
+"""
+Result Cache - Reutiliza stems y análisis de canciones ya procesadas (por hash de contenido)
+"""
+
+import os
+import json
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from database import SessionLocal, ResultCacheDB
+
+# Límites de la caché (configurables por entorno)
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+RESULT_CACHE_MAX_AGE_DAYS = float(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "30"))
+
+# Campos de ProcessingTask que se guardan y se restauran en un hit
+CACHED_FIELDS = ["stems", "bpm", "key", "timeSignature", "duration", "tempoCurve", "chords", "keyInfo", "peaks", "previews"]
+
+
+def cache_variant(separation_type: str, requested_tracks: Optional[List[str]] = None) -> str:
+    """Los stems dependen del tipo de separación y de los tracks pedidos"""
+    if separation_type == "custom" and requested_tracks:
+        return f"custom:{','.join(sorted(requested_tracks))}"
+    return separation_type
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, max_age_days: float = RESULT_CACHE_MAX_AGE_DAYS):
+        self.enabled = RESULT_CACHE_ENABLED
+        self.max_bytes = max_bytes
+        self.max_age = timedelta(days=max_age_days)
+
+    def _is_valid(self, entry: ResultCacheDB, result: Dict) -> bool:
+        # Si algún stem apunta a un archivo local servido por /audio, el workspace tiene que existir
+        stems = result.get("stems") or {}
+        if not stems:
+            return False
+        if any("/audio/" in url for url in stems.values()):
+            return bool(entry.workspace) and Path(entry.workspace).exists()
+        return True
+
+    def lookup(self, content_hash: str, variant: str) -> Optional[Dict]:
+        """Devuelve los resultados guardados para este contenido o None"""
+        if not self.enabled:
+            return None
+
+        db = SessionLocal()
+        try:
+            entry = db.get(ResultCacheDB, f"{content_hash}:{variant}")
+            if entry is None:
+                return None
+
+            result = json.loads(entry.result or "{}")
+            expired = datetime.utcnow() - entry.created_at > self.max_age
+            if expired or not self._is_valid(entry, result):
+                db.delete(entry)
+                db.commit()
+                return None
+
+            entry.last_accessed = datetime.utcnow()
+            entry.hits = (entry.hits or 0) + 1
+            db.commit()
+            result["source_task_id"] = entry.task_id
+            return result
+        finally:
+            db.close()
+
+    def store(self, content_hash: str, variant: str, task) -> None:
+        """Guarda los resultados de una tarea completada"""
+        if not self.enabled:
+            return
+
+        workspace = Path(task.file_path).parent
+        result = {field: getattr(task, field, None) for field in CACHED_FIELDS}
+        result["file_path"] = task.file_path
+
+        db = SessionLocal()
+        try:
+            db.merge(ResultCacheDB(
+                cache_key=f"{content_hash}:{variant}",
+                content_hash=content_hash,
+                variant=variant,
+                task_id=task.id,
+                workspace=str(workspace),
+                size_bytes=_dir_size(workspace),
+                result=json.dumps(result, default=str),
+                created_at=datetime.utcnow(),
+                last_accessed=datetime.utcnow(),
+                hits=0
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+        print(f"[CACHE] Stored results for {content_hash[:12]} ({variant})")
+        self.evict()
+
+    def evict(self) -> Dict[str, int]:
+        """Elimina entradas caducadas y, si se supera el tamaño, las menos usadas"""
+        removed, reclaimed = 0, 0
+        db = SessionLocal()
+        try:
+            entries = db.query(ResultCacheDB).order_by(ResultCacheDB.last_accessed.asc()).all()
+            total = sum(e.size_bytes or 0 for e in entries)
+            cutoff = datetime.utcnow() - self.max_age
+
+            for entry in entries:
+                if entry.created_at >= cutoff and total <= self.max_bytes:
+                    continue
+                # Otras variantes pueden compartir el mismo workspace
+                shared = any(o.workspace == entry.workspace and o.cache_key != entry.cache_key for o in entries)
+                if entry.workspace and not shared:
+                    shutil.rmtree(entry.workspace, ignore_errors=True)
+                total -= entry.size_bytes or 0
+                reclaimed += entry.size_bytes or 0
+                removed += 1
+                db.delete(entry)
+                entries = [o for o in entries if o.cache_key != entry.cache_key]
+            db.commit()
+        finally:
+            db.close()
+
+        if removed:
+            print(f"[CACHE] Evicted {removed} entries, reclaimed {reclaimed / 1024 ** 2:.1f} MB")
+        return {"removed": removed, "reclaimed_bytes": reclaimed}
+
+    def workspaces(self) -> Set[str]:
+        """Workspaces referenciados por alguna entrada (no se borran al expirar la tarea)"""
+        db = SessionLocal()
+        try:
+            return {row[0] for row in db.query(ResultCacheDB.workspace).all() if row[0]}
+        finally:
+            db.close()
+
+    def forget_workspace(self, workspace: str) -> int:
+        """Elimina las entradas que apuntan a un workspace que se va a borrar"""
+        target = Path(workspace).resolve()
+        db = SessionLocal()
+        try:
+            entries = [e for e in db.query(ResultCacheDB).all() if e.workspace and Path(e.workspace).resolve() == target]
+            for entry in entries:
+                db.delete(entry)
+            db.commit()
+            return len(entries)
+        finally:
+            db.close()
+
+# Global instance
+result_cache = ResultCache()
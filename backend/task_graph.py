@@ -0,0 +1,73 @@
+"""
+Task Graph - Ejecuta los pasos de una tarea según sus dependencias, en paralelo cuando se puede
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+
+class TaskGraph:
+    """Grafo de dependencias pequeño para el trabajo de una tarea.
+
+    Cada nodo es una corrutina que recibe como argumentos los resultados de
+    sus dependencias, en el orden declarado. Los nodos sin relación entre sí
+    corren a la vez; si uno falla se cancelan los que aún no terminaron.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.timings: Dict[str, float] = {}
+        self._nodes: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()):
+        if name in self._nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        self._nodes[name] = (func, tuple(deps))
+        return self
+
+    def _check(self):
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle at node: {name}")
+            if name not in self._nodes:
+                raise ValueError(f"Unknown dependency: {name}")
+            visiting.add(name)
+            for dep in self._nodes[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._nodes:
+            visit(name)
+
+    async def run(self) -> Dict[str, Any]:
+        """Ejecuta todos los nodos y devuelve {nombre: resultado}"""
+        self._check()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_node(name: str):
+            func, deps = self._nodes[name]
+            args = [await tasks[dep] for dep in deps]
+            start = time.perf_counter()
+            try:
+                return await func(*args)
+            finally:
+                self.timings[name] = round(time.perf_counter() - start, 3)
+
+        for name in self._nodes:
+            tasks[name] = asyncio.create_task(run_node(name), name=f"{self.name}:{name}")
+
+        try:
+            values = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return dict(zip(tasks.keys(), values))
@@ -0,0 +1,434 @@
+"""
+Task Store - Estado de las tareas persistente y compartido entre workers de uvicorn
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from database import SessionLocal, TaskDB
+from models import ProcessingTask, TaskStatus
+
+# Backend del store ("sql" usa DATABASE_URL; "memory" es el dict de antes, un solo worker)
+TASK_STORE_BACKEND = os.getenv("TASK_STORE", "sql").lower()
+# Cada cuánto se escriben en bloque los cambios de progreso pendientes
+TASK_STORE_FLUSH_INTERVAL = float(os.getenv("TASK_STORE_FLUSH_INTERVAL", "0.5"))
+# Cuánto tiempo se sirve desde memoria una tarea de otro worker antes de releerla
+TASK_STORE_READ_TTL = float(os.getenv("TASK_STORE_READ_TTL", "1.0"))
+# Lease de las tareas en curso: el dueño la renueva cada TASK_HEARTBEAT_INTERVAL y
+# cualquier worker marca como interrumpidas las que llevan TASK_LEASE_SECONDS sin renovar
+TASK_HEARTBEAT_INTERVAL = float(os.getenv("TASK_HEARTBEAT_INTERVAL", "15"))
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "60"))
+
+# Identifica a este proceso en esta ejecución (nuevo en cada arranque: en un contenedor
+# el servidor reiniciado suele tener el mismo hostname y el mismo PID)
+WORKER_ID = uuid.uuid4().hex
+
+TERMINAL_STATUSES = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value}
+
+
+class TaskSummary(NamedTuple):
+    """Lo que necesita el janitor de cada tarea, sin deserializar resultados"""
+    id: str
+    status: str
+    file_path: Optional[str]
+    created_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    last_accessed: Optional[datetime]
+
+
+def _status_value(status) -> str:
+    return status.value if isinstance(status, TaskStatus) else str(status)
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def task_to_row(task: ProcessingTask) -> Dict:
+    """Fila de TaskDB con las columnas básicas y el modelo completo en ``data``"""
+    # key/chords guardan a veces otros tipos que los declarados: no avisar al serializar
+    data = task.model_dump(mode="json", warnings=False)
+    return {
+        "id": task.id,
+        "original_filename": task.original_filename,
+        "file_path": task.file_path,
+        "separation_type": task.separation_type,
+        "status": _status_value(task.status),
+        "progress": task.progress,
+        "stems": json.dumps(task.stems) if task.stems is not None else None,
+        "error": task.error,
+        "created_at": task.created_at,
+        "completed_at": task.completed_at,
+        "data": json.dumps(data),
+        "updated_at": datetime.utcnow(),
+        "owner": WORKER_ID,
+    }
+
+
+def row_to_task(row: TaskDB) -> ProcessingTask:
+    if row.data:
+        data = json.loads(row.data)
+    else:
+        # Filas anteriores a la columna data
+        data = {
+            "id": row.id,
+            "original_filename": row.original_filename or "",
+            "file_path": row.file_path or "",
+            "separation_type": row.separation_type or "",
+            "progress": row.progress or 0,
+            "stems": json.loads(row.stems) if row.stems else None,
+            "error": row.error,
+            "created_at": row.created_at,
+            "completed_at": row.completed_at,
+        }
+    # Las columnas mandan sobre el JSON (p. ej. tras recuperar una tarea interrumpida)
+    data["status"] = TaskStatus(row.status or data.get("status") or TaskStatus.PENDING.value)
+    data["error"] = row.error
+    data["created_at"] = _parse_datetime(data.get("created_at")) or datetime.now()
+    data["completed_at"] = _parse_datetime(data.get("completed_at"))
+    # Sin validar: igual que en memoria, algunos campos guardan tipos distintos a los declarados
+    return ProcessingTask.model_construct(**data)
+
+
+class MemoryTaskStore(dict):
+    """El almacenamiento en memoria de siempre (solo vale con un worker)"""
+
+    def __init__(self):
+        super().__init__()
+        self._accessed: Dict[str, datetime] = {}
+
+    def touch(self, task_id: str):
+        """Registra que un cliente consultó la tarea"""
+        self._accessed[task_id] = datetime.now()
+
+    async def aget(self, task_id: str, default=None):
+        return self.get(task_id, default)
+
+    async def put(self, task_id: str, task: ProcessingTask):
+        self[task_id] = task
+
+    def pop(self, task_id: str, default=None):
+        self._accessed.pop(task_id, None)
+        return super().pop(task_id, default)
+
+    def summaries(self) -> List[TaskSummary]:
+        return [
+            TaskSummary(task.id, _status_value(task.status), task.file_path, task.created_at,
+                        task.completed_at, self._accessed.get(task_id))
+            for task_id, task in self.items()
+        ]
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def flush(self):
+        pass
+
+
+class SQLTaskStore:
+    """Tareas en la tabla ``tasks`` con caché de lectura y escritura diferida.
+
+    Se usa como el dict ``tasks_storage``: ``store[task_id] = task`` registra el
+    cambio y ``store.get(task_id)`` lo lee. Desde el event loop, ``await
+    store.put(...)`` (tareas nuevas) y ``await store.aget(...)`` (tareas de otros
+    workers) hacen en un hilo la escritura o lectura que no sale de memoria. Las tareas escritas por este proceso
+    se sirven siempre desde memoria (es el único que las modifica); las de
+    otros workers se releen de la base como mucho cada ``read_ttl`` segundos.
+
+    Los cambios de progreso se escriben en bloque cada ``flush_interval``; las
+    tareas nuevas se escriben antes de volver y los cambios de estado
+    despiertan al escritor, para que cualquier worker los vea al primer poll.
+    """
+
+    def __init__(self, flush_interval: float = TASK_STORE_FLUSH_INTERVAL, read_ttl: float = TASK_STORE_READ_TTL):
+        self.flush_interval = flush_interval
+        self.read_ttl = read_ttl
+        self._cache: Dict[str, Tuple[ProcessingTask, float]] = {}
+        self._owned: set = set()
+        self._dirty: set = set()
+        self._persisted_status: Dict[str, str] = {}
+        self._touched: Dict[str, datetime] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    # --- Interfaz tipo dict -------------------------------------------------
+
+    def _stage(self, task_id: str, task: ProcessingTask) -> Optional[Dict]:
+        """Registra el cambio en memoria; devuelve la fila a escribir ya si la tarea es nueva"""
+        self._cache[task_id] = (task, time.monotonic())
+        self._owned.add(task_id)
+        self._dirty.add(task_id)
+        persisted = self._persisted_status.get(task_id)
+        if persisted is None or self._flusher is None:
+            # Tarea nueva: escribirla ya, antes de devolver su id al cliente
+            self._dirty.discard(task_id)
+            return task_to_row(task)
+        if persisted != _status_value(task.status):
+            self._wake.set()
+        return None
+
+    def __setitem__(self, task_id: str, task: ProcessingTask):
+        row = self._stage(task_id, task)
+        if row is not None:
+            self._write_rows([row])
+            self._mark_flushed([task_id])
+
+    async def put(self, task_id: str, task: ProcessingTask):
+        """``store[task_id] = task`` sin bloquear el event loop con la escritura de una tarea nueva"""
+        row = self._stage(task_id, task)
+        if row is not None:
+            await asyncio.to_thread(self._write_rows, [row])
+            self._mark_flushed([task_id])
+
+    def _fresh(self, task_id: str) -> Optional[ProcessingTask]:
+        entry = self._cache.get(task_id)
+        if entry and (task_id in self._owned or time.monotonic() - entry[1] < self.read_ttl):
+            return entry[0]
+        return None
+
+    def _load(self, task_id: str) -> Optional[ProcessingTask]:
+        db = SessionLocal()
+        try:
+            row = db.get(TaskDB, task_id)
+            return row_to_task(row) if row is not None else None
+        finally:
+            db.close()
+
+    def _remember(self, task_id: str, task: Optional[ProcessingTask]):
+        if task_id in self._owned:
+            # La escribió este proceso mientras se leía: la de memoria es la buena
+            return
+        if task is None:
+            self._cache.pop(task_id, None)
+        else:
+            self._cache[task_id] = (task, time.monotonic())
+
+    def get(self, task_id: str, default=None) -> Optional[ProcessingTask]:
+        task = self._fresh(task_id)
+        if task is None:
+            task = self._load(task_id)
+            self._remember(task_id, task)
+        return task if task is not None else default
+
+    async def aget(self, task_id: str, default=None) -> Optional[ProcessingTask]:
+        """``get`` con la lectura de la base (tareas de otros workers) en un hilo"""
+        task = self._fresh(task_id)
+        if task is None:
+            task = await asyncio.to_thread(self._load, task_id)
+            self._remember(task_id, task)
+        return task if task is not None else default
+
+    def __getitem__(self, task_id: str) -> ProcessingTask:
+        task = self.get(task_id)
+        if task is None:
+            raise KeyError(task_id)
+        return task
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def pop(self, task_id: str, default=None) -> Optional[ProcessingTask]:
+        task = self.get(task_id, default)
+        self._cache.pop(task_id, None)
+        self._owned.discard(task_id)
+        self._dirty.discard(task_id)
+        self._persisted_status.pop(task_id, None)
+        self._touched.pop(task_id, None)
+        db = SessionLocal()
+        try:
+            db.query(TaskDB).filter(TaskDB.id == task_id).delete()
+            db.commit()
+        finally:
+            db.close()
+        return task
+
+    def keys(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            stored = [row[0] for row in db.query(TaskDB.id).all()]
+        finally:
+            db.close()
+        known = set(stored)
+        return stored + [task_id for task_id in self._owned if task_id not in known]
+
+    def items(self) -> Iterator[Tuple[str, ProcessingTask]]:
+        for task_id in self.keys():
+            task = self.get(task_id)
+            if task is not None:
+                yield task_id, task
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def touch(self, task_id: str):
+        """Registra que un cliente consultó la tarea (se escribe con el próximo flush)"""
+        self._touched[task_id] = datetime.now()
+
+    def summaries(self) -> List[TaskSummary]:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                TaskDB.id, TaskDB.status, TaskDB.file_path, TaskDB.created_at,
+                TaskDB.completed_at, TaskDB.last_accessed
+            ).all()
+        finally:
+            db.close()
+        return [
+            TaskSummary(row.id, row.status, row.file_path, row.created_at, row.completed_at,
+                        self._touched.get(row.id, row.last_accessed))
+            for row in rows
+        ]
+
+    # --- Escritura diferida -------------------------------------------------
+
+    def _write_rows(self, rows: List[Dict], touched: Optional[Dict[str, datetime]] = None):
+        db = SessionLocal()
+        try:
+            for row in rows:
+                db.merge(TaskDB(**row))
+            for task_id, accessed_at in (touched or {}).items():
+                db.query(TaskDB).filter(TaskDB.id == task_id).update(
+                    {TaskDB.last_accessed: accessed_at}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_flushed(self, task_ids: List[str]):
+        now = time.monotonic()
+        for task_id in task_ids:
+            entry = self._cache.get(task_id)
+            if entry is None:
+                continue
+            status = _status_value(entry[0].status)
+            self._persisted_status[task_id] = status
+            # Una tarea terminada ya no cambia: se relee de la base como las de otros workers
+            if status in TERMINAL_STATUSES and task_id not in self._dirty:
+                self._owned.discard(task_id)
+                self._cache[task_id] = (entry[0], now)
+
+    async def flush(self):
+        """Escribe en un solo commit todas las tareas modificadas y las consultas registradas"""
+        if not self._dirty and not self._touched:
+            return
+        task_ids = [task_id for task_id in self._dirty if task_id in self._cache]
+        self._dirty.clear()
+        touched, self._touched = self._touched, {}
+        # Serializar en el hilo del event loop: los objetos se siguen modificando aquí
+        rows = [task_to_row(self._cache[task_id][0]) for task_id in task_ids]
+        try:
+            await asyncio.to_thread(self._write_rows, rows, touched)
+        except Exception as e:
+            self._dirty.update(task_ids)
+            self._touched = {**touched, **self._touched}
+            print(f"[TASKS] Error flushing {len(rows)} task(s): {e}")
+            return
+        self._mark_flushed(task_ids)
+
+    def _prune_cache(self):
+        # Las tareas de otros workers (o ya terminadas) no se quedan en memoria
+        cutoff = time.monotonic() - max(self.read_ttl, 60.0)
+        for task_id, (_, loaded_at) in list(self._cache.items()):
+            if task_id not in self._owned and loaded_at < cutoff:
+                del self._cache[task_id]
+                self._persisted_status.pop(task_id, None)
+
+    async def _flush_loop(self):
+        next_heartbeat = time.monotonic() + TASK_HEARTBEAT_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            self._prune_cache()
+            if time.monotonic() >= next_heartbeat:
+                next_heartbeat = time.monotonic() + TASK_HEARTBEAT_INTERVAL
+                await self._heartbeat()
+
+    # --- Ciclo de vida ------------------------------------------------------
+
+    def _active_owned(self) -> List[str]:
+        return [
+            task_id for task_id in self._owned
+            if task_id in self._cache and _status_value(self._cache[task_id][0].status) not in TERMINAL_STATUSES
+        ]
+
+    def _renew_leases(self, task_ids: List[str]):
+        """Heartbeat: las tareas en curso de este proceso siguen vivas"""
+        if not task_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(TaskDB).filter(TaskDB.id.in_(task_ids), TaskDB.owner == WORKER_ID).update(
+                {TaskDB.updated_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _recover_interrupted(self) -> int:
+        """Marca como fallidas las tareas en curso cuyo dueño dejó de renovar el lease"""
+        cutoff = datetime.utcnow() - timedelta(seconds=TASK_LEASE_SECONDS)
+        db = SessionLocal()
+        try:
+            recovered = db.query(TaskDB).filter(
+                TaskDB.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value]),
+                (TaskDB.owner != WORKER_ID) | (TaskDB.owner.is_(None)),
+                (TaskDB.updated_at < cutoff) | (TaskDB.updated_at.is_(None))
+            ).update({
+                TaskDB.status: TaskStatus.FAILED.value,
+                TaskDB.error: "Processing interrupted by a server restart"
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        return recovered
+
+    async def _heartbeat(self):
+        try:
+            await asyncio.to_thread(self._renew_leases, self._active_owned())
+            recovered = await asyncio.to_thread(self._recover_interrupted)
+        except Exception as e:
+            print(f"[TASKS] Heartbeat error: {e}")
+            return
+        if recovered:
+            print(f"[TASKS] Marked {recovered} interrupted task(s) as failed")
+
+    async def start(self):
+        """Arranca la escritura diferida (llamar desde el evento de startup, tras init_db)"""
+        if self._flusher is not None:
+            return
+        recovered = await asyncio.to_thread(self._recover_interrupted)
+        if recovered:
+            print(f"[TASKS] Marked {recovered} interrupted task(s) as failed")
+        self._wake = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        print(f"[TASKS] SQL task store started (flush every {self.flush_interval}s)")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+def create_task_store():
+    if TASK_STORE_BACKEND == "memory":
+        return MemoryTaskStore()
+    return SQLTaskStore()
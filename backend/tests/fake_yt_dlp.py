@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+yt-dlp falso para los tests de ytdlp.py (sin red ni ffmpeg)
+
+Imita lo que la clase lee de yt-dlp: la línea ``--print before_dl:...`` con el
+título, líneas ``[download] NN.N%`` de progreso, la descarga ``.part`` que se
+renombra, la conversión a ``--audio-format`` y la línea ``--print after_move:...``
+con la ruta final. Variables de entorno:
+
+- ``FAKE_YTDLP_HANG``: segundos de espera después del progreso (para el timeout)
+- ``FAKE_YTDLP_PIDFILE``: archivo donde escribir el PID del proceso
+- ``FAKE_YTDLP_FAIL``: termina con error como un video no disponible
+"""
+
+import os
+import sys
+import time
+
+
+def main(argv):
+    prints, output, audio_format, url = [], "%(title)s.%(ext)s", "mp3", None
+    args = iter(argv)
+    for arg in args:
+        if arg == "--print":
+            prints.append(next(args))
+        elif arg == "-o":
+            output = next(args)
+        elif arg == "--audio-format":
+            audio_format = next(args)
+        elif arg == "--audio-quality":
+            next(args)
+        elif not arg.startswith("-"):
+            url = arg
+
+    if os.getenv("FAKE_YTDLP_PIDFILE"):
+        with open(os.environ["FAKE_YTDLP_PIDFILE"], "w") as f:
+            f.write(str(os.getpid()))
+    if os.getenv("FAKE_YTDLP_FAIL"):
+        print(f"ERROR: [youtube] {url}: Video unavailable", file=sys.stderr)
+        return 1
+
+    info = {"title": "Fake Song", "id": "fake123", "ext": "webm"}
+
+    def emit(when):
+        for template in prints:
+            stage, _, text = template.partition(":")
+            if stage == when:
+                print(text % info, flush=True)
+
+    print(f"[youtube] Extracting URL: {url}", flush=True)
+    emit("before_dl")
+    download = output % info
+    print(f"[download] Destination: {download}", flush=True)
+    with open(download + ".part", "wb") as f:
+        for percent in ("0.0", "12.5", "50.0", "100.0"):
+            f.write(b"\0" * 1024)
+            print(f"[download] {percent:>5}% of    4.00KiB at  1.00MiB/s ETA 00:00", flush=True)
+    time.sleep(float(os.getenv("FAKE_YTDLP_HANG", "0")))
+    os.replace(download + ".part", download)
+
+    # -x: convertir y borrar el original, como FFmpegExtractAudio
+    final = os.path.splitext(download)[0] + "." + audio_format
+    print(f"[ExtractAudio] Destination: {final}", flush=True)
+    with open(final, "wb") as f:
+        f.write(b"ID3" + b"\0" * 1024)
+    os.remove(download)
+    info["filepath"] = final
+    emit("after_move")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Tests de ytdlp.py contra tests/fake_yt_dlp.py (python -m pytest tests desde backend/)
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ytdlp import YtDlp, YtDlpError  # noqa: E402
+
+FAKE_YTDLP = str(Path(__file__).resolve().parent / "fake_yt_dlp.py")
+
+
+def extract(tmp_path, timeout=10.0, progress=None):
+    ytdlp = YtDlp(binary=FAKE_YTDLP, timeout=timeout)
+    return asyncio.run(ytdlp.extract_audio(
+        "https://www.youtube.com/watch?v=fake123", str(tmp_path / "%(id)s.%(ext)s"),
+        on_progress=progress.append if progress is not None else None
+    ))
+
+
+def test_progress_title_and_final_rename(tmp_path):
+    progress = []
+    result = extract(tmp_path, progress=progress)
+
+    assert progress == [0.0, 12.5, 50.0, 100.0]
+    assert result.title == "Fake Song"
+    # Ruta de after_move: el .mp3 convertido, no la descarga .webm/.part
+    assert result.path == tmp_path / "fake123.mp3"
+    assert result.path.read_bytes().startswith(b"ID3")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["fake123.mp3"]
+
+
+def test_timeout_kills_process(tmp_path, monkeypatch):
+    pidfile = tmp_path / "pid"
+    monkeypatch.setenv("FAKE_YTDLP_HANG", "30")
+    monkeypatch.setenv("FAKE_YTDLP_PIDFILE", str(pidfile))
+
+    with pytest.raises(YtDlpError, match="Timeout"):
+        extract(tmp_path, timeout=1.0)
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pidfile.read_text()), 0)
+    assert not (tmp_path / "fake123.mp3").exists()
+
+
+def test_failure_reports_stderr(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_FAIL", "1")
+
+    with pytest.raises(YtDlpError, match="Video unavailable"):
+        extract(tmp_path)
@@ -0,0 +1,220 @@
+"""
+Transcode - Transcodificación con ffmpeg en streaming y caché de renditions en disco
+"""
+
+import os
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from audio_serving import AUDIO_HEADERS, STREAM_CHUNK_SIZE, audio_media_type, file_response
+from b2_cache import B2DiskCache
+
+# Binario de ffmpeg, caché de renditions y límite de codificaciones simultáneas (configurables por entorno)
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+TRANSCODE_CACHE_ENABLED = os.getenv("TRANSCODE_CACHE_ENABLED", "true").lower() == "true"
+TRANSCODE_CACHE_DIR = Path(os.getenv("TRANSCODE_CACHE_DIR", "transcode_cache"))
+TRANSCODE_CACHE_MAX_BYTES = int(os.getenv("TRANSCODE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+TRANSCODE_MAX_CONCURRENCY = int(os.getenv("TRANSCODE_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+
+# Previews de los stems: "aac" (.m4a, lo reproduce cualquier navegador) u "opus" (.ogg, más chico)
+PREVIEW_ENABLED = os.getenv("PREVIEW_ENABLED", "true").lower() == "true"
+PREVIEW_CODEC = os.getenv("PREVIEW_CODEC", "aac")
+PREVIEW_BITRATE = os.getenv("PREVIEW_BITRATE", "64k")
+
+# Códec -> (extensión, argumentos de ffmpeg)
+PREVIEW_FORMATS = {
+    "aac": ("m4a", ["-c:a", "aac", "-movflags", "+faststart", "-f", "mp4"]),
+    "opus": ("ogg", ["-c:a", "libopus", "-f", "ogg"]),
+}
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class _Encoding:
+    """Salida de un ffmpeg en curso, compartida por los clientes que la están recibiendo"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def put(self, chunk: bytes):
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.chunks) or self.done)
+                new, finished = self.chunks[sent:], self.done
+            sent += len(new)
+            for chunk in new:
+                yield chunk
+            if finished and sent == len(self.chunks):
+                return
+
+
+class Transcoder:
+    """Sirve renditions (formato + bitrate) de un archivo de audio.
+
+    - Hit: el archivo ya codificado sale de la caché (con Range), sin CPU.
+    - Miss: la salida de ffmpeg se envía al cliente mientras se codifica y a la
+      vez se guarda en la caché; solo se publica si ffmpeg termina bien.
+      ffmpeg corre en su propia tarea a la velocidad del CPU: los clientes leen
+      de la salida en memoria, así que uno lento no retiene un lugar del límite
+      de codificaciones (y varios pedidos de la misma rendition comparten una).
+
+    La clave es el hash del contenido de origen, así que la misma pista pedida
+    desde otra URL o con otro nombre reutiliza la rendition.
+    """
+
+    def __init__(self, cache: Optional[B2DiskCache] = None, max_concurrency: int = TRANSCODE_MAX_CONCURRENCY):
+        self.cache = cache or B2DiskCache(TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_BYTES,
+                                          TRANSCODE_CACHE_ENABLED, label="TRANSCODE")
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._encodings: Dict[str, _Encoding] = {}
+        # (ruta, tamaño, mtime) -> hash, para no releer archivos locales en cada descarga
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+
+    async def source_hash(self, path: Path) -> str:
+        stat = path.stat()
+        memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime)
+        if memo_key not in self._hashes:
+            self._hashes[memo_key] = await asyncio.to_thread(file_sha256, path)
+        return self._hashes[memo_key]
+
+    @staticmethod
+    def cache_key(content_hash: str, fmt: str, bitrate: str) -> str:
+        return f"{content_hash}-{bitrate}.{fmt}"
+
+    async def _encode(self, source: Path, fmt: str, bitrate: str, key: str,
+                      cleanup: Optional[Path], encoding: _Encoding):
+        writer = None
+        process = None
+        try:
+            async with self._semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-i", str(source),
+                    "-vn", "-b:a", bitrate, "-f", fmt, "pipe:1",
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+                writer = self.cache.writer(key)
+                while chunk := await process.stdout.read(STREAM_CHUNK_SIZE):
+                    if writer is not None:
+                        await writer.write(chunk)
+                    await encoding.put(chunk)
+                stderr = await process.stderr.read()
+                if await process.wait() != 0:
+                    print(f"[TRANSCODE] ffmpeg failed for {source}: {stderr.decode(errors='ignore')[-500:]}")
+                elif writer is not None:
+                    await writer.commit()
+                    writer = None
+        except Exception as e:
+            print(f"[TRANSCODE] Error encoding {source}: {e}")
+        finally:
+            # Error o cancelación: no dejar ffmpeg corriendo ni una rendition incompleta
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            if writer is not None:
+                writer.abort()
+            if cleanup is not None:
+                cleanup.unlink(missing_ok=True)
+            self._encodings.pop(key, None)
+            await encoding.finish()
+
+    async def encode_file(self, source: Path, output: Path, args: List[str], bitrate: str) -> Path:
+        """Codifica ``source`` a ``output`` (se publica con un rename solo si ffmpeg termina bien)"""
+        tmp_path = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+        process = None
+        try:
+            async with self._semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-y", "-i", str(source),
+                    "-vn", "-b:a", bitrate, *args, str(tmp_path),
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+                stderr = await process.stderr.read()
+                if await process.wait() != 0:
+                    raise RuntimeError(f"ffmpeg failed for {source}: {stderr.decode(errors='ignore')[-500:]}")
+            os.replace(tmp_path, output)
+            return output
+        finally:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            tmp_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def preview_path_for(stem_path) -> Path:
+        stem_path = Path(stem_path)
+        extension, _ = PREVIEW_FORMATS[PREVIEW_CODEC]
+        return stem_path.parent / "previews" / f"{stem_path.stem}-preview.{extension}"
+
+    async def encode_preview(self, stem_path) -> Optional[Path]:
+        """Versión liviana de un stem para empezar a reproducir antes de tener el WAV completo"""
+        if not PREVIEW_ENABLED:
+            return None
+        if PREVIEW_CODEC not in PREVIEW_FORMATS:
+            raise ValueError(f"Unknown preview codec: {PREVIEW_CODEC}")
+        output = self.preview_path_for(stem_path)
+        if output.is_file():
+            return output
+        output.parent.mkdir(parents=True, exist_ok=True)
+        _, args = PREVIEW_FORMATS[PREVIEW_CODEC]
+        return await self.encode_file(Path(stem_path), output, args, PREVIEW_BITRATE)
+
+    async def response(self, source: Path, filename: str, fmt: str = "mp3", bitrate: str = "320k",
+                       content_hash: Optional[str] = None, range_header: Optional[str] = None,
+                       cleanup: Optional[Path] = None) -> StreamingResponse:
+        """Respuesta con la rendition de ``source``; ``cleanup`` se borra al terminar de usarlo"""
+        try:
+            content_hash = content_hash or await self.source_hash(source)
+        except Exception:
+            if cleanup is not None:
+                cleanup.unlink(missing_ok=True)
+            raise
+        key = self.cache_key(content_hash, fmt, bitrate)
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            if cleanup is not None:
+                cleanup.unlink(missing_ok=True)
+            print(f"[TRANSCODE] Cache hit {key}")
+            return file_response(cached, range_header, audio_media_type(key), headers)
+
+        encoding = self._encodings.get(key)
+        if encoding is None:
+            print(f"[TRANSCODE] Encoding {source} -> {fmt} {bitrate}")
+            encoding = self._encodings[key] = _Encoding()
+            encoding.task = asyncio.create_task(self._encode(source, fmt, bitrate, key, cleanup, encoding))
+        elif cleanup is not None:
+            # La misma rendition ya se está codificando para otro request
+            cleanup.unlink(missing_ok=True)
+        return StreamingResponse(
+            encoding.stream(),
+            media_type=audio_media_type(key),
+            headers={**AUDIO_HEADERS, **headers, "Accept-Ranges": "none"}
+        )
+
+# Global instance
+transcoder = Transcoder()
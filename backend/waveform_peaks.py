@@ -0,0 +1,159 @@
+"""
+Waveform Peaks - Pirámide de picos (min/max) por stem para dibujar la forma de onda sin descargar el audio
+"""
+
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Resolución base, número de niveles y bits (configurables por entorno)
+PEAKS_ENABLED = os.getenv("PEAKS_ENABLED", "true").lower() == "true"
+PEAKS_BASE_SAMPLES_PER_PIXEL = int(os.getenv("PEAKS_BASE_SAMPLES_PER_PIXEL", "256"))
+PEAKS_LEVELS = int(os.getenv("PEAKS_LEVELS", "6"))
+PEAKS_BITS = int(os.getenv("PEAKS_BITS", "8"))
+
+# Bloques que se leen al calcular los picos desde un archivo (en píxeles de la resolución base)
+PEAKS_READ_BLOCK_PIXELS = 4096
+
+# Cabecera del formato .dat de audiowaveform (v1): version, flags, sample_rate, samples_per_pixel, length
+DAT_HEADER = struct.Struct("<iIiiI")
+
+
+def _block_min_max(samples: np.ndarray, samples_per_pixel: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Min/max por píxel de ``(canales, n)`` mezclando canales (el último píxel puede ser parcial)"""
+    channels, frames = samples.shape
+    full = frames // samples_per_pixel * samples_per_pixel
+    bins = samples[:, :full].reshape(channels, -1, samples_per_pixel)
+    mins, maxs = bins.min(axis=(0, 2)), bins.max(axis=(0, 2))
+    if full < frames:
+        rest = samples[:, full:]
+        mins = np.append(mins, rest.min())
+        maxs = np.append(maxs, rest.max())
+    return mins, maxs
+
+
+def _as_channels(samples: np.ndarray) -> np.ndarray:
+    samples = np.asarray(samples, dtype=np.float32)
+    return samples[None, :] if samples.ndim == 1 else samples
+
+
+class WaveformPeaks:
+    """Picos de cada stem en formato .dat de audiowaveform, un archivo por nivel de zoom.
+
+    El nivel base (``base_samples_per_pixel``) se calcula una vez sobre las
+    muestras y cada nivel siguiente agrupa de a dos píxeles del anterior, así que
+    la pirámide completa cuesta poco más que el nivel base. Los archivos viven
+    junto al stem (``peaks/{stem}-{samples_per_pixel}.dat``) y se borran con el
+    workspace de la tarea.
+    """
+
+    def __init__(self, base_samples_per_pixel: int = PEAKS_BASE_SAMPLES_PER_PIXEL,
+                 levels: int = PEAKS_LEVELS, bits: int = PEAKS_BITS, enabled: bool = PEAKS_ENABLED):
+        if bits not in (8, 16):
+            raise ValueError(f"PEAKS_BITS must be 8 or 16, got {bits}")
+        self.base_samples_per_pixel = base_samples_per_pixel
+        self.levels = max(1, levels)
+        self.bits = bits
+        self.enabled = enabled
+
+    @property
+    def resolutions(self) -> List[int]:
+        """Samples por píxel de cada nivel, del más detallado al más compacto"""
+        return [self.base_samples_per_pixel * 2 ** level for level in range(self.levels)]
+
+    def path_for(self, stem_path, samples_per_pixel: int) -> Path:
+        stem_path = Path(stem_path)
+        return stem_path.parent / "peaks" / f"{stem_path.stem}-{samples_per_pixel}.dat"
+
+    def exists(self, stem_path) -> bool:
+        return all(self.path_for(stem_path, spp).is_file() for spp in self.resolutions)
+
+    def _pyramid(self, mins: np.ndarray, maxs: np.ndarray):
+        for samples_per_pixel in self.resolutions:
+            yield samples_per_pixel, mins, maxs
+            if len(mins) % 2:
+                mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+            mins = mins.reshape(-1, 2).min(axis=1)
+            maxs = maxs.reshape(-1, 2).max(axis=1)
+
+    def _encode(self, mins: np.ndarray, maxs: np.ndarray, sample_rate: int, samples_per_pixel: int) -> bytes:
+        scale, dtype = (127, "<i1") if self.bits == 8 else (32767, "<i2")
+        pairs = np.empty(len(mins) * 2, dtype=np.float32)
+        pairs[0::2], pairs[1::2] = mins, maxs
+        data = np.clip(np.round(pairs * scale), -scale - 1, scale).astype(dtype)
+        flags = 1 if self.bits == 8 else 0
+        header = DAT_HEADER.pack(1, flags, int(sample_rate), samples_per_pixel, len(mins))
+        return header + data.tobytes()
+
+    def _write_pyramid(self, mins: np.ndarray, maxs: np.ndarray, sample_rate: int, stem_path) -> List[Path]:
+        written = []
+        for samples_per_pixel, level_mins, level_maxs in self._pyramid(mins, maxs):
+            path = self.path_for(stem_path, samples_per_pixel)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Escritura atómica: /peaks puede estar leyendo el mismo nivel
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(self._encode(level_mins, level_maxs, sample_rate, samples_per_pixel))
+            os.replace(tmp_path, path)
+            written.append(path)
+        return written
+
+    def write(self, samples: np.ndarray, sample_rate: int, stem_path) -> List[Path]:
+        """Pirámide a partir de las muestras en memoria (``(n,)`` o ``(canales, n)``)"""
+        if not self.enabled:
+            return []
+        mins, maxs = _block_min_max(_as_channels(samples), self.base_samples_per_pixel)
+        return self._write_pyramid(mins, maxs, sample_rate, stem_path)
+
+    def ensure(self, stem_path) -> bool:
+        """Calcula la pirámide leyendo el archivo por bloques si todavía no existe"""
+        if not self.enabled:
+            return False
+        if self.exists(stem_path):
+            return True
+        import soundfile as sf
+
+        mins, maxs = [], []
+        block_frames = self.base_samples_per_pixel * PEAKS_READ_BLOCK_PIXELS
+        with sf.SoundFile(str(stem_path)) as audio:
+            sample_rate = audio.samplerate
+            for block in audio.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+                block_mins, block_maxs = _block_min_max(block.T, self.base_samples_per_pixel)
+                mins.append(block_mins)
+                maxs.append(block_maxs)
+        if not mins:
+            return False
+        self._write_pyramid(np.concatenate(mins), np.concatenate(maxs), sample_rate, stem_path)
+        return True
+
+    def level_for(self, stem_path, samples_per_pixel: int = 0) -> Optional[Path]:
+        """Nivel más compacto con al menos la resolución pedida (el más compacto si no se pide ninguna)"""
+        resolutions = self.resolutions
+        if samples_per_pixel > 0:
+            fitting = [spp for spp in resolutions if spp <= samples_per_pixel]
+            chosen = fitting[-1] if fitting else resolutions[0]
+        else:
+            chosen = resolutions[-1]
+        path = self.path_for(stem_path, chosen)
+        return path if path.is_file() else None
+
+    @staticmethod
+    def to_json(data: bytes) -> Dict:
+        """Formato JSON de audiowaveform (el que aceptan wavesurfer y peaks.js)"""
+        _, flags, sample_rate, samples_per_pixel, length = DAT_HEADER.unpack_from(data)
+        bits = 8 if flags & 1 else 16
+        values = np.frombuffer(data, dtype="<i1" if bits == 8 else "<i2", offset=DAT_HEADER.size)
+        return {
+            "version": 2,
+            "channels": 1,
+            "sample_rate": sample_rate,
+            "samples_per_pixel": samples_per_pixel,
+            "bits": bits,
+            "length": length,
+            "data": values.tolist()
+        }
+
+# Global instance
+waveform_peaks = WaveformPeaks()
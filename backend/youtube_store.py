@@ -0,0 +1,124 @@
+"""
+YouTube Store - Audio extraído de YouTube guardado en el servidor bajo un handle (el video_id)
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+# Directorio y tamaño máximo (configurables por entorno)
+YOUTUBE_CACHE_DIR = Path(os.getenv("YOUTUBE_CACHE_DIR", "youtube_cache"))
+YOUTUBE_CACHE_MAX_BYTES = int(os.getenv("YOUTUBE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+VIDEO_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{11}$")
+
+
+class YouTubeAudio(NamedTuple):
+    video_id: str
+    path: Path
+    title: str
+    size: int
+    content_hash: str
+
+
+def _sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class YouTubeAudioStore:
+    """Un directorio por video: ``{video_id}/audio.mp3`` + ``meta.json``.
+
+    El handle que se entrega al cliente es el propio ``video_id``, así que una
+    segunda extracción del mismo video sale directamente de disco. Las
+    extracciones concurrentes del mismo video se serializan con ``lock`` para
+    descargarlo una sola vez. LRU por mtime (se actualiza en cada uso).
+    """
+
+    def __init__(self, root: Path = YOUTUBE_CACHE_DIR, max_bytes: int = YOUTUBE_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # video_id -> porcentaje de las extracciones en curso
+        self.progress: Dict[str, float] = {}
+
+    @staticmethod
+    def valid_handle(video_id: str) -> bool:
+        return bool(VIDEO_ID_PATTERN.match(video_id or ""))
+
+    def lock(self, video_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(video_id, asyncio.Lock())
+
+    def _dir(self, video_id: str) -> Path:
+        return self.root / video_id
+
+    def get(self, video_id: str) -> Optional[YouTubeAudio]:
+        if not self.valid_handle(video_id):
+            return None
+        directory = self._dir(video_id)
+        try:
+            meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+            path = directory / "audio.mp3"
+            os.utime(directory)
+            return YouTubeAudio(video_id, path, meta["title"], path.stat().st_size, meta["content_hash"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def staging_path(self, video_id: str) -> Path:
+        """Archivo temporal donde descargar antes de ``commit``"""
+        directory = self._dir(video_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"audio.{os.getpid()}.{time.monotonic_ns()}.tmp"
+
+    def _commit(self, video_id: str, staged: Path, title: str) -> YouTubeAudio:
+        directory = self._dir(video_id)
+        content_hash = _sha256(staged)
+        os.replace(staged, directory / "audio.mp3")
+        # meta.json se escribe al final: sin él la entrada no existe
+        meta_tmp = directory / f"meta.{os.getpid()}.tmp"
+        meta_tmp.write_text(json.dumps({"title": title, "content_hash": content_hash,
+                                        "created_at": time.time()}), encoding="utf-8")
+        os.replace(meta_tmp, directory / "meta.json")
+        self.evict(keep=video_id)
+        return self.get(video_id)
+
+    async def commit(self, video_id: str, staged: Path, title: str) -> YouTubeAudio:
+        """Publica el archivo descargado (el hash se calcula en un hilo)"""
+        return await asyncio.to_thread(self._commit, video_id, staged, title)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Borra los videos menos usados mientras se supere ``max_bytes``"""
+        if not self.root.is_dir():
+            return 0
+        entries = []
+        for directory in self.root.iterdir():
+            if directory.is_dir():
+                size = sum(p.stat().st_size for p in directory.iterdir() if p.is_file())
+                entries.append((directory.stat().st_mtime, size, directory))
+        usage = sum(size for _, size, _ in entries)
+        reclaimed = 0
+        for _, size, directory in sorted(entries):
+            if usage <= self.max_bytes:
+                break
+            lock = self._locks.get(directory.name)
+            if directory.name == keep or (lock is not None and lock.locked()):
+                # Extracción en curso
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            usage -= size
+            reclaimed += size
+        if reclaimed:
+            print(f"[YOUTUBE CACHE] Evicted {reclaimed / 1024 ** 2:.1f} MB")
+        return reclaimed
+
+# Global instance
+youtube_store = YouTubeAudioStore()
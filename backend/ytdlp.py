@@ -0,0 +1,106 @@
+"""
+yt-dlp - Extracción de audio con asyncio: título y audio en una sola invocación, con progreso
+"""
+
+import os
+import re
+import asyncio
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional
+
+# Binario, extracciones simultáneas y timeout (configurables por entorno; YTDLP_BINARY
+# puede apuntar a un script falso para probar sin red)
+YTDLP_BINARY = os.getenv("YTDLP_BINARY", "yt-dlp")
+YTDLP_MAX_CONCURRENCY = int(os.getenv("YTDLP_MAX_CONCURRENCY", "2"))
+YTDLP_TIMEOUT_SECONDS = float(os.getenv("YTDLP_TIMEOUT_SECONDS", "150"))
+
+# Líneas que yt-dlp imprime gracias a --print (prefijos propios para no confundirlas con el log)
+TITLE_MARKER = "__YTDLP_TITLE__ "
+FILE_MARKER = "__YTDLP_FILE__ "
+PROGRESS_PATTERN = re.compile(r"^\[download\]\s+([\d.]+)%")
+
+
+class YtDlpError(Exception):
+    """yt-dlp terminó con error o superó el timeout"""
+
+
+class YtDlpResult(NamedTuple):
+    title: str
+    path: Path
+
+
+class YtDlp:
+    """Una invocación de yt-dlp por video con ``asyncio.create_subprocess_exec``.
+
+    El título y la ruta final se obtienen con ``--print`` en la misma ejecución
+    que descarga y convierte el audio, y las líneas ``[download] NN.N%`` se
+    pasan a ``on_progress``. Si la corrutina se cancela (o vence el timeout) el
+    proceso se mata.
+    """
+
+    def __init__(self, binary: str = YTDLP_BINARY, max_concurrency: int = YTDLP_MAX_CONCURRENCY,
+                 timeout: float = YTDLP_TIMEOUT_SECONDS):
+        self.binary = binary
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    def command(self, url: str, output_template: str, audio_format: str = "mp3") -> List[str]:
+        return [
+            self.binary,
+            "-x",  # Extract audio
+            "--audio-format", audio_format,
+            "--audio-quality", "0",  # Best quality
+            "--no-playlist",
+            "--newline",  # Progreso en líneas separadas
+            "--no-simulate",
+            "--print", f"before_dl:{TITLE_MARKER}%(title)s",
+            "--print", f"after_move:{FILE_MARKER}%(filepath)s",
+            "-o", output_template,
+            url
+        ]
+
+    async def _run(self, cmd: List[str], on_progress: Optional[Callable[[float], None]]) -> YtDlpResult:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        title, path = None, None
+        # stderr se lee en paralelo para que un log largo no bloquee el proceso
+        stderr_task = asyncio.create_task(process.stderr.read())
+        try:
+            while line := await process.stdout.readline():
+                text = line.decode(errors="ignore").strip()
+                if text.startswith(TITLE_MARKER):
+                    title = text[len(TITLE_MARKER):]
+                elif text.startswith(FILE_MARKER):
+                    path = Path(text[len(FILE_MARKER):])
+                elif on_progress and (match := PROGRESS_PATTERN.match(text)):
+                    on_progress(float(match.group(1)))
+            returncode = await process.wait()
+            stderr = (await stderr_task).decode(errors="ignore")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            if not stderr_task.done():
+                stderr_task.cancel()
+
+        if returncode != 0:
+            raise YtDlpError(stderr.strip()[-1000:] or f"yt-dlp exited with code {returncode}")
+        if path is None or not path.is_file():
+            raise YtDlpError("yt-dlp did not report an output file")
+        return YtDlpResult(title or path.stem, path)
+
+    async def extract_audio(self, url: str, output_template: str, audio_format: str = "mp3",
+                            on_progress: Optional[Callable[[float], None]] = None) -> YtDlpResult:
+        """Descarga y convierte el audio de ``url``; ``output_template`` usa la sintaxis de -o"""
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(
+                    self._run(self.command(url, output_template, audio_format), on_progress),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise YtDlpError(f"Timeout after {self.timeout:.0f}s")
+
+# Global instance
+ytdlp = YtDlp()